@@ -8,7 +8,7 @@ from django.utils.safestring import mark_safe
 from .admin_site import admin_site
 from .models import (
     Escritorio, Usuario, Cliente, Anotacao, Entrevista,
-    Processo, Andamento, Prazo, Audiencia,
+    Processo, Andamento, Prazo, Audiencia, CustaProcessual,
     Financeiro, ContratoHonorarios, ParcelaHonorarios,
     WhatsAppConfig, MensagemWhatsApp, FluxoChatbot, ConversaWhatsApp
 )
@@ -38,15 +38,18 @@ class EscritorioAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+    
     def total_usuarios(self, obj):
-        count = obj.usuarios.count()
-        return format_html('<strong>{}</strong>', count)
+        return format_html('<strong>{}</strong>', obj.total_usuarios)
     total_usuarios.short_description = 'Usuários'
+    total_usuarios.admin_order_field = 'qtd_usuarios'
     
     def total_clientes(self, obj):
-        count = obj.clientes.count()
-        return format_html('<strong>{}</strong>', count)
+        return format_html('<strong>{}</strong>', obj.total_clientes)
     total_clientes.short_description = 'Clientes'
+    total_clientes.admin_order_field = 'qtd_clientes'
 
 
 # ========== USUÁRIO ==========
@@ -189,6 +192,10 @@ class ClienteAdmin(admin.ModelAdmin):
         )
     tipo_badge.short_description = 'Tipo'
     
+    def get_queryset(self, request):
+        # total_processos/processos_ativos sem um COUNT por linha
+        return super().get_queryset(request).with_stats()
+    
     def ativo_badge(self, obj):
         color = 'success' if obj.ativo else 'danger'
         texto = 'Ativo' if obj.ativo else 'Inativo'
@@ -238,6 +245,12 @@ class EntrevistaAdmin(admin.ModelAdmin):
 
 
 # ========== PROCESSO ==========
+class CustaProcessualInline(admin.TabularInline):
+    model = CustaProcessual
+    extra = 0
+    fields = ['tipo', 'descricao', 'valor', 'data', 'pago', 'data_pagamento', 'reembolsavel']
+
+
 @admin.register(Processo)
 class ProcessoAdmin(admin.ModelAdmin):
     list_display = [
@@ -251,6 +264,7 @@ class ProcessoAdmin(admin.ModelAdmin):
         'dias_ate_proxima_audiencia', 'total_custas'
     ]
     date_hierarchy = 'data_distribuicao'
+    inlines = [CustaProcessualInline]
     
     fieldsets = (
         ('Informações Básicas', {
@@ -297,6 +311,10 @@ class ProcessoAdmin(admin.ModelAdmin):
             obj.get_situacao_display()
         )
     situacao_badge.short_description = 'Situação'
+    
+    def get_queryset(self, request):
+        # dias_ate_proxima_audiencia/total_custas anotados na consulta
+        return super().get_queryset(request).with_stats()
 
 
 # ========== ANDAMENTO ==========
@@ -374,6 +392,17 @@ class AudienciaAdmin(admin.ModelAdmin):
     date_hierarchy = 'data'
 
 
+# ========== CUSTAS ==========
+@admin.register(CustaProcessual)
+class CustaProcessualAdmin(admin.ModelAdmin):
+    list_display = ['processo', 'tipo', 'valor', 'data', 'pago', 'reembolsavel']
+    list_filter = ['tipo', 'pago', 'reembolsavel', 'data']
+    search_fields = ['processo__numero_cnj', 'descricao']
+    readonly_fields = ['criado_em', 'criado_por', 'atualizado_em']
+    date_hierarchy = 'data'
+    list_select_related = ['processo__cliente']
+
+
 # ========== FINANCEIRO ==========
 @admin.register(Financeiro)
 class FinanceiroAdmin(admin.ModelAdmin):
@@ -385,7 +414,8 @@ class FinanceiroAdmin(admin.ModelAdmin):
     search_fields = ['descricao', 'cliente__nome', 'processo__numero_cnj']
     readonly_fields = [
         'criado_em', 'criado_por', 'atualizado_em', 'atualizado_por',
-        'valor_pendente', 'percentual_pago', 'esta_vencido', 'precisa_lembrete'
+        'valor_pendente', 'percentual_pago', 'esta_vencido', 'precisa_lembrete',
+        'serie_origem'
     ]
     date_hierarchy = 'data_vencimento'
     
@@ -406,7 +436,7 @@ class FinanceiroAdmin(admin.ModelAdmin):
             'fields': ('status', 'forma_pagamento', 'banco', 'agencia', 'conta', 'pix')
         }),
         ('Parcelamento', {
-            'fields': ('periodicidade', 'parcela_atual', 'total_parcelas'),
+            'fields': ('periodicidade', 'parcela_atual', 'total_parcelas', 'recorrencia_ate', 'serie_origem'),
             'classes': ('collapse',)
         }),
         ('Documentos', {
@@ -460,7 +490,10 @@ class ContratoHonorariosAdmin(admin.ModelAdmin):
     ]
     list_filter = ['tipo', 'forma_pagamento', 'assinado', 'ativo']
     search_fields = ['processo__numero_cnj', 'cliente__nome']
-    readonly_fields = ['criado_em', 'criado_por', 'atualizado_em', 'valor_parcela']
+    readonly_fields = [
+        'criado_em', 'criado_por', 'atualizado_em', 'valor_parcela',
+        'pdf_gerado', 'pdf_gerado_em'
+    ]
 
 
 @admin.register(ParcelaHonorarios)
@@ -540,6 +573,7 @@ admin_site.register(Processo, ProcessoAdmin)
 admin_site.register(Andamento, AndamentoAdmin)
 admin_site.register(Prazo, PrazoAdmin)
 admin_site.register(Audiencia, AudienciaAdmin)
+admin_site.register(CustaProcessual, CustaProcessualAdmin)
 admin_site.register(Financeiro, FinanceiroAdmin)
 admin_site.register(ContratoHonorarios, ContratoHonorariosAdmin)
 admin_site.register(ParcelaHonorarios, ParcelaHonorariosAdmin)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+WebSocket do painel WhatsApp (substitui o polling de conversas/mensagens)
+
+Cliente -> servidor (JSON):
+- {"acao": "abrir_conversa", "numero_contato": "..."}
+- {"acao": "fechar_conversa"}
+- {"acao": "ping"}
+
+Servidor -> cliente: {"evento": "...", "dados": {...}}
+(ver core.services.realtime)
+"""
+import logging
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import WhatsAppConfig
+from .services.realtime import grupo_config, grupo_conversa
+
+logger = logging.getLogger(__name__)
+
+
+class PainelWhatsAppConsumer(AsyncJsonWebsocketConsumer):
+    """Uma conexão por aba do painel: grupo da conta + grupo da conversa aberta"""
+
+    async def connect(self):
+        self.config_id = self.scope['url_route']['kwargs']['config_id']
+        self.grupo_conversa = None
+
+        usuario = self.scope.get('user')
+        if not usuario or not usuario.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        if not await self._pode_usar(usuario):
+            await self.close(code=4403)
+            return
+
+        self.grupo_config = grupo_config(self.config_id)
+        await self.channel_layer.group_add(self.grupo_config, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if getattr(self, 'grupo_config', None):
+            await self.channel_layer.group_discard(self.grupo_config, self.channel_name)
+        await self._sair_da_conversa()
+
+    async def receive_json(self, content, **kwargs):
+        acao = content.get('acao')
+
+        if acao == 'abrir_conversa' and content.get('numero_contato'):
+            await self._sair_da_conversa()
+            self.grupo_conversa = grupo_conversa(self.config_id, content['numero_contato'])
+            await self.channel_layer.group_add(self.grupo_conversa, self.channel_name)
+
+        elif acao == 'fechar_conversa':
+            await self._sair_da_conversa()
+
+        elif acao == 'ping':
+            await self.send_json({'evento': 'pong', 'dados': {}})
+
+    async def whatsapp_evento(self, event):
+        """Handler do tipo 'whatsapp.evento' enviado por core.services.realtime"""
+        await self.send_json({'evento': event['evento'], 'dados': event['dados']})
+
+    async def _sair_da_conversa(self):
+        if self.grupo_conversa:
+            await self.channel_layer.group_discard(self.grupo_conversa, self.channel_name)
+            self.grupo_conversa = None
+
+    @database_sync_to_async
+    def _pode_usar(self, usuario):
+        config = WhatsAppConfig.objects.filter(id=self.config_id, ativo=True).first()
+        return bool(config and config.pode_usar(usuario))
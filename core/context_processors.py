@@ -1,54 +1,50 @@
-from django.utils import timezone
-from datetime import date
-from .models import Processo, Cliente, Prazo, Audiencia, MensagemWhatsApp
+import logging
+
+from django.utils.functional import SimpleLazyObject
+
+from .services.dashboard import metricas_dashboard
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ['processos_count', 'clientes_count', 'prazos_hoje', 'mensagens_nao_lidas', 'proximas_audiencias']
+
+VAZIO = {
+    'processos_count': 0,
+    'clientes_count': 0,
+    'prazos_hoje': 0,
+    'mensagens_nao_lidas': 0,
+    'proximas_audiencias': [],
+}
+
 
 def dashboard_context(request):
+    """
+    Indicadores do escritório para os templates
+    
+    LAZY: nada é consultado até o template ler uma das variáveis; páginas
+    que não usam os indicadores (admin, Kanban, painel WhatsApp) não pagam
+    nada. Na primeira leitura vem tudo de uma vez (cache ou uma consulta).
+    """
     if not request.user.is_authenticated:
         return {}
     
-    context = {}
+    escritorio_id = getattr(request.user, 'escritorio_id', None)
+    if not escritorio_id:
+        return {}
+    
+    carregadas = {}
     
-    try:
-        # Se o usuário tem escritório
-        escritorio = request.user.escritorio
-        
-        # Estatísticas
-        context['processos_count'] = Processo.objects.filter(
-            escritorio=escritorio,
-            situacao='ativo'
-        ).count()
-        
-        context['clientes_count'] = Cliente.objects.filter(
-            escritorio=escritorio,
-            ativo=True
-        ).count()
-        
-        # Prazos que vencem hoje
-        hoje = date.today()
-        context['prazos_hoje'] = Prazo.objects.filter(
-            processo__escritorio=escritorio,
-            data_limite=hoje,
-            status='pendente'
-        ).count()
-        
-        # Mensagens não lidas do WhatsApp
-        context['mensagens_nao_lidas'] = MensagemWhatsApp.objects.filter(
-            whatsapp_config__escritorio=escritorio,
-            lida=False,
-            direcao='entrada'
-        ).count()
-        
-        # Próximas audiências (próximos 7 dias)
-        semana = hoje + timezone.timedelta(days=7)
-        context['proximas_audiencias'] = Audiencia.objects.filter(
-            processo__escritorio=escritorio,
-            data__gte=hoje,
-            data__lte=semana,
-            status__in=['agendada', 'confirmada']
-        ).order_by('data', 'hora')[:5]
-        
-    except Exception as e:
-        # Em caso de erro, retorna contexto vazio
-        print(f"Erro no dashboard_context: {e}")
+    def metricas():
+        if not carregadas:
+            try:
+                carregadas.update(metricas_dashboard(escritorio_id))
+            except Exception as e:
+                # Indicadores nunca derrubam a página
+                logger.error(f'Erro no dashboard_context: {e}')
+                carregadas.update(VAZIO)
+        return carregadas
     
-    return context
\ No newline at end of file
+    return {
+        campo: SimpleLazyObject(lambda campo=campo: metricas()[campo])
+        for campo in CAMPOS
+    }
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from django_filters import rest_framework as filters
-from django.db.models import Q
+from rest_framework.filters import SearchFilter
 from .models import (
     Cliente, Processo, Prazo, Audiencia, Financeiro,
     MensagemWhatsApp, ConversaWhatsApp
@@ -11,7 +11,7 @@ class ClienteFilter(filters.FilterSet):
     """Filtros avançados para Cliente"""
     
     nome = filters.CharFilter(lookup_expr='icontains')
-    cpf_cnpj = filters.CharFilter(lookup_expr='icontains')
+    cpf_cnpj = filters.CharFilter(method='filter_cpf_cnpj')
     cidade = filters.CharFilter(lookup_expr='icontains')
     # Filtro por data de cadastro
     criado_antes = filters.DateFilter(field_name='criado_em', lookup_expr='lte')
@@ -24,6 +24,13 @@ class ClienteFilter(filters.FilterSet):
         model = Cliente
         fields = ['tipo', 'ativo', 'estado', 'cliente_preferencial']
     
+    def filter_cpf_cnpj(self, queryset, name, value):
+        # Prefixo dos dígitos (índice cliente_documento_prefixo), com ou sem máscara
+        digitos = ''.join(filter(str.isdigit, value))
+        if not digitos:
+            return queryset.filter(cpf_cnpj__icontains=value)
+        return queryset.filter(cpf_cnpj_digitos__startswith=digitos)
+    
     def filter_idade_min(self, queryset, name, value):
         # Calcula data de nascimento máxima para idade mínima
         from datetime import date
@@ -64,14 +71,18 @@ class ProcessoFilter(filters.FilterSet):
         fields = ['tipo', 'situacao', 'cliente', 'advogado_responsavel', 'tribunal']
     
     def filter_busca_geral(self, queryset, name, value):
-        """Busca em número CNJ, cliente, objeto"""
-        return queryset.filter(
-            Q(numero_cnj__icontains=value) |
-            Q(cliente__nome__icontains=value) |
-            Q(objeto__icontains=value) |
-            Q(polo_ativo__icontains=value) |
-            Q(polo_passivo__icontains=value)
-        )
+        """Busca em número CNJ, cliente, partes e objeto (índice de texto, por relevância)"""
+        return queryset.buscar(value)
+
+
+class BuscaTextualFilter(SearchFilter):
+    """?search= pelo índice de texto do model (queryset.buscar), sem icontains"""
+    
+    def filter_queryset(self, request, queryset, view):
+        termo = request.query_params.get(self.search_param, '').strip()
+        if not termo:
+            return queryset
+        return queryset.buscar(termo)
 
 
 class PrazoFilter(filters.FilterSet):
@@ -157,12 +168,7 @@ class FinanceiroFilter(filters.FilterSet):
     
     def filter_vencidos(self, queryset, name, value):
         if value:
-            from django.utils import timezone
-            hoje = timezone.now().date()
-            return queryset.filter(
-                data_vencimento__lt=hoje,
-                status__in=['pendente', 'parcial']
-            )
+            return queryset.vencidos()
         return queryset
     
     def filter_a_vencer(self, queryset, name, value):
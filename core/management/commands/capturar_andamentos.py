@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Captura andamentos agora (sem Celery) e mostra as métricas por tribunal
+
+Exemplos:
+    python manage.py capturar_andamentos --fonte core.services.andamentos.FonteFalsa
+    python manage.py capturar_andamentos --tribunal TJSP --tribunal TRT2
+    python manage.py capturar_andamentos --metricas
+    python manage.py capturar_andamentos --calcular-hashes
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Andamento
+from core.services.andamentos import (
+    capturar_tribunal,
+    hash_conteudo,
+    metricas_captura,
+    obter_fonte,
+    registrar_tribunais,
+    tribunais_ativos,
+)
+
+
+class Command(BaseCommand):
+    help = 'Captura andamentos dos processos ativos e mostra as métricas por tribunal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tribunal', action='append', help='Apenas este tribunal; pode repetir')
+        parser.add_argument('--fonte', help='Caminho da fonte (padrão: settings.ANDAMENTOS_FONTE)')
+        parser.add_argument('--metricas', action='store_true', help='Só mostra as métricas da última captura')
+        parser.add_argument('--calcular-hashes', action='store_true', help='Preenche hash_conteudo dos andamentos antigos')
+
+    def handle(self, *args, **options):
+        if options['calcular_hashes']:
+            return self.calcular_hashes()
+
+        if not options['metricas']:
+            fonte = obter_fonte(options['fonte'])
+            tribunais = options['tribunal'] or tribunais_ativos()
+            if not options['tribunal']:
+                registrar_tribunais(tribunais)
+            for tribunal in tribunais:
+                self.stdout.write(f'Capturando {tribunal}...')
+                capturar_tribunal(tribunal, fonte)
+
+        for metricas in metricas_captura():
+            if options['tribunal'] and metricas['tribunal'] not in options['tribunal']:
+                continue
+            estilo = self.style.WARNING if metricas['erros'] else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f"{metricas['tribunal']}: {metricas['processos']} processos em {metricas['duracao_s']}s "
+                f"({metricas['processos_por_s']}/s), {metricas['andamentos_novos']} novos, "
+                f"{metricas['erros']} erros ({metricas['taxa_erros']:.1%})"
+            ))
+            if metricas['ultimo_erro']:
+                self.stdout.write(f"    último erro: {metricas['ultimo_erro']}")
+
+    def calcular_hashes(self, lote=1000):
+        """Andamentos criados antes do hash: update em lotes, sem passar por save()"""
+        total = 0
+        while True:
+            andamentos = list(
+                Andamento.objects.filter(hash_conteudo='').only('pk', 'data', 'tipo', 'descricao')[:lote]
+            )
+            if not andamentos:
+                break
+            for andamento in andamentos:
+                andamento.hash_conteudo = hash_conteudo(andamento.data, andamento.tipo, andamento.descricao)
+            Andamento.objects.bulk_update(andamentos, ['hash_conteudo'])
+            total += len(andamentos)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} andamentos atualizados'))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Preenche cpf_cnpj_digitos dos clientes cadastrados antes do campo existir
+
+Cliente.save() mantém o campo daqui em diante; o comando faz o mesmo em
+SQL (regexp_replace), em lotes por faixa de pk, sem carregar os clientes.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, Func, Max, Value
+from django.db.models.functions import Left
+
+from core.models import Cliente
+from core.services.busca import instalar_extensoes
+
+
+class Command(BaseCommand):
+    help = 'Indexa CPF/CNPJ dos clientes para a busca por prefixo (cpf_cnpj_digitos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instalar', action='store_true', help='Cria as extensões unaccent e pg_trgm')
+        parser.add_argument('--lote', type=int, default=5000, help='Faixa de pks por UPDATE (padrão: 5000)')
+
+    def handle(self, *args, **options):
+        if options['instalar']:
+            instalar_extensoes(connection)
+
+        digitos = Left(Func(F('cpf_cnpj'), Value(r'\D'), Value(''), Value('g'), function='REGEXP_REPLACE'), 14)
+        maior_pk = Cliente.objects.aggregate(maior=Max('pk'))['maior'] or 0
+        total = 0
+        inicio = 0
+
+        while inicio < maior_pk:
+            fim = inicio + options['lote']
+            with transaction.atomic():
+                total += Cliente.objects.filter(
+                    pk__gt=inicio, pk__lte=fim
+                ).exclude(cpf_cnpj='').update(cpf_cnpj_digitos=digitos)
+            inicio = fim
+
+        self.stdout.write(self.style.SUCCESS(f'{total} clientes indexados'))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Preenche busca_vetor dos processos ainda não indexados
+
+O vetor é calculado pelo trigger do banco (core.services.busca): o comando
+só escreve NULL em busca_vetor, em lotes por faixa de pk, e o trigger
+recalcula cada linha. Rodar depois de criar a coluna ou de mudar os pesos.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core.models import Processo
+from core.services.busca import instalar_busca
+
+
+class Command(BaseCommand):
+    help = 'Indexa os processos para a busca textual (busca_vetor)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instalar', action='store_true', help='Recria extensão, funções e triggers antes de indexar')
+        parser.add_argument('--todos', action='store_true', help='Reindexa também os processos já indexados')
+        parser.add_argument('--lote', type=int, default=5000, help='Faixa de pks por UPDATE (padrão: 5000)')
+
+    def handle(self, *args, **options):
+        if options['instalar']:
+            instalar_busca(connection)
+
+        processos = Processo.objects.all()
+        if not options['todos']:
+            processos = processos.filter(busca_vetor__isnull=True)
+
+        maior_pk = Processo.objects.aggregate(maior=Max('pk'))['maior'] or 0
+        total = 0
+        inicio = 0
+
+        while inicio < maior_pk:
+            fim = inicio + options['lote']
+            # Um UPDATE curto por faixa: não segura a tabela inteira
+            with transaction.atomic():
+                total += processos.filter(pk__gt=inicio, pk__lte=fim).update(busca_vetor=None)
+            inicio = fim
+
+        self.stdout.write(self.style.SUCCESS(f'{total} processos indexados'))
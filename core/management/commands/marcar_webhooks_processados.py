@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Alinha o status dos WebhookEvent anteriores à fila de ingestão
+
+Eventos gravados antes do campo status existir ficaram com o padrão
+'pendente':
+- processed=True: foram processados; o comando os marca como 'processado'
+- processed=False: falharam no processamento antigo e nunca foram refeitos;
+  o comando os marca como 'descartado' para que a drenagem não reprocesse
+  mensagens de meses atrás (nem dispare respostas do chatbot)
+
+Rodar uma vez no deploy da fila, antes de subir os workers. --ate limita os
+descartados aos eventos recebidos até o momento informado (padrão: agora).
+As atualizações são feitas em lotes por faixa de pk.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import WebhookEvent
+
+
+class Command(BaseCommand):
+    help = 'Marca webhooks antigos como processados (processed=True) ou descartados (processed=False)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Faixa de pks por UPDATE (padrão: 5000)')
+        parser.add_argument(
+            '--ate',
+            help='Descarta só eventos não processados recebidos até esta data/hora ISO (padrão: agora)'
+        )
+
+    def handle(self, *args, **options):
+        ate = timezone.now()
+        if options['ate']:
+            ate = parse_datetime(options['ate'])
+            if ate is None:
+                raise CommandError('--ate deve ser uma data/hora ISO, ex.: 2024-03-01T12:00')
+            if timezone.is_naive(ate):
+                ate = timezone.make_aware(ate)
+
+        processados = self.atualizar(
+            WebhookEvent.objects.filter(processed=True).exclude(status='processado'),
+            options['lote'],
+            status='processado',
+            processado_em=F('created_at'),
+            proxima_tentativa_em=None,
+        )
+        # Nunca tentados pela fila (tentativas=0): falhas do processamento antigo
+        descartados = self.atualizar(
+            WebhookEvent.objects.filter(processed=False, status='pendente', tentativas=0, created_at__lte=ate),
+            options['lote'],
+            status='descartado',
+            ultimo_erro='Evento anterior à fila de ingestão; não reprocessado',
+            proxima_tentativa_em=None,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{processados} webhooks marcados como processados, {descartados} como descartados'
+        ))
+
+    def atualizar(self, legados, lote, **campos):
+        maior_pk = legados.aggregate(maior=Max('pk'))['maior'] or 0
+        total = 0
+        inicio = 0
+
+        while inicio < maior_pk:
+            fim = inicio + lote
+            with transaction.atomic():
+                total += legados.filter(pk__gt=inicio, pk__lte=fim).update(**campos)
+            inicio = fim
+
+        return total
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Recalcula os contadores de ConversaWhatsApp a partir das mensagens
+
+Os contadores são mantidos incrementalmente (F-expressions) na criação e
+leitura de mensagens; este comando corrige divergências causadas por
+edições manuais, deleções ou falhas no meio de uma atualização.
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import ConversaWhatsApp, MensagemWhatsApp
+from core.models.whatsapp import agregados_estatisticas_conversa
+
+
+class Command(BaseCommand):
+    help = 'Reconcilia contadores das conversas do WhatsApp com as mensagens armazenadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', type=int, help='Apenas conversas desta configuração de WhatsApp')
+        parser.add_argument('--lote', type=int, default=500, help='Conversas por lote (padrão: 500)')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas lista as divergências')
+
+    def handle(self, *args, **options):
+        agregados = agregados_estatisticas_conversa()
+        campos = list(agregados.keys())
+
+        conversas = ConversaWhatsApp.objects.order_by('pk')
+        if options['config']:
+            conversas = conversas.filter(whatsapp_config_id=options['config'])
+
+        verificadas = 0
+        corrigidas = 0
+        ultimo_pk = 0
+
+        while True:
+            lote = list(conversas.filter(pk__gt=ultimo_pk)[:options['lote']])
+            if not lote:
+                break
+            ultimo_pk = lote[-1].pk
+            verificadas += len(lote)
+
+            por_chave = {(c.whatsapp_config_id, c.numero_contato): c for c in lote}
+
+            # Um único GROUP BY por lote de conversas
+            estatisticas = MensagemWhatsApp.objects.filter(
+                whatsapp_config_id__in={c.whatsapp_config_id for c in lote},
+                numero_contato__in={c.numero_contato for c in lote}
+            ).order_by().values('whatsapp_config_id', 'numero_contato').annotate(**agregados)
+
+            reais = {(e['whatsapp_config_id'], e['numero_contato']): e for e in estatisticas}
+
+            divergentes = []
+            for chave, conversa in por_chave.items():
+                esperado = reais.get(chave) or {
+                    'total_mensagens': 0,
+                    'mensagens_nao_lidas': 0,
+                    'primeira_mensagem': None,
+                    'ultima_mensagem': None,
+                    'ultima_mensagem_saida': None,
+                }
+
+                diferencas = {
+                    campo: (getattr(conversa, campo), esperado[campo])
+                    for campo in campos
+                    if getattr(conversa, campo) != esperado[campo]
+                }
+                if not diferencas:
+                    continue
+
+                if options['verbosity'] > 1 or options['dry_run']:
+                    self.stdout.write(f'{conversa}: {diferencas}')
+
+                for campo in campos:
+                    setattr(conversa, campo, esperado[campo])
+                divergentes.append(conversa)
+
+            if divergentes and not options['dry_run']:
+                ConversaWhatsApp.objects.bulk_update(divergentes, campos)
+            corrigidas += len(divergentes)
+
+        acao = 'divergentes' if options['dry_run'] else 'corrigidas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verificadas} conversas verificadas, {corrigidas} {acao}'
+        ))
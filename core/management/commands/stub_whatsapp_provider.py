@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Provider de WhatsApp falso para testar o envio localmente
+
+Aceita POST em qualquer caminho (formatos Evolution, API oficial e genérico),
+responde com um ID de mensagem e, com --callback, devolve os status
+'entregue' e 'lido' para o webhook do LegalFlow como um provider real.
+
+Exemplo:
+    python manage.py stub_whatsapp_provider --porta 8099 \\
+        --callback http://localhost:8000/whatsapp/webhook/1/ --falhas 0.2
+
+Depois aponte WhatsAppConfig.api_url para http://localhost:8099
+(provider 'outro' usa o formato genérico).
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+logger = logging.getLogger(__name__)
+
+
+def criar_servidor(porta=0, latencia=0.0, falhas=0.0, limite=0.0, callback=None, registrar=None, host='0.0.0.0'):
+    """
+    ThreadingHTTPServer do provider falso (porta 0: uma porta livre)
+
+    Usado pelo comando e pelos testes de envio (core.tests.test_whatsapp_envio);
+    registrar(caminho, corpo, message_id) é chamado a cada mensagem aceita.
+    """
+    envios = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            tamanho = int(self.headers.get('Content-Length') or 0)
+            try:
+                corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+            except ValueError:
+                return self._responder(400, {'erro': 'JSON inválido'})
+
+            time.sleep(latencia)
+
+            if limite:
+                agora = time.monotonic()
+                with lock:
+                    envios[:] = [t for t in envios if agora - t < 1]
+                    excedeu = len(envios) >= limite
+                    if not excedeu:
+                        envios.append(agora)
+                if excedeu:
+                    return self._responder(429, {'erro': 'rate limit'}, {'Retry-After': '1'})
+
+            if random.random() < falhas:
+                return self._responder(503, {'erro': 'indisponível'})
+
+            numero = corpo.get('number') or corpo.get('to')
+            if not numero:
+                return self._responder(400, {'erro': 'destinatário ausente'})
+
+            message_id = uuid.uuid4().hex
+            if registrar:
+                registrar(self.path, corpo, message_id)
+
+            if callback:
+                threading.Thread(
+                    target=enviar_callbacks,
+                    args=(callback, message_id, numero),
+                    daemon=True
+                ).start()
+
+            # Um ID em cada formato conhecido
+            self._responder(200, {
+                'id': message_id,
+                'key': {'id': message_id},
+                'messages': [{'id': message_id}],
+            })
+
+        def _responder(self, status, dados, cabecalhos=None):
+            conteudo = json.dumps(dados).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(conteudo)))
+            for chave, valor in (cabecalhos or {}).items():
+                self.send_header(chave, valor)
+            self.end_headers()
+            self.wfile.write(conteudo)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, porta), Handler)
+
+
+def enviar_callbacks(url, message_id, numero):
+    """Simula o provider confirmando entrega e leitura"""
+    for status in ('delivered', 'read'):
+        time.sleep(1)
+        try:
+            requests.post(url, json={
+                'type': 'status',
+                'message_id': message_id,
+                'status': status,
+                'from': numero,
+            }, timeout=5)
+        except requests.RequestException as e:
+            logger.warning(f'Callback {status} falhou: {str(e)}')
+
+
+class Command(BaseCommand):
+    help = 'Sobe um provider de WhatsApp falso para testes de envio'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--porta', type=int, default=8099)
+        parser.add_argument('--latencia', type=float, default=0.05, help='Segundos por requisição (padrão: 0.05)')
+        parser.add_argument('--falhas', type=float, default=0.0, help='Fração de respostas 503 (0 a 1)')
+        parser.add_argument('--limite', type=float, default=0.0, help='Responde 429 acima de N mensagens/segundo (0 = sem limite)')
+        parser.add_argument('--callback', help='URL do webhook para enviar os status de entrega/leitura')
+
+    def handle(self, *args, **options):
+        servidor = criar_servidor(
+            porta=options['porta'],
+            latencia=options['latencia'],
+            falhas=options['falhas'],
+            limite=options['limite'],
+            callback=options['callback'],
+            registrar=lambda caminho, corpo, message_id: self.stdout.write(
+                f"{caminho} -> {corpo.get('number') or corpo.get('to')}: {message_id}"
+            ),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Provider falso ouvindo em http://localhost:{options['porta']}"))
+
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Vincula a clientes as mensagens e conversas do WhatsApp que ficaram sem cliente
+
+Útil depois de cadastrar clientes antigos ou de corrigir telefones: a busca
+usa o índice TelefoneCliente (um SELECT por número distinto, não por mensagem)
+e cada número recebe um único UPDATE.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Cliente, ConversaWhatsApp, MensagemWhatsApp, TelefoneCliente
+from core.services.telefones import (
+    invalidar_cache_telefones,
+    normalizar_telefone,
+    resolver_cliente,
+    sufixo_telefone,
+)
+
+
+class Command(BaseCommand):
+    help = 'Vincula mensagens e conversas do WhatsApp sem cliente usando os telefones normalizados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escritorio', type=int, help='Apenas este escritório')
+        parser.add_argument('--reindexar', action='store_true', help='Reconstrói TelefoneCliente antes de vincular')
+        parser.add_argument('--lote', type=int, default=1000, help='Clientes por lote na reindexação (padrão: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta o que seria vinculado')
+
+    def handle(self, *args, **options):
+        if options['reindexar']:
+            self.reindexar(options)
+
+        mensagens = MensagemWhatsApp.objects.filter(cliente__isnull=True, direcao='entrada')
+        if options['escritorio']:
+            mensagens = mensagens.filter(whatsapp_config__escritorio_id=options['escritorio'])
+
+        # Um par (escritório, número) por vez, não uma mensagem por vez
+        pares = mensagens.order_by().values_list(
+            'whatsapp_config__escritorio_id', 'numero_contato'
+        ).distinct()
+
+        numeros = 0
+        vinculadas = 0
+
+        for escritorio_id, numero_contato in pares.iterator():
+            cliente_id = resolver_cliente(escritorio_id, numero_contato)
+            if not cliente_id:
+                continue
+            numeros += 1
+
+            filtro = {
+                'whatsapp_config__escritorio_id': escritorio_id,
+                'numero_contato': numero_contato,
+                'cliente__isnull': True,
+            }
+
+            if options['dry_run']:
+                vinculadas += MensagemWhatsApp.objects.filter(direcao='entrada', **filtro).count()
+                continue
+
+            with transaction.atomic():
+                vinculadas += MensagemWhatsApp.objects.filter(direcao='entrada', **filtro).update(
+                    cliente_id=cliente_id
+                )
+                ConversaWhatsApp.objects.filter(**filtro).update(cliente_id=cliente_id)
+
+        acao = 'seriam vinculadas' if options['dry_run'] else 'vinculadas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{numeros} números reconhecidos, {vinculadas} mensagens {acao}'
+        ))
+
+    def reindexar(self, options):
+        """Reconstrói TelefoneCliente em lotes (não passa por Cliente.save())"""
+        clientes = Cliente.objects.order_by('pk')
+        if options['escritorio']:
+            clientes = clientes.filter(escritorio_id=options['escritorio'])
+
+        total = 0
+        ultimo_pk = 0
+
+        while True:
+            lote = list(
+                clientes.filter(pk__gt=ultimo_pk).values('pk', 'escritorio_id', *TelefoneCliente.ORIGENS)[:options['lote']]
+            )
+            if not lote:
+                break
+            ultimo_pk = lote[-1]['pk']
+
+            telefones = []
+            for cliente in lote:
+                for origem in TelefoneCliente.ORIGENS:
+                    numero = normalizar_telefone(cliente[origem])
+                    if sufixo_telefone(numero):
+                        telefones.append(TelefoneCliente(
+                            cliente_id=cliente['pk'],
+                            escritorio_id=cliente['escritorio_id'],
+                            origem=origem,
+                            numero=numero,
+                            sufixo=sufixo_telefone(numero),
+                        ))
+
+            if not options['dry_run']:
+                with transaction.atomic():
+                    TelefoneCliente.objects.filter(cliente_id__in=[c['pk'] for c in lote]).delete()
+                    TelefoneCliente.objects.bulk_create(telefones)
+            total += len(telefones)
+
+        invalidar_cache_telefones()
+        self.stdout.write(f'{total} telefones indexados')
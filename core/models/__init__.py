@@ -4,10 +4,10 @@
 from .usuario import Escritorio, Usuario
 
 # Cliente
-from .cliente import Cliente, Entrevista
+from .cliente import Cliente, TelefoneCliente, Entrevista
 
 # Processo
-from .processo import Processo, Andamento, Prazo, Audiencia
+from .processo import Processo, Andamento, Prazo, Audiencia, CustaProcessual
 
 # Financeiro
 from .financeiro import Financeiro, ContratoHonorarios, ParcelaHonorarios
@@ -20,10 +20,17 @@ from .whatsapp import (
     WhatsAppConfig, 
     MensagemWhatsApp, 
     FluxoChatbot, 
+    SessaoChatbot,
     ConversaWhatsApp,
     WebhookEvent
 )
 
+# Métricas
+from .metricas import MetricasEscritorio
+
+# Exportações
+from .exportacao import Exportacao
+
 # Lista todos os models para facilitar imports
 __all__ = [
     # Usuario
@@ -32,6 +39,7 @@ __all__ = [
     
     # Cliente
     'Cliente',
+    'TelefoneCliente',
     'Entrevista',
     
     # Processo
@@ -39,6 +47,7 @@ __all__ = [
     'Andamento',
     'Prazo',
     'Audiencia',
+    'CustaProcessual',
     
     # Financeiro
     'Financeiro',
@@ -49,5 +58,12 @@ __all__ = [
     'WhatsAppConfig',
     'MensagemWhatsApp',
     'FluxoChatbot',
+    'SessaoChatbot',
     'ConversaWhatsApp',
+    
+    # Métricas
+    'MetricasEscritorio',
+    
+    # Exportações
+    'Exportacao',
 ]
\ No newline at end of file
@@ -1,6 +1,29 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
 from .usuario import Usuario, Escritorio
+from ..services.telefones import normalizar_telefone, sufixo_telefone, invalidar_cache_telefones
+
+
+class ClienteQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Anota qtd_processos e qtd_processos_ativos (um JOIN + GROUP BY, sem COUNT por cliente)"""
+        return self.annotate(
+            qtd_processos=models.Count('processos'),
+            qtd_processos_ativos=models.Count('processos', filter=models.Q(processos__situacao='ativo')),
+        )
+    
+    def buscar(self, termo):
+        """
+        Busca por nome, nome social, e-mail, CPF/CNPJ ou telefone
+        
+        Números vão por prefixo (cpf_cnpj_digitos, TelefoneCliente); texto
+        pelos índices trigram; ver core.services.busca.filtrar_clientes.
+        """
+        from ..services.busca import filtrar_clientes
+        
+        return filtrar_clientes(self, termo)
 
 
 class Cliente(models.Model):
@@ -34,6 +57,8 @@ class Cliente(models.Model):
     
     # Documentos
     cpf_cnpj = models.CharField(_('CPF/CNPJ'), max_length=18, blank=True)
+    # Só os dígitos de cpf_cnpj, mantido por save(): busca por prefixo indexada
+    cpf_cnpj_digitos = models.CharField(max_length=14, blank=True, editable=False)
     rg = models.CharField(_('RG'), max_length=20, blank=True)
     orgao_emissor = models.CharField(_('Órgão Emissor'), max_length=50, blank=True)
     data_emissao_rg = models.DateField(_('Data de Emissão RG'), null=True, blank=True)
@@ -126,6 +151,8 @@ class Cliente(models.Model):
         blank=True
     )
     
+    objects = ClienteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Cliente')
         verbose_name_plural = _('Clientes')
@@ -135,6 +162,16 @@ class Cliente(models.Model):
             models.Index(fields=['cpf_cnpj']),
             models.Index(fields=['tipo', 'ativo']),
             models.Index(fields=['ativo', 'cliente_preferencial']),
+            # Prefixo de CPF/CNPJ (LIKE '123%') dentro do escritório
+            models.Index(
+                fields=['escritorio', 'cpf_cnpj_digitos'],
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+                name='cliente_documento_prefixo',
+            ),
+            # pg_trgm sobre UPPER(): serve à similaridade e aos icontains do Django
+            GinIndex(OpClass(Upper('nome'), name='gin_trgm_ops'), name='cliente_nome_trgm'),
+            GinIndex(OpClass(Upper('nome_social'), name='gin_trgm_ops'), name='cliente_nome_social_trgm'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='cliente_email_trgm'),
         ]
     
     def __str__(self):
@@ -149,7 +186,51 @@ class Cliente(models.Model):
             elif len(cpf_cnpj) == 14:  # CNPJ
                 self.cpf_cnpj = f'{cpf_cnpj[:2]}.{cpf_cnpj[2:5]}.{cpf_cnpj[5:8]}/{cpf_cnpj[8:12]}-{cpf_cnpj[12:]}'
         
+        self.cpf_cnpj_digitos = ''.join(filter(str.isdigit, self.cpf_cnpj))[:14]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'cpf_cnpj' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'cpf_cnpj_digitos'}
+        
         super().save(*args, **kwargs)
+        
+        self.sincronizar_telefones()
+    
+    def sincronizar_telefones(self):
+        """
+        Mantém TelefoneCliente igual aos campos de telefone do cliente
+        
+        Só escreve quando algum número mudou (um SELECT no caso comum).
+        """
+        desejados = {}
+        for origem in TelefoneCliente.ORIGENS:
+            numero = normalizar_telefone(getattr(self, origem))
+            if sufixo_telefone(numero):
+                desejados[origem] = numero
+        
+        # Escritório entra na comparação: o cliente pode ter sido transferido
+        atuais = {
+            origem: (numero, escritorio_id)
+            for origem, numero, escritorio_id in TelefoneCliente.objects.filter(
+                cliente=self
+            ).values_list('origem', 'numero', 'escritorio_id')
+        }
+        if atuais == {origem: (numero, self.escritorio_id) for origem, numero in desejados.items()}:
+            return
+        
+        TelefoneCliente.objects.filter(cliente=self).delete()
+        TelefoneCliente.objects.bulk_create([
+            TelefoneCliente(
+                cliente=self,
+                escritorio_id=self.escritorio_id,
+                origem=origem,
+                numero=numero,
+                sufixo=sufixo_telefone(numero),
+            )
+            for origem, numero in desejados.items()
+        ])
+        
+        for escritorio_id in {e for _, e in atuais.values()} | {self.escritorio_id}:
+            invalidar_cache_telefones(escritorio_id)
     
     @property
     def idade(self):
@@ -161,12 +242,17 @@ class Cliente(models.Model):
             return age
         return None
     
+    # Usam as anotações de with_stats() quando presentes; senão, um COUNT cada
     @property
     def total_processos(self):
+        if hasattr(self, 'qtd_processos'):
+            return self.qtd_processos
         return self.processos.count()
     
     @property
     def processos_ativos(self):
+        if hasattr(self, 'qtd_processos_ativos'):
+            return self.qtd_processos_ativos
         return self.processos.filter(situacao='ativo').count()
     
     @property
@@ -179,6 +265,52 @@ class Cliente(models.Model):
             contatos.append(self.celular)
         return contatos
 
+
+class TelefoneCliente(models.Model):
+    """
+    Telefones normalizados do cliente (índice para vincular mensagens do WhatsApp)
+    
+    Mantido por Cliente.save(); não editar manualmente.
+    Reconstrução: manage.py vincular_mensagens_clientes --reindexar
+    """
+    
+    # Campos de Cliente indexados
+    ORIGENS = ['telefone', 'celular']
+    
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.CASCADE,
+        related_name='telefones_normalizados'
+    )
+    escritorio = models.ForeignKey(
+        Escritorio,
+        on_delete=models.CASCADE,
+        related_name='telefones_clientes'
+    )
+    origem = models.CharField(_('Origem'), max_length=20, choices=[(o, o) for o in ORIGENS])
+    numero = models.CharField(_('Número (só dígitos)'), max_length=20)
+    sufixo = models.CharField(_('Últimos 8 dígitos'), max_length=8)
+    
+    class Meta:
+        verbose_name = _('Telefone do Cliente')
+        verbose_name_plural = _('Telefones dos Clientes')
+        constraints = [
+            models.UniqueConstraint(fields=['cliente', 'origem'], name='telefone_cliente_origem_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['escritorio', 'sufixo']),
+            # Prefixo do número (autocomplete de clientes)
+            models.Index(
+                fields=['escritorio', 'numero'],
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+                name='telefone_cliente_prefixo',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.numero} ({self.cliente_id})"
+
+
 class Entrevista(models.Model):
     """Entrevistas/Atendimentos com clientes"""
     
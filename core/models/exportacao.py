@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from django.db import models
+from .usuario import Usuario, Escritorio
+
+
+class Exportacao(models.Model):
+    """
+    Exportação (CSV/XLSX) gerada em segundo plano
+    
+    Criada pela action 'exportar' com ?assincrono=1; a task
+    core.tasks.gerar_exportacao refaz a consulta com os mesmos parâmetros
+    e grava o arquivo.
+    """
+    
+    RECURSO_CHOICES = [
+        ('clientes', 'Clientes'),
+        ('processos', 'Processos'),
+        ('financeiro', 'Financeiro'),
+    ]
+    
+    FORMATO_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+    
+    escritorio = models.ForeignKey(Escritorio, on_delete=models.CASCADE, related_name='exportacoes')
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='exportacoes')
+    recurso = models.CharField('Recurso', max_length=20, choices=RECURSO_CHOICES)
+    formato = models.CharField('Formato', max_length=5, choices=FORMATO_CHOICES, default='csv')
+    # Query string da listagem: {"status": ["pendente"], "search": ["..."]}
+    parametros = models.JSONField('Parâmetros', default=dict, blank=True)
+    
+    status = models.CharField('Status', max_length=15, choices=STATUS_CHOICES, default='pendente')
+    arquivo = models.FileField('Arquivo', upload_to='exportacoes/%Y/%m/', null=True, blank=True)
+    total_linhas = models.IntegerField('Total de Linhas', default=0)
+    erro = models.TextField('Erro', blank=True)
+    
+    criado_em = models.DateTimeField('Criado em', auto_now_add=True)
+    concluido_em = models.DateTimeField('Concluído em', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Exportação'
+        verbose_name_plural = 'Exportações'
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['usuario', '-criado_em']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_recurso_display()} ({self.formato}) - {self.get_status_display()}"
@@ -4,6 +4,27 @@ from .cliente import Cliente
 from .processo import Processo
 from decimal import Decimal
 
+
+class FinanceiroQuerySet(models.QuerySet):
+    # Status de quem ainda tem valor a pagar/receber
+    STATUS_EM_ABERTO = ['pendente', 'parcial']
+
+    def em_aberto(self):
+        return self.filter(status__in=self.STATUS_EM_ABERTO)
+
+    def vencidos(self, hoje=None):
+        """
+        Lançamentos vencidos: os já marcados pela varredura diária mais os em
+        aberto que venceram desde então (cada lado usa um índice parcial)
+        """
+        from django.utils import timezone
+        hoje = hoje or timezone.localdate()
+        return self.filter(
+            models.Q(status='vencido') |
+            models.Q(status__in=self.STATUS_EM_ABERTO, data_vencimento__lt=hoje)
+        )
+
+
 class Financeiro(models.Model):
     """Sistema financeiro completo para escritório jurídico"""
     
@@ -124,6 +145,18 @@ class Financeiro(models.Model):
     # Controle
     parcela_atual = models.IntegerField('Parcela Atual', default=1)
     total_parcelas = models.IntegerField('Total de Parcelas', default=1)
+    serie_origem = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ocorrencias',
+        verbose_name='Lançamento de Origem'
+    )
+    recorrencia_ate = models.DateField(
+        'Repetir até', null=True, blank=True,
+        help_text='Recorrências sem número de parcelas: data da última ocorrência (vazio = sem fim)'
+    )
     observacoes = models.TextField('Observações', blank=True)
     enviar_lembrete = models.BooleanField('Enviar Lembrete', default=True)
     dias_lembrete = models.IntegerField('Dias para Lembrete', default=3)
@@ -145,6 +178,8 @@ class Financeiro(models.Model):
         blank=True
     )
     
+    objects = FinanceiroQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Lançamento Financeiro'
         verbose_name_plural = 'Financeiro'
@@ -155,6 +190,24 @@ class Financeiro(models.Model):
             models.Index(fields=['processo', 'tipo']),
             models.Index(fields=['data_vencimento', 'status']),
             models.Index(fields=['categoria', 'status']),
+            models.Index(fields=['escritorio', 'data_vencimento']),
+            # Parciais: só as linhas em aberto/vencidas, uma fração da tabela
+            models.Index(
+                fields=['escritorio', 'data_vencimento'],
+                name='financeiro_em_aberto',
+                condition=models.Q(status__in=['pendente', 'parcial'])
+            ),
+            models.Index(
+                fields=['escritorio', 'data_vencimento'],
+                name='financeiro_vencidos',
+                condition=models.Q(status='vencido')
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['serie_origem', 'parcela_atual'],
+                name='financeiro_ocorrencia_unica'
+            ),
         ]
     
     def __str__(self):
@@ -169,11 +222,16 @@ class Financeiro(models.Model):
                 self.categoria = 'custas_judiciais'
         
         # Atualiza status baseado no pagamento
+        from django.utils import timezone
+        hoje = timezone.localdate()
         if self.valor_pago >= self.valor and self.valor > 0:
             self.status = 'pago'
             if not self.data_pagamento:
-                from django.utils import timezone
-                self.data_pagamento = timezone.now().date()
+                self.data_pagamento = hoje
+        elif self.status == 'vencido':
+            # Vencimento prorrogado: volta a ficar em aberto
+            if self.data_vencimento and self.data_vencimento >= hoje:
+                self.status = 'parcial' if self.valor_pago > 0 else 'pendente'
         elif self.valor_pago > 0:
             self.status = 'parcial'
         
@@ -201,9 +259,11 @@ class Financeiro(models.Model):
         from django.utils import timezone
         if self.data_vencimento is None:
             return False  # Ou True se fizer sentido no seu contexto, mas False é mais seguro pra itens novos
+        if self.status == 'vencido':
+            return True
         return (
-            self.status in ['pendente', 'parcial'] and 
-            self.data_vencimento < timezone.now().date()
+            self.status in FinanceiroQuerySet.STATUS_EM_ABERTO and 
+            self.data_vencimento < timezone.localdate()
         )
     
     @property
@@ -217,41 +277,9 @@ class Financeiro(models.Model):
         return 0 <= delta.days <= self.dias_lembrete
     
     def gerar_proxima_parcela(self):
-        """Gera próxima parcela para lançamentos parcelados"""
-        if self.parcela_atual < self.total_parcelas:
-            from datetime import timedelta
-            from django.utils import timezone
-            
-            # Calcula intervalo baseado na periodicidade
-            intervalos = {
-                'mensal': 30,
-                'bimestral': 60,
-                'trimestral': 90,
-                'semestral': 180,
-                'anual': 365,
-            }
-            
-            dias_intervalo = intervalos.get(self.periodicidade, 30)
-            nova_data = self.data_vencimento + timedelta(days=dias_intervalo)
-            
-            # Cria nova parcela
-            nova_parcela = Financeiro(
-                escritorio=self.escritorio,
-                cliente=self.cliente,
-                processo=self.processo,
-                tipo=self.tipo,
-                categoria=self.categoria,
-                descricao=f"{self.descricao} - Parcela {self.parcela_atual + 1}/{self.total_parcelas}",
-                valor=self.valor / self.total_parcelas,
-                data_vencimento=nova_data,
-                periodicidade=self.periodicidade,
-                parcela_atual=self.parcela_atual + 1,
-                total_parcelas=self.total_parcelas,
-                criado_por=self.criado_por,
-            )
-            nova_parcela.save()
-            return nova_parcela
-        return None
+        """Gera próxima ocorrência da série (regra em core.services.recorrencia)"""
+        from ..services.recorrencia import proxima_ocorrencia
+        return proxima_ocorrencia(self)
 
 
 class ContratoHonorarios(models.Model):
@@ -317,6 +345,16 @@ class ContratoHonorarios(models.Model):
         null=True, 
         blank=True
     )
+    # Gerado a partir das cláusulas e parcelas (core.services.contrato_pdf)
+    pdf_gerado = models.FileField(
+        'PDF Gerado',
+        upload_to='contratos_honorarios/gerados/',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    pdf_gerado_hash = models.CharField('Hash do PDF Gerado', max_length=64, blank=True, editable=False)
+    pdf_gerado_em = models.DateTimeField('PDF Gerado em', null=True, blank=True, editable=False)
     assinado = models.BooleanField('Contrato Assinado', default=False)
     data_assinatura = models.DateField('Data de Assinatura', null=True, blank=True)
     
@@ -344,56 +382,22 @@ class ContratoHonorarios(models.Model):
         return self.valor_total
     
     def gerar_parcelas(self):
-        """Gera parcelas do contrato"""
-        from datetime import date
-        from django.utils import timezone
-        
-        # Deleta parcelas existentes
-        self.parcelas.all().delete()
-        
-        # Cria novas parcelas
-        for i in range(self.numero_parcelas):
-            # Calcula data de vencimento
-            if i == 0:
-                data_vencimento = timezone.now().date()
-            else:
-                # Próximo mês
-                import calendar
-                ano_atual = timezone.now().year
-                mes_atual = timezone.now().month + i
-                
-                # Ajusta ano se passar de dezembro
-                while mes_atual > 12:
-                    mes_atual -= 12
-                    ano_atual += 1
-                
-                # Último dia do mês se o dia de vencimento for maior
-                ultimo_dia = calendar.monthrange(ano_atual, mes_atual)[1]
-                dia_vencimento = min(self.dia_vencimento, ultimo_dia)
-                
-                data_vencimento = date(ano_atual, mes_atual, dia_vencimento)
-            
-            # Cria parcela no financeiro
-            Financeiro.objects.create(
-                escritorio=self.processo.escritorio,
-                cliente=self.cliente,
-                processo=self.processo,
-                tipo='receita',
-                categoria='honorarios',
-                descricao=f"Honorários - Parcela {i+1}/{self.numero_parcelas}",
-                valor=self.valor_parcela,
-                data_vencimento=data_vencimento,
-                status='pendente',
-                periodicidade='mensal' if self.numero_parcelas > 1 else 'unica',
-                parcela_atual=i+1,
-                total_parcelas=self.numero_parcelas,
-                criado_por=self.criado_por,
-            )
+        """Gera (ou regenera) as parcelas do contrato e os lançamentos no financeiro"""
+        from ..services.parcelas import gerar_parcelas
+        return gerar_parcelas(self)
 
 
 class ParcelaHonorarios(models.Model):
     """Parcelas de honorários"""
     contrato = models.ForeignKey(ContratoHonorarios, on_delete=models.CASCADE, related_name='parcelas')
+    # Receita correspondente no financeiro (regenerar atualiza em vez de duplicar)
+    lancamento = models.OneToOneField(
+        Financeiro,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='parcela_honorarios'
+    )
     numero = models.IntegerField('Número da Parcela')
     valor = models.DecimalField('Valor', max_digits=12, decimal_places=2)
     data_vencimento = models.DateField('Data de Vencimento')
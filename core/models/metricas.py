@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from django.db import models
+from .usuario import Escritorio
+
+
+class MetricasEscritorio(models.Model):
+    """
+    Retrato materializado das estatísticas de um escritório
+    
+    Lido por EscritorioViewSet.estatisticas em vez de agregar as tabelas a
+    cada requisição. Escritas em Usuario, Cliente, Processo e Financeiro
+    marcam 'desatualizado' (core.signals) e a task
+    core.tasks.atualizar_metricas_escritorios recalcula só esses escritórios.
+    O recálculo é completo por escritório (não aplica deltas): bulk updates
+    e .update() que não disparam signals são corrigidos na próxima marcação.
+    """
+    
+    escritorio = models.OneToOneField(
+        Escritorio,
+        on_delete=models.CASCADE,
+        related_name='metricas'
+    )
+    
+    # Contagens
+    total_usuarios = models.IntegerField('Total de Usuários', default=0)
+    total_clientes = models.IntegerField('Total de Clientes', default=0)
+    total_processos = models.IntegerField('Total de Processos', default=0)
+    processos_ativos = models.IntegerField('Processos Ativos', default=0)
+    
+    # Rollups: {"civil": 10, ...} e {"AAAA-MM": {"receitas": "100.00", "despesas": "50.00"}}
+    processos_por_tipo = models.JSONField('Processos por Tipo', default=dict)
+    processos_por_situacao = models.JSONField('Processos por Situação', default=dict)
+    financeiro_mensal = models.JSONField('Receitas e Despesas por Mês', default=dict)
+    
+    # Controle
+    desatualizado = models.BooleanField('Desatualizado', default=True)
+    calculado_em = models.DateTimeField('Calculado em', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Métricas do Escritório'
+        verbose_name_plural = 'Métricas dos Escritórios'
+        indexes = [
+            # Apenas os desatualizados são varridos pela task
+            models.Index(fields=['desatualizado'], name='metricas_desatualizadas', condition=models.Q(desatualizado=True)),
+        ]
+    
+    def __str__(self):
+        return f"Métricas de {self.escritorio_id}"
+    
+    @classmethod
+    def marcar_desatualizado(cls, escritorio_id):
+        """Sinaliza que o retrato precisa ser recalculado (só escreve se ainda não estava marcado)"""
+        if escritorio_id:
+            cls.objects.filter(escritorio_id=escritorio_id, desatualizado=False).update(desatualizado=True)
@@ -1,6 +1,47 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchRank, SearchVectorField
 from django.db import models
 from .usuario import Usuario, Escritorio
 from .cliente import Cliente
+from .utils import SubquerySum
+
+
+class ProcessoQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Anota proxima_audiencia (data) e soma_custas na própria consulta
+        
+        Uma subquery correlacionada para cada: a página inteira sai em um
+        SELECT, em vez de exists() + first() + SUM por processo.
+        """
+        from django.utils import timezone
+        
+        proximas = Audiencia.objects.filter(
+            processo=models.OuterRef('pk'),
+            data__gte=timezone.now().date()
+        ).order_by('data').values('data')[:1]
+        
+        return self.annotate(
+            proxima_audiencia=models.Subquery(proximas, output_field=models.DateField()),
+            soma_custas=SubquerySum(CustaProcessual.objects.filter(processo=models.OuterRef('pk')), 'valor'),
+        )
+    
+    def buscar(self, termo):
+        """
+        Busca textual ranqueada em número CNJ, cliente, partes e objeto
+        
+        Usa o índice GIN de busca_vetor (core.services.busca); anota
+        'relevancia' e ordena pelos mais relevantes.
+        """
+        from ..services.busca import consulta_busca
+        
+        consulta = consulta_busca(termo)
+        if consulta is None:
+            return self.none()
+        return self.filter(busca_vetor=consulta).annotate(
+            relevancia=SearchRank(models.F('busca_vetor'), consulta)
+        ).order_by('-relevancia', '-data_distribuicao')
+
 
 class Processo(models.Model):
     """Processo judicial completo"""
@@ -86,6 +127,9 @@ class Processo(models.Model):
     observacoes = models.TextField('Observações', blank=True)
     tags = models.CharField('Tags', max_length=200, blank=True, help_text='Separadas por vírgula')
     
+    # Busca textual: preenchido por trigger no banco (core.services.busca)
+    busca_vetor = SearchVectorField(null=True, editable=False)
+    
     # Auditoria
     criado_em = models.DateTimeField('Criado em', auto_now_add=True)
     criado_por = models.ForeignKey(
@@ -102,6 +146,8 @@ class Processo(models.Model):
         related_name='processos_atualizados'
     )
     
+    objects = ProcessoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Processo'
         verbose_name_plural = 'Processos'
@@ -112,6 +158,7 @@ class Processo(models.Model):
             models.Index(fields=['cliente', 'situacao']),
             models.Index(fields=['advogado_responsavel', 'situacao']),
             models.Index(fields=['tipo', 'situacao']),
+            GinIndex(fields=['busca_vetor'], name='processo_busca_gin'),
         ]
     
     def __str__(self):
@@ -124,18 +171,25 @@ class Processo(models.Model):
             pass
         super().save(*args, **kwargs)
     
+    # Usam as anotações de with_stats() quando presentes; senão, uma consulta cada
     @property
     def dias_ate_proxima_audiencia(self):
         """Calcula dias até a próxima audiência"""
         from django.utils import timezone
-        audiencias = self.audiencias.filter(data__gte=timezone.now().date()).order_by('data')
-        if audiencias.exists():
-            return (audiencias.first().data - timezone.now().date()).days
-        return None
+        hoje = timezone.now().date()
+        if hasattr(self, 'proxima_audiencia'):
+            proxima = self.proxima_audiencia
+        else:
+            proxima = self.audiencias.filter(data__gte=hoje).order_by('data').values_list('data', flat=True).first()
+        if proxima is None:
+            return None
+        return (proxima - hoje).days
     
     @property
     def total_custas(self):
         """Calcula total de custas do processo"""
+        if hasattr(self, 'soma_custas'):
+            return self.soma_custas
         return self.custas.aggregate(total=models.Sum('valor'))['total'] or 0
 
 
@@ -179,6 +233,8 @@ class Andamento(models.Model):
     
     # Controle
     capturado_automatico = models.BooleanField('Capturado Automaticamente', default=False)
+    # Identidade do conteúdo (data + tipo + descrição): deduplica a captura automática
+    hash_conteudo = models.CharField('Hash do Conteúdo', max_length=64, blank=True, editable=False)
     usuario = models.ForeignKey(
         Usuario, 
         on_delete=models.SET_NULL, 
@@ -199,11 +255,25 @@ class Andamento(models.Model):
         indexes = [
             models.Index(fields=['processo', '-data']),
             models.Index(fields=['tipo', 'data']),
+            models.Index(fields=['processo', 'hash_conteudo']),
+        ]
+        constraints = [
+            # Capturas concorrentes do mesmo processo não duplicam andamentos
+            models.UniqueConstraint(
+                fields=['processo', 'hash_conteudo'],
+                condition=models.Q(capturado_automatico=True),
+                name='andamento_capturado_unico'
+            ),
         ]
     
     def __str__(self):
         return f"{self.processo.numero_cnj} - {self.get_tipo_display()} - {self.data}"
     
+    def save(self, *args, **kwargs):
+        from ..services.andamentos import hash_conteudo
+        self.hash_conteudo = hash_conteudo(self.data, self.tipo, self.descricao)
+        super().save(*args, **kwargs)
+    
     @property
     def resumo(self):
         """Resumo do andamento (50 primeiros caracteres)"""
@@ -292,6 +362,7 @@ class Prazo(models.Model):
         help_text='Dias antes do vencimento para enviar alertas'
     )
     alertas_enviados = models.IntegerField('Alertas Enviados', default=0)
+    ultimo_alerta = models.DateField('Último Alerta', null=True, blank=True)
     calculado_automatico = models.BooleanField('Calculado Automaticamente', default=False)
     
     # Auditoria
@@ -397,4 +468,46 @@ class Audiencia(models.Model):
         ]
     
     def __str__(self):
-        return f"Audiência - {self.processo.numero_cnj} - {self.data}"
\ No newline at end of file
+        return f"Audiência - {self.processo.numero_cnj} - {self.data}"
+
+
+class CustaProcessual(models.Model):
+    """Custas e despesas judiciais do processo"""
+    
+    TIPO_CHOICES = [
+        ('iniciais', 'Custas Iniciais'),
+        ('preparo', 'Preparo Recursal'),
+        ('diligencia', 'Diligência'),
+        ('pericia', 'Honorários Periciais'),
+        ('emolumentos', 'Emolumentos'),
+        ('postagem', 'Postagem'),
+        ('outro', 'Outro'),
+    ]
+    
+    processo = models.ForeignKey(Processo, on_delete=models.CASCADE, related_name='custas')
+    tipo = models.CharField('Tipo', max_length=20, choices=TIPO_CHOICES, default='iniciais')
+    descricao = models.CharField('Descrição', max_length=300, blank=True)
+    valor = models.DecimalField('Valor', max_digits=12, decimal_places=2)
+    data = models.DateField('Data')
+    
+    # Pagamento
+    pago = models.BooleanField('Pago', default=False)
+    data_pagamento = models.DateField('Data de Pagamento', null=True, blank=True)
+    comprovante = models.FileField('Comprovante', upload_to='custas/%Y/%m/', null=True, blank=True)
+    reembolsavel = models.BooleanField('Reembolsável pelo Cliente', default=True)
+    
+    # Auditoria
+    criado_em = models.DateTimeField('Criado em', auto_now_add=True)
+    criado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='custas_criadas')
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Custa Processual'
+        verbose_name_plural = 'Custas Processuais'
+        ordering = ['-data']
+        indexes = [
+            models.Index(fields=['processo', 'data']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.processo_id} - R$ {self.valor}"
@@ -4,6 +4,27 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator
 import uuid
 
+from .utils import SubqueryCount
+
+
+class EscritorioQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Anota qtd_usuarios, qtd_clientes e qtd_processos na própria consulta
+        
+        Subqueries independentes: três Count() com JOIN multiplicariam as
+        linhas (usuários x clientes x processos).
+        """
+        from .cliente import Cliente
+        from .processo import Processo
+        
+        return self.annotate(
+            qtd_usuarios=SubqueryCount(Usuario.objects.filter(escritorio=models.OuterRef('pk'))),
+            qtd_clientes=SubqueryCount(Cliente.objects.filter(escritorio=models.OuterRef('pk'))),
+            qtd_processos=SubqueryCount(Processo.objects.filter(escritorio=models.OuterRef('pk'))),
+        )
+
+
 class Escritorio(models.Model):
     """Escritório de advocacia"""
     
@@ -33,6 +54,8 @@ class Escritorio(models.Model):
     criado_em = models.DateTimeField(_('Criado em'), auto_now_add=True)
     atualizado_em = models.DateTimeField(_('Atualizado em'), auto_now=True)
     
+    objects = EscritorioQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Escritório')
         verbose_name_plural = _('Escritórios')
@@ -40,6 +63,25 @@ class Escritorio(models.Model):
     
     def __str__(self):
         return self.nome
+    
+    # Usam as anotações de with_stats() quando presentes; senão, um COUNT cada
+    @property
+    def total_usuarios(self):
+        if hasattr(self, 'qtd_usuarios'):
+            return self.qtd_usuarios
+        return self.usuarios.count()
+    
+    @property
+    def total_clientes(self):
+        if hasattr(self, 'qtd_clientes'):
+            return self.qtd_clientes
+        return self.clientes.count()
+    
+    @property
+    def total_processos(self):
+        if hasattr(self, 'qtd_processos'):
+            return self.qtd_processos
+        return self.processos.count()
 
 
 class Usuario(AbstractUser):
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Expressões auxiliares para anotações com subquery
+
+Diferente de Count()/Sum() com JOIN, cada subquery é independente: várias
+contagens de relações diferentes na mesma consulta não se multiplicam
+(sem produto cartesiano entre os JOINs).
+"""
+from django.db import models
+
+
+class SubqueryCount(models.Subquery):
+    """
+    COUNT(*) de um queryset correlacionado com OuterRef
+
+    Ex: Escritorio.objects.annotate(
+            qtd_clientes=SubqueryCount(Cliente.objects.filter(escritorio=OuterRef('pk')))
+        )
+    """
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _contagem)'
+    output_field = models.IntegerField()
+
+    def __init__(self, queryset, **extra):
+        # Só precisa das linhas, não das colunas nem da ordenação
+        super().__init__(queryset.order_by().values('pk'), **extra)
+
+
+class SubquerySum(models.Subquery):
+    """
+    SUM(campo) de um queryset correlacionado com OuterRef (0 se vazio)
+
+    Ex: Escritorio.objects.annotate(
+            nao_lidas=SubquerySum(ConversaWhatsApp.objects.filter(...), 'mensagens_nao_lidas')
+        )
+    """
+    template = '(SELECT COALESCE(SUM(%(campo)s), 0) FROM (%(subquery)s) _soma)'
+
+    def __init__(self, queryset, campo, output_field=None, **extra):
+        if output_field is None:
+            campo_modelo = queryset.model._meta.get_field(campo)
+            if isinstance(campo_modelo, models.ForeignKey):
+                output_field = models.IntegerField()
+            else:
+                # Mantém max_digits/decimal_places de DecimalField
+                output_field = campo_modelo.clone()
+        super().__init__(
+            queryset.order_by().values(campo),
+            output_field=output_field,
+            campo=campo,
+            **extra
+        )
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from django.db import models
+from django.db.models import Case, Count, F, Max, Min, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.utils import timezone
-from datetime import time
+from datetime import time, timedelta
 from .usuario import Usuario, Escritorio
 from .cliente import Cliente
 from .processo import Processo
@@ -158,14 +160,12 @@ class WhatsAppConfig(models.Model):
         return usuario.pode_gerenciar_whatsapp
     
     def incrementar_mensagem_enviada(self):
-        """Incrementa contador de mensagens enviadas"""
-        self.mensagens_enviadas += 1
-        self.save(update_fields=['mensagens_enviadas'])
+        """Incrementa contador de mensagens enviadas (atômico, sem sobrescrever outros workers)"""
+        WhatsAppConfig.objects.filter(pk=self.pk).update(mensagens_enviadas=F('mensagens_enviadas') + 1)
     
     def incrementar_mensagem_recebida(self):
-        """Incrementa contador de mensagens recebidas"""
-        self.mensagens_recebidas += 1
-        self.save(update_fields=['mensagens_recebidas'])
+        """Incrementa contador de mensagens recebidas (atômico, sem sobrescrever outros workers)"""
+        WhatsAppConfig.objects.filter(pk=self.pk).update(mensagens_recebidas=F('mensagens_recebidas') + 1)
         
 
 class MensagemWhatsApp(models.Model):
@@ -281,10 +281,13 @@ class MensagemWhatsApp(models.Model):
         verbose_name_plural = 'Mensagens WhatsApp'
         ordering = ['-criado_em']
         indexes = [
-            models.Index(fields=['whatsapp_config', 'numero_contato', '-criado_em']),
+            # '-id' desempata mensagens no mesmo instante (paginação por cursor)
+            models.Index(fields=['whatsapp_config', 'numero_contato', '-criado_em', '-id']),
             models.Index(fields=['cliente', '-criado_em']),
             models.Index(fields=['direcao', 'status', 'lida']),
             models.Index(fields=['message_id']),
+            # Callbacks de status do provider
+            models.Index(fields=['whatsapp_config', 'message_id_externo']),
         ]
     
     def __str__(self):
@@ -298,25 +301,23 @@ class MensagemWhatsApp(models.Model):
             pass
         
         # Se for mensagem de entrada, tenta vincular a cliente
-        if self.direcao == 'entrada' and not self.cliente:
+        if self.direcao == 'entrada' and not self.cliente_id:
             self._vincular_cliente()
         
+        nova = self._state.adding
         super().save(*args, **kwargs)
+        
+        # Contadores da conversa são mantidos incrementalmente
+        if nova:
+            ConversaWhatsApp.registrar_mensagem(self)
     
     def _vincular_cliente(self):
-        """Tenta vincular a mensagem a um cliente existente"""
-        try:
-            # Tenta encontrar por número de telefone
-            cliente = Cliente.objects.filter(
-                telefone__contains=self.numero_contato[-8:]  # Últimos 8 dígitos
-            ).first()
-            
-            if cliente:
-                self.cliente = cliente
+        """Tenta vincular a mensagem a um cliente do escritório da configuração"""
+        from ..services.telefones import resolver_cliente
         
-        except Exception as e:
-            # Log erro silenciosamente
-            pass
+        cliente_id = resolver_cliente(self.whatsapp_config.escritorio_id, self.numero_contato)
+        if cliente_id:
+            self.cliente_id = cliente_id
     
     @property
     def preview(self):
@@ -338,21 +339,48 @@ class MensagemWhatsApp(models.Model):
         return None
     
     def marcar_como_lida(self):
-        """Marca mensagem como lida"""
+        """Marca mensagem como lida (True se esta chamada fez a leitura)"""
+        if self.lida:
+            return False
+        
+        agora = timezone.now()
+        
+        # UPDATE condicional: leituras concorrentes só decrementam a conversa uma vez
+        atualizadas = MensagemWhatsApp.objects.filter(pk=self.pk, lida=False).update(
+            lida=True,
+            tempo_leitura=agora,
+            atualizado_em=agora,
+        )
+        
         self.lida = True
-        self.tempo_leitura = timezone.now()
-        self.save()
+        self.tempo_leitura = agora
+        
+        # Só mensagens de entrada contam como não lidas; registrar_leitura
+        # também invalida o cache do dashboard do escritório
+        if atualizadas and self.direcao == 'entrada':
+            ConversaWhatsApp.registrar_leitura(
+                self.whatsapp_config_id,
+                self.numero_contato,
+                escritorio_id=self.whatsapp_config.escritorio_id,
+            )
+        
+        return bool(atualizadas)
     
     def responder(self, conteudo, usuario=None, tipo='texto'):
-        """Cria uma resposta para esta mensagem"""
+        """
+        Cria uma resposta para esta mensagem
+        
+        Fica com status 'enviando': envie com core.services.whatsapp_envio.enfileirar_envio
+        """
         resposta = MensagemWhatsApp(
             whatsapp_config=self.whatsapp_config,
-            cliente=self.cliente,
-            processo=self.processo,
+            cliente_id=self.cliente_id,
+            processo_id=self.processo_id,
             numero_contato=self.numero_contato,
             nome_contato=self.nome_contato,
             tipo=tipo,
             direcao='saida',
+            status='enviando',
             conteudo=conteudo,
             usuario_responsavel=usuario,
             mensagem_respondida=self,
@@ -443,93 +471,122 @@ class FluxoChatbot(models.Model):
         return f"{self.nome} ({self.get_tipo_display()})"
     
     def verificar_ativacao(self, mensagem):
-        """Verifica se a mensagem ativa este fluxo"""
-        mensagem_lower = mensagem.lower()
-        
-        # Verifica palavras-chave
-        palavras = [p.strip().lower() for p in self.palavras_chave.split('\n') if p.strip()]
-        
-        for palavra in palavras:
-            # Suporte a curinga
-            if palavra.endswith('*'):
-                if mensagem_lower.startswith(palavra[:-1]):
-                    return True
-            elif palavra.startswith('*'):
-                if mensagem_lower.endswith(palavra[1:]):
-                    return True
-            elif palavra in mensagem_lower:
-                return True
-        
-        # Verifica regex se existir
-        if self.expressoes_regulares:
-            import re
-            try:
-                for regex in self.expressoes_regulares.split('\n'):
-                    regex = regex.strip()
-                    if regex and re.search(regex, mensagem, re.IGNORECASE):
-                        return True
-            except:
-                pass
-        
-        return False
+        """
+        Verifica se a mensagem ativa este fluxo
+        
+        Para testar todos os fluxos de um escritório de uma vez, use
+        core.services.chatbot.fluxos_ativados (matcher compilado e em cache).
+        """
+        from ..services.chatbot import MatcherChatbot
+        
+        matcher = getattr(self, '_matcher', None)
+        if matcher is None:
+            matcher = self._matcher = MatcherChatbot([self])
+        return bool(matcher.buscar(mensagem))
+    
+    @property
+    def grafo(self):
+        """Passos do fluxo_json pré-processados (GrafoFluxo imutável)"""
+        from ..services.chatbot import GrafoFluxo
+        
+        grafo = getattr(self, '_grafo', None)
+        if grafo is None:
+            grafo = self._grafo = GrafoFluxo(self.fluxo_json)
+        return grafo
+    
+    @classmethod
+    def registrar_execucao(cls, fluxo_id, iniciado=False, sucesso=None, tempo_ms=None):
+        """
+        Atualiza as estatísticas com F-expressions
+        
+        Não usa save(): não reescreve fluxo_json nem dispara a invalidação
+        do matcher do chatbot (core.signals).
+        """
+        atualizacao = {}
+        if iniciado:
+            atualizacao['vezes_executado'] = F('vezes_executado') + 1
+            atualizacao['ultima_execucao'] = timezone.now()
+        if sucesso is True:
+            atualizacao['sucessos'] = F('sucessos') + 1
+        elif sucesso is False:
+            atualizacao['falhas'] = F('falhas') + 1
+        if tempo_ms is not None:
+            # Média móvel exponencial: não precisa guardar o histórico
+            atualizacao['tempo_medio_resposta'] = F('tempo_medio_resposta') * 0.9 + tempo_ms * 0.1
+        
+        if atualizacao:
+            cls.objects.filter(pk=fluxo_id).update(**atualizacao)
     
     def executar(self, contexto):
-        """Executa o fluxo com o contexto fornecido"""
-        try:
-            # Incrementa estatísticas
-            self.vezes_executado += 1
-            self.ultima_execucao = timezone.now()
-            
-            # Processa fluxo
-            fluxo = self.fluxo_json
-            
-            # Aqui você implementaria a lógica de execução do fluxo
-            # Por enquanto, retorna a primeira mensagem do fluxo
-            if fluxo.get('steps') and len(fluxo['steps']) > 0:
-                self.sucessos += 1
-                return fluxo['steps'][0].get('mensagem', 'Olá! Como posso ajudar?')
-            
-            self.falhas += 1
+        """
+        Inicia o fluxo e retorna a mensagem do primeiro passo
+        
+        A conversa completa (passos, sessões, respostas) é conduzida por
+        core.services.chatbot.responder_mensagem.
+        """
+        from ..services.chatbot import formatar_mensagem
+        
+        passo = self.grafo.passo(self.grafo.inicio)
+        if passo is None:
+            FluxoChatbot.registrar_execucao(self.pk, iniciado=True, sucesso=False)
             return None
-            
-        except Exception as e:
-            self.falhas += 1
-            return f"Desculpe, ocorreu um erro: {str(e)}"
         
-        finally:
-            self.save()
+        FluxoChatbot.registrar_execucao(self.pk, iniciado=True, sucesso=True)
+        return formatar_mensagem(passo.mensagem, contexto or {}) or 'Olá! Como posso ajudar?'
     
     def get_passo_atual(self, session_id):
-        """Obtém o passo atual para uma sessão"""
-        from django.core.cache import cache
-        
-        chave = f"chatbot_{self.id}_{session_id}"
-        dados = cache.get(chave, {'step': 0, 'data': {}})
+        """Obtém o passo atual para uma sessão (início do fluxo se não houver sessão)"""
+        from ..services.chatbot import carregar_sessao
         
-        return dados['step']
+        sessao = carregar_sessao(f'fluxo{self.pk}:{session_id}')
+        return sessao['passo'] if sessao else self.grafo.inicio
     
     def avancar_passo(self, session_id, resposta_usuario=None):
-        """Avança para o próximo passo"""
-        from django.core.cache import cache
+        """Avança para o próximo passo conforme a resposta (None ao fim do fluxo)"""
+        from ..services.chatbot import carregar_sessao, encerrar_sessao, salvar_sessao
         
-        chave = f"chatbot_{self.id}_{session_id}"
-        dados = cache.get(chave, {'step': 0, 'data': {}})
+        chave = f'fluxo{self.pk}:{session_id}'
+        sessao = carregar_sessao(chave) or {'fluxo': self.pk, 'passo': self.grafo.inicio, 'dados': {}}
         
         # Salva resposta do usuário no contexto se fornecida
         if resposta_usuario:
-            dados['data'][f'resposta_{dados["step"]}'] = resposta_usuario
-        
-        # Avança passo
-        dados['step'] += 1
-        fluxo = self.fluxo_json
+            sessao['dados'][f'resposta_{sessao["passo"]}'] = resposta_usuario
         
-        # Verifica se chegou ao fim
-        if dados['step'] >= len(fluxo.get('steps', [])):
-            dados['fim'] = True
-        
-        cache.set(chave, dados, timeout=3600)  # 1 hora
+        proximo, _ = self.grafo.proximo(sessao['passo'], resposta_usuario)
+        if proximo is None:
+            encerrar_sessao(chave)
+            return None
         
-        return dados['step']
+        sessao['passo'] = proximo
+        salvar_sessao(chave, sessao)
+        return proximo
+
+
+class SessaoChatbot(models.Model):
+    """
+    Estado de um contato dentro de um fluxo do chatbot
+    
+    Cópia de segurança: a sessão vive no cache (Redis, com TTL); este
+    registro só é gravado quando o Redis está indisponível e é consumido
+    na próxima leitura.
+    """
+    
+    chave = models.CharField('Chave', max_length=150, unique=True)
+    fluxo = models.ForeignKey(FluxoChatbot, on_delete=models.CASCADE, related_name='sessoes')
+    passo = models.JSONField('Passo Atual', null=True)
+    dados = models.JSONField('Dados Coletados', default=dict, blank=True)
+    expira_em = models.DateTimeField('Expira em')
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Sessão do Chatbot'
+        verbose_name_plural = 'Sessões do Chatbot'
+        indexes = [
+            models.Index(fields=['expira_em']),
+        ]
+    
+    def __str__(self):
+        return f"{self.chave} @ {self.passo}"
 
 
 class ConversaWhatsApp(models.Model):
@@ -562,6 +619,7 @@ class ConversaWhatsApp(models.Model):
     mensagens_nao_lidas = models.IntegerField('Mensagens Não Lidas', default=0)
     primeira_mensagem = models.DateTimeField('Primeira Mensagem', null=True, blank=True)
     ultima_mensagem = models.DateTimeField('Última Mensagem', null=True, blank=True)
+    ultima_mensagem_saida = models.DateTimeField('Última Mensagem Enviada', null=True, blank=True)
     
     # Tags
     tags = models.CharField('Tags', max_length=200, blank=True, help_text='Separadas por vírgula')
@@ -601,38 +659,161 @@ class ConversaWhatsApp(models.Model):
             self.mensagens_nao_lidas > 0
         )
     
+    @classmethod
+    def incrementar(cls, config_id, numero_contato, nome_contato='', cliente_id=None,
+                    total=1, nao_lidas=0, primeira=None, ultima=None, ultima_saida=None):
+        """
+        Aplica novas mensagens aos contadores em um único UPDATE atômico
+        
+        Cria a conversa se ainda não existir. Não relê o histórico de mensagens.
+        """
+        atualizacao = {
+            'total_mensagens': F('total_mensagens') + total,
+            'mensagens_nao_lidas': F('mensagens_nao_lidas') + nao_lidas,
+            'atualizada_em': timezone.now(),
+        }
+        if primeira:
+            primeira = Value(primeira, output_field=models.DateTimeField())
+            atualizacao['primeira_mensagem'] = Least(Coalesce('primeira_mensagem', primeira), primeira)
+        if ultima:
+            ultima = Value(ultima, output_field=models.DateTimeField())
+            atualizacao['ultima_mensagem'] = Greatest(Coalesce('ultima_mensagem', ultima), ultima)
+        if ultima_saida:
+            ultima_saida = Value(ultima_saida, output_field=models.DateTimeField())
+            atualizacao['ultima_mensagem_saida'] = Greatest(Coalesce('ultima_mensagem_saida', ultima_saida), ultima_saida)
+        
+        conversa = cls.objects.filter(whatsapp_config_id=config_id, numero_contato=numero_contato)
+        
+        # Caso comum (conversa já existe): um único comando
+        if conversa.update(**atualizacao):
+            return
+        
+        cls.objects.get_or_create(
+            whatsapp_config_id=config_id,
+            numero_contato=numero_contato,
+            defaults={
+                'nome_contato': nome_contato,
+                'cliente_id': cliente_id,
+                'aberta': True
+            }
+        )
+        conversa.update(**atualizacao)
+    
+    @classmethod
+    def registrar_mensagem(cls, mensagem):
+        """Atualiza a conversa com uma mensagem recém-criada"""
+        cls.registrar_mensagens([mensagem])
+    
+    @classmethod
+    def registrar_mensagens(cls, mensagens):
+        """
+        Atualiza as conversas com mensagens recém-criadas (ex: bulk_create)
+        
+        Cada conversa afetada recebe um único UPDATE, não importa quantas
+        mensagens do lote sejam dela.
+        """
+        grupos = {}
+        for mensagem in mensagens:
+            chave = (mensagem.whatsapp_config_id, mensagem.numero_contato)
+            grupo = grupos.setdefault(chave, {
+                'nome_contato': mensagem.nome_contato,
+                'cliente_id': mensagem.cliente_id,
+                'total': 0,
+                'nao_lidas': 0,
+                'primeira': mensagem.criado_em,
+                'ultima': mensagem.criado_em,
+                'ultima_saida': None,
+            })
+            grupo['total'] += 1
+            if mensagem.direcao == 'entrada' and not mensagem.lida:
+                grupo['nao_lidas'] += 1
+            grupo['primeira'] = min(grupo['primeira'], mensagem.criado_em)
+            grupo['ultima'] = max(grupo['ultima'], mensagem.criado_em)
+            if mensagem.direcao == 'saida':
+                grupo['ultima_saida'] = max(grupo['ultima_saida'] or mensagem.criado_em, mensagem.criado_em)
+            grupo['nome_contato'] = grupo['nome_contato'] or mensagem.nome_contato
+            grupo['cliente_id'] = grupo['cliente_id'] or mensagem.cliente_id
+        
+        for (config_id, numero_contato), grupo in grupos.items():
+            cls.incrementar(config_id, numero_contato, **grupo)
+    
+    @classmethod
+    def registrar_leitura(cls, config_id, numero_contato, quantidade=1, escritorio_id=None):
+        """
+        Decrementa as mensagens não lidas
+        
+        Fecha a conversa quando não sobra nada pendente e a última
+        mensagem de saída foi há mais de 24 horas. O .update() não dispara
+        signals: o cache do dashboard do escritório é invalidado aqui.
+        """
+        from ..services.dashboard import invalidar_dashboard
+        
+        limite_inatividade = timezone.now() - timedelta(hours=24)
+        
+        atualizadas = cls.objects.filter(
+            whatsapp_config_id=config_id,
+            numero_contato=numero_contato
+        ).update(
+            mensagens_nao_lidas=Greatest(F('mensagens_nao_lidas') - quantidade, Value(0)),
+            aberta=Case(
+                When(
+                    mensagens_nao_lidas__lte=quantidade,
+                    ultima_mensagem_saida__lt=limite_inatividade,
+                    then=Value(False)
+                ),
+                default=F('aberta'),
+                output_field=models.BooleanField()
+            ),
+            atualizada_em=timezone.now(),
+        )
+        
+        if atualizadas:
+            if escritorio_id is None:
+                escritorio_id = WhatsAppConfig.objects.filter(pk=config_id).values_list(
+                    'escritorio_id', flat=True
+                ).first()
+            invalidar_dashboard(escritorio_id)
+        return atualizadas
+    
     def atualizar_estatisticas(self):
-        """Atualiza estatísticas da conversa"""
+        """
+        Recalcula as estatísticas a partir de todo o histórico da conversa
+        
+        Os contadores já são mantidos incrementalmente; use apenas para
+        corrigir divergências (manage.py reconciliar_conversas).
+        """
         from . import MensagemWhatsApp
         
-        mensagens = MensagemWhatsApp.objects.filter(
+        estatisticas = MensagemWhatsApp.objects.filter(
             whatsapp_config=self.whatsapp_config,
             numero_contato=self.numero_contato
-        )
+        ).aggregate(**agregados_estatisticas_conversa())
         
-        if mensagens.exists():
-            self.total_mensagens = mensagens.count()
-            self.mensagens_nao_lidas = mensagens.filter(lida=False, direcao='entrada').count()
-            self.primeira_mensagem = mensagens.earliest('criado_em').criado_em
-            self.ultima_mensagem = mensagens.latest('criado_em').criado_em
+        if estatisticas['total_mensagens']:
+            for campo, valor in estatisticas.items():
+                setattr(self, campo, valor)
             
             # Verifica se conversa deve ser fechada
             # (ex: última mensagem de saída há mais de 24 horas)
-            from django.utils import timezone
-            from datetime import timedelta
-            
-            ultima_mensagem_saida = mensagens.filter(
-                direcao='saida'
-            ).order_by('-criado_em').first()
-            
-            if ultima_mensagem_saida:
-                horas_passadas = (timezone.now() - ultima_mensagem_saida.criado_em).total_seconds() / 3600
+            if self.ultima_mensagem_saida:
+                horas_passadas = (timezone.now() - self.ultima_mensagem_saida).total_seconds() / 3600
                 if horas_passadas > 24 and self.mensagens_nao_lidas == 0:
                     self.aberta = False
             
-
             self.save()
 
+
+def agregados_estatisticas_conversa():
+    """Agregações que recalculam os contadores de ConversaWhatsApp a partir das mensagens"""
+    return {
+        'total_mensagens': Count('id'),
+        'mensagens_nao_lidas': Count('id', filter=Q(lida=False, direcao='entrada')),
+        'primeira_mensagem': Min('criado_em'),
+        'ultima_mensagem': Max('criado_em'),
+        'ultima_mensagem_saida': Max('criado_em', filter=Q(direcao='saida')),
+    }
+
+
 class WebhookEvent(models.Model):
     """
     Registro de webhooks recebidos para garantir idempotência
@@ -641,8 +822,20 @@ class WebhookEvent(models.Model):
     - Previne processamento duplicado de mensagens
     - WhatsApp pode enviar o mesmo webhook múltiplas vezes
     - Sem isso, você vai ter mensagens duplicadas no sistema
+    
+    FILA DE INGESTÃO:
+    - No modo assíncrono o webhook só grava o evento e responde
+    - Workers Celery drenam os eventos pendentes em ordem, por configuração
+    - Eventos que falham várias vezes vão para 'descartado' (dead-letter)
     """
     
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processado', 'Processado'),
+        ('erro', 'Erro (aguardando nova tentativa)'),
+        ('descartado', 'Descartado (dead-letter)'),
+    ]
+    
     webhook_id = models.CharField(
         'ID do Webhook',
         max_length=200,
@@ -668,6 +861,18 @@ class WebhookEvent(models.Model):
         default=False
     )
     
+    # Controle da fila de ingestão
+    status = models.CharField(
+        'Status',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pendente'
+    )
+    tentativas = models.IntegerField('Tentativas', default=0)
+    ultimo_erro = models.TextField('Último Erro', blank=True)
+    proxima_tentativa_em = models.DateTimeField('Próxima Tentativa', null=True, blank=True)
+    processado_em = models.DateTimeField('Processado em', null=True, blank=True)
+    
     created_at = models.DateTimeField(
         'Recebido em',
         auto_now_add=True,
@@ -682,7 +887,88 @@ class WebhookEvent(models.Model):
             models.Index(fields=['webhook_id']),
             models.Index(fields=['whatsapp_config', '-created_at']),
             models.Index(fields=['processed', '-created_at']),
+            models.Index(fields=['whatsapp_config', 'status', 'created_at']),
         ]
     
     def __str__(self):
-        return f"Webhook {self.webhook_id} - {self.created_at.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"Webhook {self.webhook_id} - {self.created_at.strftime('%d/%m/%Y %H:%M')}"
+    
+    @classmethod
+    def registrar(cls, config, webhook_id, payload):
+        """
+        Registra um webhook de forma idempotente
+        
+        Retorna (evento, True) se foi inserido agora ou (None, False) se o
+        webhook_id já existia (inclusive em entregas duplicadas concorrentes).
+        """
+        inseridos = cls.registrar_lote(config, [(webhook_id, payload)])
+        if inseridos:
+            return inseridos[0], True
+        return None, False
+    
+    @classmethod
+    def registrar_lote(cls, config, eventos):
+        """
+        Registra vários webhooks com um único INSERT ... ON CONFLICT DO NOTHING
+        
+        eventos: lista de (webhook_id, payload)
+        Retorna apenas os eventos efetivamente inseridos, na ordem recebida.
+        """
+        from django.db import connection, IntegrityError, transaction
+        
+        # Remove duplicados dentro do próprio lote (mantém o primeiro)
+        unicos = {}
+        for webhook_id, payload in eventos:
+            unicos.setdefault(webhook_id, payload)
+        
+        objetos = [
+            cls(webhook_id=webhook_id, whatsapp_config=config, payload=payload)
+            for webhook_id, payload in unicos.items()
+        ]
+        if not objetos:
+            return []
+        
+        if connection.vendor != 'postgresql':
+            inseridos = []
+            for objeto in objetos:
+                try:
+                    with transaction.atomic():
+                        objeto.save(force_insert=True)
+                    inseridos.append(objeto)
+                except IntegrityError:
+                    pass
+            return inseridos
+        
+        quote = connection.ops.quote_name
+        campos = [f for f in cls._meta.concrete_fields if not f.primary_key]
+        coluna_id = quote(cls._meta.get_field('webhook_id').column)
+        
+        linhas = []
+        parametros = []
+        for objeto in objetos:
+            linhas.append('(' + ', '.join(['%s'] * len(campos)) + ')')
+            parametros.extend(
+                campo.get_db_prep_save(campo.pre_save(objeto, True), connection)
+                for campo in campos
+            )
+        
+        sql = (
+            f'INSERT INTO {quote(cls._meta.db_table)} '
+            f'({", ".join(quote(campo.column) for campo in campos)}) '
+            f'VALUES {", ".join(linhas)} '
+            f'ON CONFLICT ({coluna_id}) DO NOTHING '
+            f'RETURNING {quote(cls._meta.pk.column)}, {coluna_id}'
+        )
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, parametros)
+            pks = {webhook_id: pk for pk, webhook_id in cursor.fetchall()}
+        
+        inseridos = []
+        for objeto in objetos:
+            if objeto.webhook_id in pks:
+                objeto.pk = pks[objeto.webhook_id]
+                objeto._state.adding = False
+                objeto._state.db = connection.alias
+                inseridos.append(objeto)
+        return inseridos
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Rotas WebSocket do app core (incluídas em legalflow/asgi.py)"""
+from django.urls import path
+
+from .consumers import PainelWhatsAppConsumer
+
+websocket_urlpatterns = [
+    path('ws/whatsapp/<int:config_id>/', PainelWhatsAppConsumer.as_asgi()),
+]
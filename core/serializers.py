@@ -1,32 +1,54 @@
 # -*- coding: utf-8 -*-
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from .models import (
     Escritorio, Usuario, Cliente, Anotacao, Entrevista,
-    Processo, Andamento, Prazo, Audiencia,
+    Processo, Andamento, Prazo, Audiencia, CustaProcessual,
     Financeiro, ContratoHonorarios, ParcelaHonorarios,
-    WhatsAppConfig, MensagemWhatsApp, FluxoChatbot, ConversaWhatsApp
+    WhatsAppConfig, MensagemWhatsApp, FluxoChatbot, ConversaWhatsApp, Exportacao
 )
 
 
+# ========== PLANEJAMENTO DE CONSULTAS ==========
+# Cada serializer declara no Meta o que lê além das colunas da própria tabela:
+#   select_related: FKs lidas via source='fk.campo' (JOIN em vez de uma consulta por linha)
+#   prefetch_related: relações reversas aninhadas (uma consulta para a página inteira)
+#   only: colunas necessárias (apenas em serializers com 'fields' explícito)
+#   anotacoes: métodos do queryset que anotam campos calculados (ex: with_stats)
+# As viewsets aplicam essas declarações com planejar_consulta().
+def planejar_consulta(queryset, serializer_class):
+    """Aplica ao queryset as relações declaradas no Meta do serializer"""
+    meta = getattr(serializer_class, 'Meta', None)
+    
+    for metodo in getattr(meta, 'anotacoes', ()):
+        queryset = getattr(queryset, metodo)()
+    
+    select_related = getattr(meta, 'select_related', None)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    
+    prefetch_related = getattr(meta, 'prefetch_related', None)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    
+    only = getattr(meta, 'only', None)
+    if only:
+        queryset = queryset.only(*only)
+    
+    return queryset
+
+
 # ========== ESCRITÓRIO ==========
 class EscritorioSerializer(serializers.ModelSerializer):
-    total_usuarios = serializers.SerializerMethodField()
-    total_clientes = serializers.SerializerMethodField()
-    total_processos = serializers.SerializerMethodField()
+    total_usuarios = serializers.IntegerField(read_only=True)
+    total_clientes = serializers.IntegerField(read_only=True)
+    total_processos = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Escritorio
         fields = '__all__'
         read_only_fields = ['criado_em', 'atualizado_em']
-    
-    def get_total_usuarios(self, obj):
-        return obj.usuarios.count()
-    
-    def get_total_clientes(self, obj):
-        return obj.clientes.count()
-    
-    def get_total_processos(self, obj):
-        return obj.processos.count()
+        anotacoes = ['with_stats']
 
 
 # ========== USUÁRIO ==========
@@ -46,6 +68,7 @@ class UsuarioSerializer(serializers.ModelSerializer):
             'ultimo_login', 'criado_em'
         ]
         read_only_fields = ['criado_em', 'ultimo_login', 'nome_completo']
+        select_related = ['escritorio']
         extra_kwargs = {
             'password': {'write_only': True}
         }
@@ -64,6 +87,7 @@ class UsuarioListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Usuario
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'tipo', 'oab']
+        only = fields
 
 
 # ========== CLIENTE ==========
@@ -75,11 +99,13 @@ class ClienteSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Cliente
-        fields = '__all__'
+        exclude = ['cpf_cnpj_digitos']
         read_only_fields = [
             'criado_em', 'criado_por', 'atualizado_em', 'atualizado_por',
             'idade', 'total_processos', 'processos_ativos'
         ]
+        select_related = ['escritorio']
+        anotacoes = ['with_stats']
 
 
 class ClienteListSerializer(serializers.ModelSerializer):
@@ -90,6 +116,19 @@ class ClienteListSerializer(serializers.ModelSerializer):
             'id', 'nome', 'tipo', 'cpf_cnpj', 'telefone', 
             'email', 'cidade', 'estado', 'ativo'
         ]
+        only = fields
+
+
+class ClienteAutocompleteSerializer(serializers.ModelSerializer):
+    """Sugestões do autocomplete (core.services.busca.autocompletar_clientes)"""
+    similaridade = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = Cliente
+        fields = [
+            'id', 'nome', 'nome_social', 'tipo', 'cpf_cnpj',
+            'telefone', 'celular', 'email', 'ativo', 'similaridade'
+        ]
 
 
 # ========== ANOTAÇÃO ==========
@@ -102,6 +141,7 @@ class AnotacaoSerializer(serializers.ModelSerializer):
         model = Anotacao
         fields = '__all__'
         read_only_fields = ['criado_em', 'atualizado_em', 'resumo']
+        select_related = ['cliente', 'usuario']
 
 
 # ========== ENTREVISTA ==========
@@ -115,6 +155,7 @@ class EntrevistaSerializer(serializers.ModelSerializer):
         model = Entrevista
         fields = '__all__'
         read_only_fields = ['criado_em', 'atualizado_em', 'duracao', 'esta_agora']
+        select_related = ['cliente', 'usuario']
 
 
 # ========== PROCESSO ==========
@@ -126,11 +167,13 @@ class ProcessoSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Processo
-        fields = '__all__'
+        exclude = ['busca_vetor']
         read_only_fields = [
             'criado_em', 'criado_por', 'atualizado_em', 'atualizado_por',
             'dias_ate_proxima_audiencia', 'total_custas'
         ]
+        select_related = ['cliente', 'advogado_responsavel']
+        anotacoes = ['with_stats']
 
 
 class ProcessoListSerializer(serializers.ModelSerializer):
@@ -143,6 +186,19 @@ class ProcessoListSerializer(serializers.ModelSerializer):
             'id', 'numero_cnj', 'cliente_nome', 'tipo',
             'situacao', 'valor_causa', 'data_distribuicao'
         ]
+        select_related = ['cliente']
+        only = [
+            'id', 'numero_cnj', 'tipo', 'situacao', 'valor_causa',
+            'data_distribuicao', 'cliente', 'cliente__nome'
+        ]
+
+
+class ProcessoBuscaSerializer(ProcessoListSerializer):
+    """Resultado da busca textual, com a relevância (ProcessoQuerySet.buscar)"""
+    relevancia = serializers.FloatField(read_only=True)
+    
+    class Meta(ProcessoListSerializer.Meta):
+        fields = ProcessoListSerializer.Meta.fields + ['relevancia']
 
 
 # ========== ANDAMENTO ==========
@@ -155,6 +211,7 @@ class AndamentoSerializer(serializers.ModelSerializer):
         model = Andamento
         fields = '__all__'
         read_only_fields = ['criado_em', 'atualizado_em', 'resumo']
+        select_related = ['processo', 'usuario']
 
 
 # ========== PRAZO ==========
@@ -172,6 +229,7 @@ class PrazoSerializer(serializers.ModelSerializer):
             'criado_em', 'atualizado_em', 'dias_restantes',
             'esta_vencido', 'precisa_alerta'
         ]
+        select_related = ['processo', 'responsavel']
 
 
 # ========== AUDIÊNCIA ==========
@@ -182,6 +240,25 @@ class AudienciaSerializer(serializers.ModelSerializer):
         model = Audiencia
         fields = '__all__'
         read_only_fields = ['criado_em', 'atualizado_em']
+        select_related = ['processo']
+
+
+# ========== CUSTAS ==========
+class CustaProcessualSerializer(serializers.ModelSerializer):
+    processo_numero = serializers.CharField(source='processo.numero_cnj', read_only=True)
+    
+    class Meta:
+        model = CustaProcessual
+        fields = '__all__'
+        read_only_fields = ['criado_em', 'criado_por', 'atualizado_em']
+        select_related = ['processo']
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Só processos do escritório do usuário (processo de outro escritório: 400)
+        request = self.context.get('request')
+        if request is not None:
+            self.fields['processo'].queryset = Processo.objects.filter(escritorio=request.user.escritorio)
 
 
 # ========== FINANCEIRO ==========
@@ -197,8 +274,9 @@ class FinanceiroSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = [
             'criado_em', 'criado_por', 'atualizado_em', 'atualizado_por',
-            'valor_pendente', 'percentual_pago', 'esta_vencido'
+            'valor_pendente', 'percentual_pago', 'esta_vencido', 'serie_origem'
         ]
+        select_related = ['cliente', 'processo']
 
 
 class FinanceiroListSerializer(serializers.ModelSerializer):
@@ -211,6 +289,11 @@ class FinanceiroListSerializer(serializers.ModelSerializer):
             'id', 'tipo', 'categoria', 'descricao', 'valor',
             'data_vencimento', 'status', 'cliente_nome'
         ]
+        select_related = ['cliente']
+        only = [
+            'id', 'tipo', 'categoria', 'descricao', 'valor',
+            'data_vencimento', 'status', 'cliente', 'cliente__nome'
+        ]
 
 
 # ========== CONTRATO HONORÁRIOS ==========
@@ -231,6 +314,8 @@ class ContratoHonorariosSerializer(serializers.ModelSerializer):
         model = ContratoHonorarios
         fields = '__all__'
         read_only_fields = ['criado_em', 'criado_por', 'atualizado_em', 'valor_parcela']
+        select_related = ['processo', 'cliente']
+        prefetch_related = ['parcelas']
 
 
 # ========== WHATSAPP ==========
@@ -247,6 +332,7 @@ class WhatsAppConfigSerializer(serializers.ModelSerializer):
             'esta_conectado', 'em_horario_funcionamento',
             'mensagens_enviadas', 'mensagens_recebidas'
         ]
+        select_related = ['escritorio']
         extra_kwargs = {
             'api_key': {'write_only': True},
             'webhook_secret': {'write_only': True}
@@ -263,6 +349,21 @@ class MensagemWhatsAppSerializer(serializers.ModelSerializer):
         model = MensagemWhatsApp
         fields = '__all__'
         read_only_fields = ['criado_em', 'atualizado_em', 'preview', 'tempo_resposta']
+        # mensagem_respondida: tempo_resposta lê criado_em da mensagem original
+        select_related = ['cliente', 'processo', 'mensagem_respondida']
+
+
+class MensagemWhatsAppResumoSerializer(serializers.ModelSerializer):
+    """Formato enxuto para o chat do painel (sem joins nem propriedades calculadas)"""
+    
+    class Meta:
+        model = MensagemWhatsApp
+        fields = [
+            'id', 'numero_contato', 'nome_contato', 'tipo', 'direcao', 'status',
+            'conteudo', 'legenda', 'midia_url', 'tipo_midia', 'lida',
+            'respondida_bot', 'usuario_responsavel', 'mensagem_respondida', 'criado_em',
+        ]
+        read_only_fields = fields
 
 
 class FluxoChatbotSerializer(serializers.ModelSerializer):
@@ -275,6 +376,7 @@ class FluxoChatbotSerializer(serializers.ModelSerializer):
             'criado_em', 'criado_por', 'atualizado_em',
             'vezes_executado', 'sucessos', 'falhas', 'ultima_execucao'
         ]
+        select_related = ['escritorio']
 
 
 class ConversaWhatsAppSerializer(serializers.ModelSerializer):
@@ -288,5 +390,25 @@ class ConversaWhatsAppSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'criada_em', 'atualizada_em', 'total_mensagens',
             'mensagens_nao_lidas', 'primeira_mensagem',
-            'ultima_mensagem', 'precisa_atendimento'
-        ]
\ No newline at end of file
+            'ultima_mensagem', 'ultima_mensagem_saida', 'precisa_atendimento'
+        ]
+        select_related = ['cliente', 'processo']
+
+
+# ========== EXPORTAÇÕES ==========
+class ExportacaoSerializer(serializers.ModelSerializer):
+    # Link da action autenticada, nunca a URL do storage
+    download = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Exportacao
+        fields = [
+            'id', 'recurso', 'formato', 'parametros', 'status', 'download',
+            'total_linhas', 'erro', 'criado_em', 'concluido_em'
+        ]
+        read_only_fields = fields
+    
+    def get_download(self, obj):
+        if obj.status != 'concluida' or not obj.arquivo:
+            return None
+        return reverse('core:exportacao-download', args=[obj.pk], request=self.context.get('request'))
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Captura automática de andamentos processuais
+
+Pipeline (core.tasks.atualizar_processos, a cada 12 horas):
+1. Processos ativos são divididos por tribunal (uma task por tribunal)
+2. Cada lote de processos é consultado na fonte com concorrência limitada
+   (threads só fazem I/O de rede; o banco fica na thread principal)
+3. Movimentos viram Andamento com hash_conteudo; os que já existem no
+   processo (capturados ou lançados à mão) são descartados
+4. Os novos entram com um bulk_create por lote
+
+Fontes são plugáveis (settings.ANDAMENTOS_FONTE):
+- FonteDataJud: API pública do DataJud (CNJ)
+- FonteFalsa: movimentos determinísticos, sem rede (desenvolvimento e testes)
+
+Métricas por tribunal (processos/s, erros, andamentos novos) ficam no cache;
+veja metricas_captura().
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ..models import Andamento, Processo
+
+logger = logging.getLogger(__name__)
+
+# Movimento como veio da fonte (antes de virar Andamento)
+Movimento = namedtuple('Movimento', ['data', 'tipo', 'descricao', 'juiz'])
+
+CHAVE_METRICAS = 'andamentos_metricas_{}'
+CHAVE_TRIBUNAIS = 'andamentos_tribunais'
+
+
+class ErroFonteAndamentos(Exception):
+    """Falha ao consultar a fonte para um processo"""
+
+
+def hash_conteudo(data, tipo, descricao):
+    """
+    Identidade de um andamento: data + tipo + descrição normalizada
+
+    Espaços e maiúsculas não contam, para a mesma movimentação vinda de
+    fontes (ou execuções) diferentes não ser gravada duas vezes.
+    """
+    texto = re.sub(r'\s+', ' ', (descricao or '').strip().lower())
+    data = data.isoformat() if hasattr(data, 'isoformat') else str(data)
+    return hashlib.sha256(f'{data}|{tipo}|{texto}'.encode('utf-8')).hexdigest()
+
+
+# ========== FONTES ==========
+class FonteAndamentos:
+    """
+    Interface das fontes de andamentos
+
+    buscar() roda em threads: só pode fazer I/O de rede, nunca acessar o banco.
+    """
+    nome = 'fonte'
+
+    def buscar(self, numero_cnj, tribunal):
+        """Lista de Movimento do processo; ErroFonteAndamentos em caso de falha"""
+        raise NotImplementedError
+
+
+class FonteDataJud(FonteAndamentos):
+    """API pública do DataJud (CNJ): um índice por tribunal (api_publica_tjsp, ...)"""
+    nome = 'datajud'
+
+    # Palavra no nome do movimento -> Andamento.tipo
+    TIPOS = [
+        ('senten', 'sentenca'),
+        ('decis', 'decisao'),
+        ('audi', 'audiencia'),
+        ('intima', 'intimacao'),
+        ('cita', 'citacao'),
+        ('publica', 'publicacao'),
+        ('recurso', 'recurso'),
+        ('apela', 'recurso'),
+        ('agravo', 'recurso'),
+        ('peti', 'protocolo'),
+        ('protocol', 'protocolo'),
+    ]
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def sessao(self):
+        # Uma Session por thread: keep-alive sem compartilhar o pool entre threads
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = self._local.sessao = requests.Session()
+            sessao.headers['Authorization'] = f'APIKey {settings.DATAJUD_API_KEY}'
+        return sessao
+
+    def buscar(self, numero_cnj, tribunal):
+        indice = ''.join(filter(str.isalnum, tribunal)).lower()
+        url = f"{settings.DATAJUD_API_URL.rstrip('/')}/api_publica_{indice}/_search"
+        corpo = {'query': {'match': {'numeroProcesso': ''.join(filter(str.isdigit, numero_cnj))}}}
+
+        try:
+            resposta = self.sessao.post(url, json=corpo, timeout=settings.ANDAMENTOS_TIMEOUT)
+            resposta.raise_for_status()
+            hits = resposta.json().get('hits', {}).get('hits', [])
+        except (requests.RequestException, ValueError) as e:
+            raise ErroFonteAndamentos(f'DataJud ({indice}): {str(e)}')
+
+        movimentos = []
+        for hit in hits:
+            fonte = hit.get('_source') or {}
+            juiz = (fonte.get('orgaoJulgador') or {}).get('nome', '')
+            for movimento in fonte.get('movimentos') or []:
+                nome = movimento.get('nome') or ''
+                complementos = [c.get('nome') or c.get('descricao') or '' for c in movimento.get('complementosTabelados') or []]
+                try:
+                    data = datetime.fromisoformat(movimento['dataHora'].replace('Z', '+00:00')).date()
+                except (KeyError, ValueError):
+                    continue
+                movimentos.append(Movimento(
+                    data=data,
+                    tipo=self.tipo(nome),
+                    descricao=' - '.join(filter(None, [nome] + complementos)),
+                    juiz=juiz[:200],
+                ))
+        return movimentos
+
+    def tipo(self, nome):
+        nome = nome.lower()
+        for palavra, tipo in self.TIPOS:
+            if palavra in nome:
+                return tipo
+        return 'outro'
+
+
+class FonteFalsa(FonteAndamentos):
+    """
+    Fonte local: movimentos determinísticos por número CNJ, sem rede
+
+    Cada processo tem um histórico fixo e "ganha" um movimento novo por dia,
+    então execuções repetidas exercitam a deduplicação. Latência e taxa de
+    erro simuladas vêm de ANDAMENTOS_FALSA_LATENCIA / ANDAMENTOS_FALSA_ERROS.
+    """
+    nome = 'falsa'
+
+    TIPOS = ['protocolo', 'citacao', 'intimacao', 'decisao', 'publicacao', 'audiencia', 'sentenca']
+
+    def buscar(self, numero_cnj, tribunal):
+        time.sleep(settings.ANDAMENTOS_FALSA_LATENCIA)
+        if random.random() < settings.ANDAMENTOS_FALSA_ERROS:
+            raise ErroFonteAndamentos(f'Falha simulada ({tribunal})')
+
+        semente = int(hashlib.md5(numero_cnj.encode()).hexdigest()[:8], 16)
+        hoje = timezone.localdate()
+        inicio = hoje - timedelta(days=30 + semente % 60)
+
+        movimentos = []
+        dia = inicio
+        while dia <= hoje:
+            tipo = self.TIPOS[(semente + dia.toordinal()) % len(self.TIPOS)]
+            movimentos.append(Movimento(
+                data=dia,
+                tipo=tipo,
+                descricao=f'{tipo.capitalize()} registrada em {dia:%d/%m/%Y} ({tribunal})',
+                juiz='',
+            ))
+            dia += timedelta(days=7) if dia < hoje - timedelta(days=7) else timedelta(days=1)
+        return movimentos
+
+
+def obter_fonte(caminho=None):
+    return import_string(caminho or settings.ANDAMENTOS_FONTE)()
+
+
+# ========== CAPTURA ==========
+def tribunais_ativos():
+    """Tribunais com processos ativos (os shards da captura)"""
+    return list(
+        Processo.objects.filter(situacao='ativo').exclude(tribunal='').order_by(
+            'tribunal'
+        ).values_list('tribunal', flat=True).distinct()
+    )
+
+
+def _consultar(fonte, processo_id, numero_cnj, tribunal):
+    """Roda na thread: (processo_id, movimentos ou None, erro)"""
+    try:
+        return processo_id, fonte.buscar(numero_cnj, tribunal), None
+    except Exception as e:
+        return processo_id, None, str(e)
+
+
+def gravar_movimentos(resultados, refazer=True):
+    """
+    Grava os movimentos novos de um lote de processos
+
+    resultados: {processo_id: [Movimento, ...]}. Um SELECT dos hashes já
+    existentes e um bulk_create; se uma execução concorrente gravou antes, a
+    UniqueConstraint (processo, hash_conteudo) barra o lote e ele é refeito
+    sem os que já existem. Retorna quantos andamentos foram gravados.
+    """
+    candidatos = {}
+    for processo_id, movimentos in resultados.items():
+        for movimento in movimentos:
+            hash_ = hash_conteudo(movimento.data, movimento.tipo, movimento.descricao)
+            candidatos.setdefault((processo_id, hash_), movimento)
+
+    if not candidatos:
+        return 0
+
+    existentes = set(Andamento.objects.filter(
+        processo_id__in=resultados.keys(),
+        hash_conteudo__in={hash_ for _, hash_ in candidatos},
+    ).values_list('processo_id', 'hash_conteudo'))
+
+    novos = [
+        Andamento(
+            processo_id=processo_id,
+            tipo=movimento.tipo,
+            data=movimento.data,
+            descricao=movimento.descricao,
+            juiz=movimento.juiz,
+            capturado_automatico=True,
+            hash_conteudo=hash_,
+        )
+        for (processo_id, hash_), movimento in candidatos.items()
+        if (processo_id, hash_) not in existentes
+    ]
+    if not novos:
+        return 0
+
+    # Sem ignore_conflicts: a contagem de novos tem que ser exata
+    try:
+        with transaction.atomic():
+            Andamento.objects.bulk_create(novos)
+    except IntegrityError:
+        if not refazer:
+            raise
+        logger.info('Andamentos gravados por outra execução durante o lote; refazendo')
+        return gravar_movimentos(resultados, refazer=False)
+    return len(novos)
+
+
+def capturar_tribunal(tribunal, fonte=None):
+    """
+    Captura os andamentos dos processos ativos de um tribunal
+
+    Retorna as métricas da execução (também gravadas no cache).
+    """
+    fonte = fonte or obter_fonte()
+    processos = Processo.objects.filter(situacao='ativo', tribunal=tribunal).order_by('pk')
+
+    metricas = {
+        'tribunal': tribunal,
+        'fonte': fonte.nome,
+        'processos': 0,
+        'erros': 0,
+        'andamentos_novos': 0,
+        'ultimo_erro': '',
+    }
+    inicio = time.monotonic()
+    ultimo_pk = 0
+
+    with ThreadPoolExecutor(max_workers=settings.ANDAMENTOS_CONCORRENCIA) as executor:
+        while True:
+            # Paginação por chave: lotes de tamanho fixo, sem OFFSET
+            lote = list(processos.filter(pk__gt=ultimo_pk).values_list(
+                'pk', 'numero_cnj'
+            )[:settings.ANDAMENTOS_LOTE])
+            if not lote:
+                break
+            ultimo_pk = lote[-1][0]
+
+            resultados = {}
+            for processo_id, movimentos, erro in executor.map(
+                lambda p: _consultar(fonte, p[0], p[1], tribunal), lote
+            ):
+                metricas['processos'] += 1
+                if erro:
+                    metricas['erros'] += 1
+                    metricas['ultimo_erro'] = erro
+                else:
+                    resultados[processo_id] = movimentos
+
+            metricas['andamentos_novos'] += gravar_movimentos(resultados)
+
+    duracao = time.monotonic() - inicio
+    metricas['duracao_s'] = round(duracao, 2)
+    metricas['processos_por_s'] = round(metricas['processos'] / duracao, 2) if duracao else 0
+    metricas['taxa_erros'] = round(metricas['erros'] / metricas['processos'], 4) if metricas['processos'] else 0
+    metricas['executado_em'] = timezone.now().isoformat()
+
+    cache.set(CHAVE_METRICAS.format(tribunal), metricas, None)
+    logger.info(
+        f"Captura {tribunal}: {metricas['processos']} processos, {metricas['andamentos_novos']} "
+        f"andamentos novos, {metricas['erros']} erros, {metricas['processos_por_s']} processos/s"
+    )
+    return metricas
+
+
+def registrar_tribunais(tribunais):
+    cache.set(CHAVE_TRIBUNAIS, list(tribunais), None)
+
+
+def metricas_captura():
+    """Métricas da última captura de cada tribunal"""
+    tribunais = cache.get(CHAVE_TRIBUNAIS) or []
+    metricas = cache.get_many([CHAVE_METRICAS.format(t) for t in tribunais])
+    return [metricas[CHAVE_METRICAS.format(t)] for t in tribunais if CHAVE_METRICAS.format(t) in metricas]
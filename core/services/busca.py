@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Busca de processos (full-text search) e de clientes (pg_trgm)
+
+Processos: Processo.busca_vetor guarda um tsvector ponderado, mantido por trigger no
+próprio banco (vale também para update()/bulk_*):
+- A: número CNJ (com e sem pontuação) e nome do cliente
+- B: polo ativo e polo passivo
+- C: objeto
+O texto passa por unaccent e pelo dicionário 'portuguese' (radicais), e a
+coluna tem índice GIN: a busca não varre a tabela nem faz JOIN com clientes.
+
+Renomear um cliente reindexa os processos dele (trigger em core_cliente).
+instalar_busca() roda após cada migrate (core.signals); processos antigos
+são indexados com 'python manage.py indexar_busca_processos'.
+
+Clientes: o termo digitado decide o índice (filtrar_clientes)
+- só números (CPF/CNPJ, telefone, com ou sem máscara): prefixo em
+  cpf_cnpj_digitos e em TelefoneCliente.numero (B-tree varchar_pattern_ops)
+- com '@': e-mail; demais: nome e nome social por similaridade de palavra
+  (tolera erros de digitação), ambos com índices GIN trigram sobre UPPER()
+As extensões unaccent e pg_trgm são criadas antes do migrate, pois os
+índices trigram dependem delas.
+"""
+import logging
+import re
+import unicodedata
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, TrigramWordSimilarity
+from django.db import transaction
+from django.db.models import Exists, FloatField, OuterRef, Q, Value
+from django.db.models.functions import Greatest, Upper
+
+from ..models import Cliente, Processo, TelefoneCliente
+
+logger = logging.getLogger(__name__)
+
+CONFIG = 'portuguese'
+
+EXTENSOES = ['unaccent', 'pg_trgm']
+
+FUNCAO_PROCESSO = r"""
+CREATE OR REPLACE FUNCTION {processo}_busca_vetor() RETURNS trigger AS $$
+BEGIN
+    NEW.busca_vetor :=
+        setweight(to_tsvector('simple',
+            coalesce(NEW.numero_cnj, '') || ' ' || regexp_replace(coalesce(NEW.numero_cnj, ''), '\D', '', 'g')
+        ), 'A') ||
+        setweight(to_tsvector('{config}', unaccent(coalesce(
+            (SELECT nome FROM {cliente} WHERE id = NEW.cliente_id), ''
+        ))), 'A') ||
+        setweight(to_tsvector('{config}', unaccent(
+            coalesce(NEW.polo_ativo, '') || ' ' || coalesce(NEW.polo_passivo, '')
+        )), 'B') ||
+        setweight(to_tsvector('{config}', unaccent(coalesce(NEW.objeto, ''))), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS {processo}_busca_vetor ON {processo};
+CREATE TRIGGER {processo}_busca_vetor
+    BEFORE INSERT OR UPDATE OF numero_cnj, cliente_id, objeto, polo_ativo, polo_passivo, busca_vetor
+    ON {processo} FOR EACH ROW EXECUTE FUNCTION {processo}_busca_vetor();
+"""
+
+FUNCAO_CLIENTE = r"""
+CREATE OR REPLACE FUNCTION {cliente}_busca_processos() RETURNS trigger AS $$
+BEGIN
+    IF NEW.nome IS DISTINCT FROM OLD.nome THEN
+        -- Qualquer escrita em busca_vetor dispara o recálculo acima
+        UPDATE {processo} SET busca_vetor = NULL WHERE cliente_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS {cliente}_busca_processos ON {cliente};
+CREATE TRIGGER {cliente}_busca_processos
+    AFTER UPDATE OF nome ON {cliente}
+    FOR EACH ROW EXECUTE FUNCTION {cliente}_busca_processos();
+"""
+
+
+def instalar_extensoes(connection):
+    """unaccent e pg_trgm (idempotente)"""
+    with connection.cursor() as cursor:
+        for extensao in EXTENSOES:
+            cursor.execute(f'CREATE EXTENSION IF NOT EXISTS {extensao}')
+
+
+def instalar_busca(connection):
+    """Cria as extensões e as funções/triggers (idempotente)"""
+    tabelas = {
+        'processo': Processo._meta.db_table,
+        'cliente': Cliente._meta.db_table,
+        'config': CONFIG,
+    }
+    instalar_extensoes(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(FUNCAO_PROCESSO.format(**tabelas))
+        cursor.execute(FUNCAO_CLIENTE.format(**tabelas))
+    logger.info('Busca textual de processos: triggers instalados')
+
+
+def remover_acentos(texto):
+    return ''.join(
+        c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c)
+    )
+
+
+def consulta_busca(termo):
+    """
+    SearchQuery do termo digitado; None se não houver palavras
+
+    Cada palavra vale como prefixo ('silv' acha 'Silva'), para a busca
+    responder enquanto o usuário digita. Números CNJ com pontuação viram
+    só dígitos (indexados assim também).
+    """
+    texto = remover_acentos(termo).lower().strip()
+    if re.fullmatch(r'[\d.\-/\s]+', texto):
+        palavras = [re.sub(r'\D', '', texto)]
+    else:
+        palavras = re.findall(r'[^\W_]+', texto)
+    palavras = [p for p in palavras if p]
+    if not palavras:
+        return None
+    # Só letras e dígitos chegam aqui: nenhum operador de tsquery do usuário
+    return SearchQuery(' & '.join(f'{p}:*' for p in palavras), config=CONFIG, search_type='raw')
+
+
+# ========== CLIENTES ==========
+SO_NUMEROS = re.compile(r'[\d.\-/()+\s]+')
+
+# Campos lidos pelo autocomplete (ClienteAutocompleteSerializer)
+CAMPOS_AUTOCOMPLETE = [
+    'id', 'nome', 'nome_social', 'tipo', 'cpf_cnpj', 'telefone', 'celular', 'email', 'ativo',
+]
+
+
+def rota_cliente(termo):
+    """('digitos' | 'email' | 'nome', valor) conforme o que foi digitado"""
+    termo = termo.strip()
+    if SO_NUMEROS.fullmatch(termo):
+        return 'digitos', re.sub(r'\D', '', termo)
+    if '@' in termo:
+        return 'email', termo
+    return 'nome', termo
+
+
+def _prefixo_telefone(digitos):
+    # Números podem estar gravados com o DDI 55
+    filtro = Q(numero__startswith=digitos)
+    if not digitos.startswith('55'):
+        filtro |= Q(numero__startswith=f'55{digitos}')
+    return filtro
+
+
+def _por_nome(queryset, termo):
+    if len(termo) < 3:
+        # Sem trigramas suficientes para similaridade: prefixo
+        return queryset.filter(
+            Q(nome__istartswith=termo) | Q(nome_social__istartswith=termo)
+        ).annotate(similaridade=Value(1.0, output_field=FloatField())).order_by('nome')
+
+    # Mesmas expressões dos índices (UPPER); o trigrama ignora maiúsculas
+    return queryset.alias(
+        nome_upper=Upper('nome'),
+        nome_social_upper=Upper('nome_social'),
+    ).filter(
+        Q(nome_upper__trigram_word_similar=termo)
+        | Q(nome_social_upper__trigram_word_similar=termo)
+        | Q(nome__icontains=termo)
+    ).annotate(
+        similaridade=Greatest(
+            TrigramWordSimilarity(termo, 'nome'),
+            TrigramWordSimilarity(termo, 'nome_social'),
+        )
+    ).order_by('-similaridade', 'nome')
+
+
+def filtrar_clientes(queryset, termo):
+    """
+    Clientes de 'queryset' que correspondem ao termo, anotando 'similaridade'
+
+    Nomes vêm ordenados pela similaridade; documentos, telefones e e-mails
+    pelo nome.
+    """
+    rota, valor = rota_cliente(termo)
+    if not valor:
+        return queryset.none()
+
+    if rota == 'digitos':
+        telefones = TelefoneCliente.objects.filter(
+            _prefixo_telefone(valor), cliente_id=OuterRef('pk')
+        )
+        return queryset.filter(
+            Q(cpf_cnpj_digitos__startswith=valor) | Exists(telefones)
+        ).annotate(similaridade=Value(1.0, output_field=FloatField())).order_by('nome')
+
+    if rota == 'email':
+        return queryset.filter(email__icontains=valor).annotate(
+            similaridade=Value(1.0, output_field=FloatField())
+        ).order_by('nome')
+
+    return _por_nome(queryset, valor)
+
+
+def autocompletar_clientes(escritorio_id, termo, limite=None):
+    """
+    Até 'limite' clientes do escritório para o termo digitado
+
+    Números: dois SELECTs por prefixo (documento e telefone) nos índices
+    (escritorio, ...) e um pelos ids. Texto: uma consulta nos índices
+    trigram, com o limiar CLIENTE_AUTOCOMPLETE_SIMILARIDADE só nesta
+    transação.
+    """
+    limite = limite or settings.CLIENTE_AUTOCOMPLETE_LIMITE
+    clientes = Cliente.objects.filter(escritorio_id=escritorio_id).only(*CAMPOS_AUTOCOMPLETE)
+
+    rota, valor = rota_cliente(termo)
+    if not valor:
+        return []
+
+    if rota == 'digitos':
+        ids = list(clientes.filter(
+            cpf_cnpj_digitos__startswith=valor
+        ).order_by('cpf_cnpj_digitos').values_list('pk', flat=True)[:limite])
+        ids += TelefoneCliente.objects.filter(
+            _prefixo_telefone(valor), escritorio_id=escritorio_id
+        ).order_by('numero').values_list('cliente_id', flat=True)[:limite]
+        return list(clientes.filter(pk__in=ids).annotate(
+            similaridade=Value(1.0, output_field=FloatField())
+        ).order_by('nome')[:limite])
+
+    with transaction.atomic():
+        with transaction.get_connection().cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                [str(settings.CLIENTE_AUTOCOMPLETE_SIMILARIDADE)]
+            )
+        return list(filtrar_clientes(clientes, termo)[:limite])
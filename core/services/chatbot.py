@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+"""
+Ativação de fluxos de chatbot (FluxoChatbot)
+
+Em vez de, a cada mensagem, re-separar palavras-chave e recompilar regex
+fluxo por fluxo, cada escritório tem um MatcherChatbot compilado uma vez:
+
+- Autômato Aho-Corasick com todas as palavras-chave de todos os fluxos:
+  uma única passada pela mensagem encontra todas as ocorrências
+- Regex de cada fluxo compiladas uma vez (só testadas se as palavras-chave
+  do fluxo não bastaram)
+
+Curingas nas palavras-chave:
+- 'olá*'    mensagem começa com 'olá'
+- '*obrigado' mensagem termina com 'obrigado'
+- '*prazo*' ou 'prazo'  mensagem contém 'prazo'
+
+Execução: cada fluxo_json vira um GrafoFluxo imutável (compilado junto com
+o matcher) e o estado de cada contato fica em SessaoChatbot (Redis com TTL,
+banco como fallback). Ver responder_mensagem().
+
+CACHE: matcher e grafos guardados em memória do processo por escritório,
+validados por uma versão no cache compartilhado; salvar/excluir um
+FluxoChatbot troca a versão (core.signals) e todos os processos recompilam
+na próxima mensagem.
+"""
+import copy
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from datetime import timedelta
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CONTEM = 'contem'
+PREFIXO = 'prefixo'
+SUFIXO = 'sufixo'
+
+
+class AutomatoPalavras:
+    """Aho-Corasick: busca simultânea de várias palavras em O(len(texto) + ocorrências)"""
+
+    def __init__(self):
+        self._transicoes = [{}]
+        self._falha = [0]
+        self._saidas = [[]]
+
+    def adicionar(self, palavra, valor):
+        estado = 0
+        for caractere in palavra:
+            proximo = self._transicoes[estado].get(caractere)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes[estado][caractere] = proximo
+                self._transicoes.append({})
+                self._falha.append(0)
+                self._saidas.append([])
+            estado = proximo
+        self._saidas[estado].append(valor)
+
+    def construir(self):
+        """Calcula os links de falha (BFS); chamar depois de adicionar todas as palavras"""
+        fila = deque(self._transicoes[0].values())
+
+        while fila:
+            estado = fila.popleft()
+            for caractere, proximo in self._transicoes[estado].items():
+                fila.append(proximo)
+
+                falha = self._falha[estado]
+                while falha and caractere not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                destino = self._transicoes[falha].get(caractere, 0)
+                self._falha[proximo] = destino if destino != proximo else 0
+
+                # Herda as saídas do sufixo mais longo
+                self._saidas[proximo] = self._saidas[proximo] + self._saidas[self._falha[proximo]]
+
+    def buscar(self, texto):
+        """Gera (posição_final_exclusiva, valor) para cada ocorrência"""
+        estado = 0
+        for posicao, caractere in enumerate(texto):
+            while estado and caractere not in self._transicoes[estado]:
+                estado = self._falha[estado]
+            estado = self._transicoes[estado].get(caractere, 0)
+
+            for valor in self._saidas[estado]:
+                yield posicao + 1, valor
+
+
+def interpretar_palavra(palavra):
+    """'olá*' -> ('olá', PREFIXO); '*fim' -> ('fim', SUFIXO); '*x*' ou 'x' -> ('x', CONTEM)"""
+    palavra = palavra.strip().lower()
+    inicio = palavra.startswith('*')
+    fim = palavra.endswith('*')
+    texto = palavra.strip('*')
+
+    if fim and not inicio:
+        return texto, PREFIXO
+    if inicio and not fim:
+        return texto, SUFIXO
+    return texto, CONTEM
+
+
+class MatcherChatbot:
+    """Matcher imutável de um conjunto de fluxos (normalmente os ativos de um escritório)"""
+
+    def __init__(self, fluxos):
+        # Ordem de execução: menor 'ordem' primeiro (mesmo critério do Meta.ordering)
+        self.fluxos = sorted(fluxos, key=lambda f: (f.ordem, f.nome))
+        self.ids = [fluxo.id for fluxo in self.fluxos]
+        self.automato = AutomatoPalavras()
+        self.sempre = set()
+        self.regex = []
+
+        for indice, fluxo in enumerate(self.fluxos):
+            for linha in (fluxo.palavras_chave or '').split('\n'):
+                if not linha.strip():
+                    continue
+                texto, modo = interpretar_palavra(linha)
+                if not texto:
+                    # '*' sozinho: ativa com qualquer mensagem
+                    self.sempre.add(indice)
+                    continue
+                self.automato.adicionar(texto, (indice, modo, len(texto)))
+
+            compiladas = []
+            for expressao in (fluxo.expressoes_regulares or '').split('\n'):
+                expressao = expressao.strip()
+                if not expressao:
+                    continue
+                try:
+                    compiladas.append(re.compile(expressao, re.IGNORECASE))
+                except re.error as e:
+                    logger.warning(f'Regex inválida no fluxo {fluxo.id} ({expressao}): {str(e)}')
+            self.regex.append(compiladas)
+
+        self.automato.construir()
+
+    def indices_ativados(self, mensagem):
+        texto = (mensagem or '').lower()
+        ativados = set(self.sempre)
+
+        for fim, (indice, modo, tamanho) in self.automato.buscar(texto):
+            if indice in ativados:
+                continue
+            if modo == CONTEM:
+                ativados.add(indice)
+            elif modo == PREFIXO and fim == tamanho:
+                ativados.add(indice)
+            elif modo == SUFIXO and fim == len(texto):
+                ativados.add(indice)
+
+        for indice, compiladas in enumerate(self.regex):
+            if indice not in ativados and any(regex.search(mensagem or '') for regex in compiladas):
+                ativados.add(indice)
+
+        return sorted(ativados)
+
+    def buscar(self, mensagem):
+        """IDs dos fluxos ativados pela mensagem, na ordem de execução"""
+        return [self.ids[indice] for indice in self.indices_ativados(mensagem)]
+
+
+# ========== GRAFO DE PASSOS ==========
+Passo = namedtuple('Passo', [
+    'id', 'mensagem', 'opcoes', 'proximo', 'salvar_como', 'transferir', 'fim', 'mensagem_invalida'
+])
+
+MENSAGEM_OPCAO_INVALIDA = 'Opção inválida. Por favor, escolha uma das opções acima.'
+
+
+class GrafoFluxo:
+    """
+    Passos de um fluxo_json, pré-processados e imutáveis
+
+    Formato (o 'id' é opcional; sem ele vale a posição na lista):
+        {"steps": [
+            {"id": "inicio", "mensagem": "1 - Processos / 2 - Financeiro",
+             "opcoes": {"1": "processos", "2": "financeiro"}},
+            {"id": "processos", "mensagem": "Qual o número do processo?",
+             "salvar_como": "numero_processo", "proximo": "fim"},
+            {"id": "financeiro", "mensagem": "Vou te passar para o financeiro",
+             "transferir": true},
+            {"id": "fim", "mensagem": "Obrigado, {nome_contato}!", "fim": true}
+        ]}
+
+    Sem 'opcoes' nem 'proximo', segue para o passo seguinte da lista; o
+    último passo encerra o fluxo.
+    """
+
+    def __init__(self, fluxo_json):
+        passos = []
+        etapas = (fluxo_json or {}).get('steps') or []
+
+        for indice, etapa in enumerate(etapas):
+            passo_id = etapa.get('id', indice)
+            seguinte = etapas[indice + 1].get('id', indice + 1) if indice + 1 < len(etapas) else None
+            opcoes = {
+                str(chave).strip().lower(): destino
+                for chave, destino in (etapa.get('opcoes') or {}).items()
+            }
+            passos.append(Passo(
+                id=passo_id,
+                mensagem=etapa.get('mensagem', ''),
+                opcoes=MappingProxyType(opcoes),
+                proximo=etapa.get('proximo', seguinte),
+                salvar_como=etapa.get('salvar_como'),
+                transferir=bool(etapa.get('transferir')),
+                fim=bool(etapa.get('fim')) or (seguinte is None and not opcoes and 'proximo' not in etapa),
+                mensagem_invalida=etapa.get('mensagem_invalida', MENSAGEM_OPCAO_INVALIDA),
+            ))
+
+        self.passos = MappingProxyType({passo.id: passo for passo in passos})
+        self.inicio = passos[0].id if passos else None
+
+    def __bool__(self):
+        return self.inicio is not None
+
+    def passo(self, passo_id):
+        return self.passos.get(passo_id)
+
+    def proximo(self, passo_id, resposta):
+        """
+        Retorna (próximo_passo_id, válida) para a resposta do contato
+
+        Resposta fora das opções: (passo_id, False), o passo é repetido.
+        Fim do fluxo: (None, True).
+        """
+        passo = self.passos.get(passo_id)
+        if passo is None:
+            return None, True
+
+        if passo.opcoes:
+            destino = passo.opcoes.get((resposta or '').strip().lower())
+            if destino is None:
+                return passo_id, False
+            return destino, True
+
+        if passo.fim or passo.transferir:
+            return None, True
+        return passo.proximo, True
+
+
+# ========== CACHE POR ESCRITÓRIO ==========
+class ChatbotCompilado:
+    """Matcher + grafos + metadados dos fluxos ativos de um escritório"""
+
+    def __init__(self, fluxos):
+        self.matcher = MatcherChatbot(fluxos)
+        self.fluxos = {fluxo.id: fluxo for fluxo in fluxos}
+        self.grafos = {fluxo.id: GrafoFluxo(fluxo.fluxo_json) for fluxo in fluxos}
+
+
+_compilados = {}
+_compilados_lock = threading.Lock()
+
+
+def _chave_versao(escritorio_id):
+    return f'chatbot_versao_{escritorio_id}'
+
+
+def invalidar_matcher(escritorio_id):
+    """Chamado ao salvar/excluir FluxoChatbot: todos os processos recompilam"""
+    cache.set(_chave_versao(escritorio_id), uuid.uuid4().hex, None)
+    with _compilados_lock:
+        _compilados.pop(escritorio_id, None)
+
+
+def obter_chatbot(escritorio_id):
+    """Fluxos ativos do escritório compilados (matcher e grafos)"""
+    from ..models import FluxoChatbot
+
+    versao = cache.get(_chave_versao(escritorio_id))
+    if versao is None:
+        versao = uuid.uuid4().hex
+        # add(): não sobrescreve uma versão gravada por outro processo
+        if not cache.add(_chave_versao(escritorio_id), versao, None):
+            versao = cache.get(_chave_versao(escritorio_id), versao)
+
+    with _compilados_lock:
+        atual = _compilados.get(escritorio_id)
+    if atual and atual[0] == versao:
+        return atual[1]
+
+    # Estatísticas e auditoria ficam de fora: só o necessário para executar
+    fluxos = FluxoChatbot.objects.filter(escritorio_id=escritorio_id, ativo=True).only(
+        'id', 'nome', 'ordem', 'palavras_chave', 'expressoes_regulares', 'fluxo_json',
+        'responder_automaticamente', 'transferir_humano', 'usuario_transferencia',
+        'mensagem_transferencia',
+    )
+    compilado = ChatbotCompilado(list(fluxos))
+
+    with _compilados_lock:
+        _compilados[escritorio_id] = (versao, compilado)
+    return compilado
+
+
+def obter_matcher(escritorio_id):
+    """Matcher compilado dos fluxos ativos do escritório"""
+    return obter_chatbot(escritorio_id).matcher
+
+
+def fluxos_ativados(escritorio_id, mensagem):
+    """IDs dos fluxos do escritório ativados pela mensagem, ordenados por 'ordem'"""
+    return obter_matcher(escritorio_id).buscar(mensagem)
+
+
+# ========== SESSÕES ==========
+# Sessões salvas/encerradas na transação atual, gravadas no Redis só no commit
+_local = threading.local()
+_AUSENTE = object()
+
+
+def _chave_sessao(chave):
+    return f'chatbot_sessao_{chave}'
+
+
+def _pendentes():
+    if not hasattr(_local, 'sessoes'):
+        _local.sessoes = {}
+    return _local.sessoes
+
+
+def _agendar(chave, sessao):
+    """Guarda a sessão (None: encerrada) até o commit da transação atual"""
+    def gravar():
+        pendentes = _pendentes().get(chave, [])
+        pendentes[:] = [item for item in pendentes if item[1] is not gravar]
+        if not pendentes:
+            _pendentes().pop(chave, None)
+        if sessao is None:
+            _apagar_sessao(chave)
+        else:
+            _gravar_sessao(chave, sessao)
+
+    _pendentes().setdefault(chave, []).append((sessao, gravar))
+    transaction.on_commit(gravar)
+
+
+def _sessao_pendente(chave):
+    """
+    Sessão ainda não gravada desta transação (mensagens em lote do mesmo contato)
+
+    Rollback (da transação ou de um savepoint) descarta o on_commit; a
+    sessão pendente correspondente deixa de valer e vale a anterior.
+    """
+    pendentes = _pendentes().get(chave)
+    if not pendentes:
+        return _AUSENTE
+
+    agendados = transaction.get_connection().run_on_commit
+    pendentes[:] = [
+        (sessao, gravar) for sessao, gravar in pendentes
+        if any(registro[1] is gravar for registro in agendados)
+    ]
+    if not pendentes:
+        del _pendentes()[chave]
+        return _AUSENTE
+    return copy.deepcopy(pendentes[-1][0])
+
+
+def carregar_sessao(chave):
+    """Estado da sessão {'fluxo', 'passo', 'dados'} ou None (transação, Redis, banco)"""
+    from ..models import SessaoChatbot
+
+    sessao = _sessao_pendente(chave)
+    if sessao is not _AUSENTE:
+        return sessao
+
+    try:
+        sessao = cache.get(_chave_sessao(chave))
+    except Exception as e:
+        logger.warning(f'Cache de sessões do chatbot indisponível: {str(e)}')
+        sessao = None
+
+    if sessao is not None:
+        return sessao
+
+    # Fallback: sessão gravada no banco enquanto o Redis estava fora do ar
+    registro = SessaoChatbot.objects.filter(chave=chave, expira_em__gt=timezone.now()).first()
+    if registro is None:
+        return None
+    # Consumida: o próximo passo vai para o Redis (ou volta ao banco, se ainda fora do ar)
+    registro.delete()
+    return {'fluxo': registro.fluxo_id, 'passo': registro.passo, 'dados': registro.dados}
+
+
+def _gravar_sessao(chave, sessao):
+    """Redis; o banco só recebe a sessão se o cache falhar"""
+    from ..models import SessaoChatbot
+
+    ttl = settings.CHATBOT_SESSAO_TTL
+    try:
+        cache.set(_chave_sessao(chave), sessao, ttl)
+    except Exception as e:
+        logger.warning(f'Cache de sessões do chatbot indisponível, gravando no banco: {str(e)}')
+        SessaoChatbot.objects.update_or_create(chave=chave, defaults={
+            'fluxo_id': sessao['fluxo'],
+            'passo': sessao['passo'],
+            'dados': sessao['dados'],
+            'expira_em': timezone.now() + timedelta(seconds=ttl),
+        })
+
+
+def salvar_sessao(chave, sessao):
+    """
+    Grava a sessão depois do commit: um rollback na resposta não deixa o
+    contato em um passo que não aconteceu. Nenhuma escrita no banco se o
+    Redis estiver no ar.
+    """
+    _agendar(chave, copy.deepcopy(sessao))
+
+
+def _apagar_sessao(chave):
+    try:
+        cache.delete(_chave_sessao(chave))
+    except Exception as e:
+        logger.warning(f'Cache de sessões do chatbot indisponível: {str(e)}')
+
+
+def encerrar_sessao(chave):
+    from ..models import SessaoChatbot
+
+    SessaoChatbot.objects.filter(chave=chave).delete()
+    _agendar(chave, None)
+
+
+# ========== EXECUÇÃO ==========
+_CAMPO = re.compile(r'\{(\w+)\}')
+
+
+def formatar_mensagem(texto, dados):
+    """Substitui {campo} pelos dados da sessão (campos desconhecidos ficam como estão)"""
+    return _CAMPO.sub(lambda m: str(dados.get(m.group(1), m.group(0))), texto or '')
+
+
+def responder_mensagem(config, mensagem):
+    """
+    Executa o chatbot para uma mensagem recebida
+
+    - Com sessão em andamento: avança o passo conforme a resposta
+    - Sem sessão: inicia o primeiro fluxo ativado (por 'ordem')
+
+    Retorna a lista de MensagemWhatsApp de resposta criadas (envio em
+    background por core.tasks.enviar_mensagem_whatsapp). Uma falha no passo
+    desfaz só o savepoint da resposta: a sessão é encerrada, a falha fica
+    registrada no fluxo e a lista volta vazia, sem propagar o erro (quem
+    chama desfaria o registro junto).
+    """
+    from ..models import ConversaWhatsApp, FluxoChatbot, MensagemWhatsApp
+    from .realtime import publicar_mensagens
+    from .whatsapp_envio import enfileirar_envio
+
+    chave = f'{config.id}:{mensagem.numero_contato}'
+    compilado = obter_chatbot(config.escritorio_id)
+    sessao = carregar_sessao(chave)
+    inicio = time.monotonic()
+
+    if sessao and sessao['fluxo'] not in compilado.fluxos:
+        # Fluxo desativado/excluído no meio da conversa
+        encerrar_sessao(chave)
+        sessao = None
+
+    if sessao:
+        fluxo = compilado.fluxos[sessao['fluxo']]
+        grafo = compilado.grafos[fluxo.id]
+        passo_atual = grafo.passo(sessao['passo'])
+
+        if passo_atual and passo_atual.salvar_como:
+            sessao['dados'][passo_atual.salvar_como] = mensagem.conteudo
+
+        proximo_id, valida = grafo.proximo(sessao['passo'], mensagem.conteudo)
+        if not valida:
+            textos = [passo_atual.mensagem_invalida]
+            proximo_id = sessao['passo']
+        else:
+            textos = []
+    else:
+        fluxo = None
+        for fluxo_id in compilado.matcher.buscar(mensagem.conteudo):
+            candidato = compilado.fluxos[fluxo_id]
+            if candidato.responder_automaticamente and compilado.grafos[fluxo_id]:
+                fluxo = candidato
+                break
+
+        if fluxo is None:
+            return []
+
+        grafo = compilado.grafos[fluxo.id]
+        proximo_id = grafo.inicio
+        sessao = {'fluxo': fluxo.id, 'passo': proximo_id, 'dados': {'nome_contato': mensagem.nome_contato}}
+        textos = []
+        FluxoChatbot.registrar_execucao(fluxo.id, iniciado=True)
+
+    try:
+        with transaction.atomic():
+            passo = grafo.passo(proximo_id) if proximo_id is not None else None
+            encerrar = passo is None
+            transferir = False
+
+            if passo is not None and textos == []:
+                textos.append(formatar_mensagem(passo.mensagem, sessao['dados']))
+                encerrar = passo.fim or passo.transferir
+                transferir = passo.transferir or (passo.fim and fluxo.transferir_humano)
+
+            if transferir and fluxo.mensagem_transferencia:
+                textos.append(formatar_mensagem(fluxo.mensagem_transferencia, sessao['dados']))
+
+            respostas = []
+            for texto in textos:
+                if not texto:
+                    continue
+                resposta = mensagem.responder(texto)
+                enfileirar_envio(resposta)
+                respostas.append(resposta)
+            publicar_mensagens(respostas)
+
+            MensagemWhatsApp.objects.filter(pk=mensagem.pk).update(respondida_bot=True)
+
+            if transferir and fluxo.usuario_transferencia_id:
+                ConversaWhatsApp.objects.filter(
+                    whatsapp_config=config,
+                    numero_contato=mensagem.numero_contato,
+                ).update(usuario_atribuido_id=fluxo.usuario_transferencia_id)
+
+            if encerrar:
+                encerrar_sessao(chave)
+            else:
+                sessao['passo'] = proximo_id
+                salvar_sessao(chave, sessao)
+
+    except Exception as e:
+        logger.error(f'Erro no fluxo {fluxo.id} para {mensagem.numero_contato}: {str(e)}')
+        encerrar_sessao(chave)
+        FluxoChatbot.registrar_execucao(fluxo.id, sucesso=False)
+        return []
+
+    if encerrar:
+        FluxoChatbot.registrar_execucao(
+            fluxo.id,
+            sucesso=True,
+            tempo_ms=(time.monotonic() - inicio) * 1000,
+        )
+
+    return respostas
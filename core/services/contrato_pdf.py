@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+PDF dos contratos de honorários (reportlab), gerado nos workers Celery
+
+- As cláusulas aceitam variáveis ({{ cliente.nome }}, {{ processo.numero_cnj }},
+  ...): só as de VARIAVEIS_CLAUSULAS, já formatadas como texto; qualquer
+  outra some do texto. Não é template do Django: o texto é do usuário e
+  não pode navegar pelos models (senha, chaves de API)
+- Estilos e fontes TTF (CONTRATO_PDF_FONTE / CONTRATO_PDF_FONTE_NEGRITO)
+  são carregados uma vez por processo (lru_cache)
+- O conteúdo do PDF (texto renderizado, partes, valores e parcelas) gera um
+  SHA-256; o arquivo é gravado com esse hash no nome e o contrato guarda o
+  hash em pdf_gerado_hash. Se nada mudou, não renderiza de novo
+- contrato_pdf continua sendo o upload do contrato assinado; o gerado fica
+  em pdf_gerado
+"""
+import hashlib
+import io
+import json
+import logging
+import re
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from ..models import ContratoHonorarios
+
+logger = logging.getLogger(__name__)
+
+# Mudanças no layout entram no hash: todos os PDFs são refeitos uma vez
+VERSAO_LAYOUT = 1
+
+PASTA = 'contratos_honorarios/gerados'
+
+
+# Variáveis aceitas nas cláusulas: '{{ nome }}' -> descrição
+VARIAVEIS_CLAUSULAS = {
+    'cliente.nome': 'Nome/razão social do cliente',
+    'cliente.cpf_cnpj': 'CPF/CNPJ do cliente',
+    'cliente.endereco': 'Endereço completo do cliente',
+    'cliente.cidade': 'Cidade do cliente',
+    'cliente.estado': 'UF do cliente',
+    'cliente.email': 'E-mail do cliente',
+    'cliente.telefone': 'Telefone do cliente',
+    'processo.numero_cnj': 'Número do processo',
+    'processo.vara': 'Vara',
+    'processo.comarca': 'Comarca',
+    'processo.tribunal': 'Tribunal',
+    'escritorio.nome': 'Nome do escritório',
+    'escritorio.razao_social': 'Razão social do escritório',
+    'escritorio.cnpj': 'CNPJ do escritório',
+    'escritorio.endereco': 'Endereço do escritório',
+    'contrato.tipo': 'Tipo de honorários',
+    'contrato.valor_total': 'Valor total (R$)',
+    'contrato.forma_pagamento': 'Forma de pagamento',
+    'contrato.numero_parcelas': 'Número de parcelas',
+    'contrato.dia_vencimento': 'Dia de vencimento das parcelas',
+    'contrato.percentual_sucesso': 'Percentual de sucesso',
+    'contrato.valor_hora': 'Valor por hora (R$)',
+    'contrato.data_assinatura': 'Data de assinatura',
+}
+
+VARIAVEL = re.compile(r'\{\{\s*([\w.]+)\s*\}\}')
+
+
+# ========== CACHES (por processo do worker) ==========
+@lru_cache(maxsize=None)
+def _fontes():
+    """(normal, negrito); TTFs configuradas são lidas e registradas uma vez"""
+    normal, negrito = 'Helvetica', 'Helvetica-Bold'
+    if settings.CONTRATO_PDF_FONTE:
+        pdfmetrics.registerFont(TTFont('ContratoNormal', settings.CONTRATO_PDF_FONTE))
+        normal = negrito = 'ContratoNormal'
+    if settings.CONTRATO_PDF_FONTE_NEGRITO:
+        pdfmetrics.registerFont(TTFont('ContratoNegrito', settings.CONTRATO_PDF_FONTE_NEGRITO))
+        negrito = 'ContratoNegrito'
+    return normal, negrito
+
+
+@lru_cache(maxsize=None)
+def _estilos():
+    normal, negrito = _fontes()
+    return {
+        'titulo': ParagraphStyle('titulo', fontName=negrito, fontSize=13, leading=17, alignment=TA_CENTER, spaceAfter=14),
+        'secao': ParagraphStyle('secao', fontName=negrito, fontSize=10.5, leading=14, spaceBefore=10, spaceAfter=4),
+        'texto': ParagraphStyle('texto', fontName=normal, fontSize=10, leading=14, alignment=TA_JUSTIFY, spaceAfter=6),
+        'assinatura': ParagraphStyle('assinatura', fontName=normal, fontSize=10, leading=13, alignment=TA_CENTER),
+    }
+
+
+# ========== CONTEÚDO ==========
+def _moeda(valor):
+    return 'R$ ' + f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def _data(valor):
+    return valor.strftime('%d/%m/%Y') if valor else ''
+
+
+def _endereco_cliente(cliente):
+    return ', '.join(filter(None, [
+        cliente.endereco, cliente.numero, cliente.complemento, cliente.bairro,
+        f'{cliente.cidade}/{cliente.estado}' if cliente.cidade else '', cliente.cep,
+    ]))
+
+
+def variaveis_clausulas(contrato):
+    """Valores (texto) das VARIAVEIS_CLAUSULAS do contrato"""
+    processo = contrato.processo
+    escritorio = processo.escritorio
+    cliente = contrato.cliente
+
+    valores = {
+        'cliente.nome': cliente.nome,
+        'cliente.cpf_cnpj': cliente.cpf_cnpj,
+        'cliente.endereco': _endereco_cliente(cliente),
+        'cliente.cidade': cliente.cidade,
+        'cliente.estado': cliente.estado,
+        'cliente.email': cliente.email,
+        'cliente.telefone': cliente.telefone,
+        'processo.numero_cnj': processo.numero_cnj,
+        'processo.vara': processo.vara,
+        'processo.comarca': processo.comarca,
+        'processo.tribunal': processo.tribunal,
+        'escritorio.nome': escritorio.nome,
+        'escritorio.razao_social': escritorio.razao_social,
+        'escritorio.cnpj': escritorio.cnpj,
+        'escritorio.endereco': escritorio.endereco,
+        'contrato.tipo': contrato.get_tipo_display(),
+        'contrato.valor_total': _moeda(contrato.valor_total),
+        'contrato.forma_pagamento': contrato.get_forma_pagamento_display(),
+        'contrato.numero_parcelas': contrato.numero_parcelas,
+        'contrato.dia_vencimento': contrato.dia_vencimento,
+        'contrato.percentual_sucesso': (
+            f'{contrato.percentual_sucesso:.2f}%'.replace('.', ',') if contrato.percentual_sucesso is not None else ''
+        ),
+        'contrato.valor_hora': _moeda(contrato.valor_hora) if contrato.valor_hora is not None else '',
+        'contrato.data_assinatura': _data(contrato.data_assinatura),
+    }
+    return {nome: '' if valor is None else str(valor) for nome, valor in valores.items()}
+
+
+def preencher_clausulas(texto, variaveis):
+    """Troca '{{ nome }}' pelo valor; nomes fora de 'variaveis' viram texto vazio"""
+    return VARIAVEL.sub(lambda m: variaveis.get(m.group(1), ''), texto)
+
+
+def consulta_contratos():
+    """Contratos com tudo o que o PDF lê: 3 consultas para qualquer quantidade"""
+    return ContratoHonorarios.objects.select_related(
+        'processo__escritorio', 'cliente'
+    ).prefetch_related('parcelas')
+
+
+def conteudo(contrato):
+    """Tudo o que aparece no PDF, já formatado (base do hash e da renderização)"""
+    processo = contrato.processo
+    escritorio = processo.escritorio
+    cliente = contrato.cliente
+
+    clausulas = preencher_clausulas(contrato.clausulas, variaveis_clausulas(contrato))
+    clausulas = clausulas.replace('\r\n', '\n')
+
+    return {
+        'versao': VERSAO_LAYOUT,
+        'contrato': contrato.pk,
+        'contratado': {
+            'nome': escritorio.razao_social or escritorio.nome,
+            'cnpj': escritorio.cnpj or '',
+            'endereco': escritorio.endereco,
+        },
+        'contratante': {
+            'nome': cliente.nome,
+            'documento': cliente.cpf_cnpj,
+            'endereco': _endereco_cliente(cliente),
+        },
+        'processo': {
+            'numero': processo.numero_cnj,
+            'vara': processo.vara,
+            'comarca': processo.comarca,
+        },
+        'honorarios': [
+            ['Tipo', contrato.get_tipo_display()],
+            ['Valor total', _moeda(contrato.valor_total)],
+            ['Forma de pagamento', contrato.get_forma_pagamento_display()],
+        ] + (
+            [['Percentual de sucesso', f'{contrato.percentual_sucesso:.2f}%'.replace('.', ',')]]
+            if contrato.tipo in ('sucesso', 'misto') else []
+        ) + (
+            [['Valor por hora', _moeda(contrato.valor_hora)]] if contrato.tipo == 'horista' else []
+        ),
+        'parcelas': [
+            [str(p.numero), _data(p.data_vencimento), _moeda(p.valor)]
+            for p in sorted(contrato.parcelas.all(), key=lambda p: p.numero)
+        ],
+        'clausulas': [bloco.strip() for bloco in clausulas.split('\n\n') if bloco.strip()],
+        'observacoes': contrato.observacoes,
+        'data': _data(contrato.data_assinatura or timezone.localtime(contrato.criado_em).date()),
+        'cidade': cliente.cidade or processo.comarca,
+    }
+
+
+def hash_conteudo(dados):
+    texto = json.dumps(dados, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+# ========== RENDERIZAÇÃO ==========
+def _paragrafo(texto, estilo):
+    # Quebras de linha simples dentro de um bloco viram <br/>
+    return Paragraph(escape(texto).replace('\n', '<br/>'), estilo)
+
+
+def renderizar(dados):
+    """Bytes do PDF"""
+    estilos = _estilos()
+    normal, negrito = _fontes()
+    texto = estilos['texto']
+
+    tabela_estilo = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), normal),
+        ('FONTSIZE', (0, 0), (-1, -1), 9.5),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ])
+
+    contratado = dados['contratado']
+    contratante = dados['contratante']
+    processo = dados['processo']
+
+    historia = [
+        _paragrafo('CONTRATO DE PRESTAÇÃO DE SERVIÇOS ADVOCATÍCIOS', estilos['titulo']),
+        _paragrafo('PARTES', estilos['secao']),
+        _paragrafo(
+            f"CONTRATANTE: {contratante['nome']}"
+            + (f", CPF/CNPJ {contratante['documento']}" if contratante['documento'] else '')
+            + (f", residente em {contratante['endereco']}" if contratante['endereco'] else '') + '.',
+            texto
+        ),
+        _paragrafo(
+            f"CONTRATADO: {contratado['nome']}"
+            + (f", CNPJ {contratado['cnpj']}" if contratado['cnpj'] else '')
+            + (f", com sede em {contratado['endereco']}" if contratado['endereco'] else '') + '.',
+            texto
+        ),
+        _paragrafo('OBJETO', estilos['secao']),
+        _paragrafo(
+            f"Patrocínio do processo nº {processo['numero']}, em trâmite na {processo['vara']}"
+            f" da comarca de {processo['comarca']}.",
+            texto
+        ),
+        _paragrafo('HONORÁRIOS', estilos['secao']),
+    ]
+
+    honorarios = Table(dados['honorarios'], colWidths=[5 * cm, 11 * cm], hAlign='LEFT')
+    honorarios.setStyle(tabela_estilo)
+    historia.append(honorarios)
+
+    if dados['parcelas']:
+        historia.append(_paragrafo('PARCELAS', estilos['secao']))
+        parcelas = Table(
+            [['Parcela', 'Vencimento', 'Valor']] + dados['parcelas'],
+            colWidths=[3 * cm, 5 * cm, 5 * cm], hAlign='LEFT', repeatRows=1
+        )
+        parcelas.setStyle(tabela_estilo)
+        parcelas.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, 0), negrito),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (2, 1), (2, -1), 'RIGHT'),
+        ]))
+        historia.append(parcelas)
+
+    historia.append(_paragrafo('CLÁUSULAS', estilos['secao']))
+    historia.extend(_paragrafo(bloco, texto) for bloco in dados['clausulas'])
+
+    if dados['observacoes']:
+        historia.append(_paragrafo('OBSERVAÇÕES', estilos['secao']))
+        historia.append(_paragrafo(dados['observacoes'], texto))
+
+    historia += [
+        Spacer(1, 0.8 * cm),
+        _paragrafo(f"{dados['cidade']}, {dados['data']}.", texto),
+        Spacer(1, 1.6 * cm),
+        _paragrafo(f"_______________________________\n{contratante['nome']}", estilos['assinatura']),
+        Spacer(1, 1.2 * cm),
+        _paragrafo(f"_______________________________\n{contratado['nome']}", estilos['assinatura']),
+    ]
+
+    buffer = io.BytesIO()
+    documento = SimpleDocTemplate(
+        buffer, pagesize=A4,
+        leftMargin=2.5 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+        title=f"Contrato de honorários - {processo['numero']}",
+    )
+    documento.build(historia)
+    return buffer.getvalue()
+
+
+# ========== GERAÇÃO ==========
+def gerar_pdf(contrato, forcar=False):
+    """
+    Gera o PDF do contrato se o conteúdo mudou; retorna True se renderizou
+
+    'contrato' deve vir de consulta_contratos() (relações já carregadas).
+    """
+    dados = conteudo(contrato)
+    hash_ = hash_conteudo(dados)
+    nome = f'{PASTA}/{hash_[:2]}/{hash_}.pdf'
+
+    if not forcar and hash_ == contrato.pdf_gerado_hash and default_storage.exists(nome):
+        return False
+
+    if forcar or not default_storage.exists(nome):
+        conteudo_pdf = renderizar(dados)
+        if default_storage.exists(nome):
+            default_storage.delete(nome)
+        nome = default_storage.save(nome, ContentFile(conteudo_pdf))
+
+    anterior = contrato.pdf_gerado.name
+    ContratoHonorarios.objects.filter(pk=contrato.pk).update(
+        pdf_gerado=nome,
+        pdf_gerado_hash=hash_,
+        pdf_gerado_em=timezone.now(),
+    )
+    # O hash inclui o id do contrato: o arquivo anterior não é de mais ninguém
+    if anterior and anterior != nome:
+        default_storage.delete(anterior)
+
+    logger.info(f'PDF do contrato {contrato.pk} gerado ({hash_[:12]})')
+    return True
+
+
+def gerar_pdfs(contratos, forcar=False):
+    """Gera os PDFs de vários contratos; retorna (renderizados, inalterados)"""
+    renderizados = inalterados = 0
+    for contrato in contratos:
+        try:
+            if gerar_pdf(contrato, forcar=forcar):
+                renderizados += 1
+            else:
+                inalterados += 1
+        except Exception as e:
+            # Um contrato com problema não interrompe o lote
+            logger.error(f'Erro ao gerar PDF do contrato {contrato.pk}: {str(e)}')
+    return renderizados, inalterados
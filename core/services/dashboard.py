@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Indicadores do cabeçalho/dashboard (core.context_processors.dashboard_context)
+
+Uma única consulta por escritório (subqueries de contagem) guardada no
+cache por DASHBOARD_CACHE_TTL segundos. Escritas em Processo, Cliente,
+Prazo, Audiencia e MensagemWhatsApp invalidam o cache do escritório
+(core.signals).
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _chave(escritorio_id, hoje):
+    # Data na chave: 'prazos_hoje' e audiências viram o dia sozinhos
+    return f'dashboard_{escritorio_id}_{hoje.isoformat()}'
+
+
+def calcular_metricas(escritorio_id, hoje):
+    from ..models import (
+        Audiencia, Cliente, ConversaWhatsApp, Escritorio, Prazo, Processo,
+    )
+    from ..models.utils import SubqueryCount, SubquerySum
+
+    contagens = Escritorio.objects.filter(pk=escritorio_id).annotate(
+        processos_count=SubqueryCount(
+            Processo.objects.filter(escritorio=OuterRef('pk'), situacao='ativo')
+        ),
+        clientes_count=SubqueryCount(
+            Cliente.objects.filter(escritorio=OuterRef('pk'), ativo=True)
+        ),
+        prazos_hoje=SubqueryCount(
+            Prazo.objects.filter(
+                processo__escritorio=OuterRef('pk'),
+                data_limite=hoje,
+                status='pendente'
+            )
+        ),
+        # Contadores mantidos incrementalmente nas conversas (sem varrer mensagens)
+        mensagens_nao_lidas=SubquerySum(
+            ConversaWhatsApp.objects.filter(whatsapp_config__escritorio=OuterRef('pk')),
+            'mensagens_nao_lidas'
+        ),
+    ).values('processos_count', 'clientes_count', 'prazos_hoje', 'mensagens_nao_lidas').first()
+
+    metricas = contagens or {
+        'processos_count': 0,
+        'clientes_count': 0,
+        'prazos_hoje': 0,
+        'mensagens_nao_lidas': 0,
+    }
+
+    # Próximas audiências (próximos 7 dias)
+    semana = hoje + timezone.timedelta(days=7)
+    metricas['proximas_audiencias'] = list(
+        Audiencia.objects.filter(
+            processo__escritorio_id=escritorio_id,
+            data__gte=hoje,
+            data__lte=semana,
+            status__in=['agendada', 'confirmada']
+        ).select_related('processo').order_by('data', 'hora')[:5]
+    )
+    return metricas
+
+
+def metricas_dashboard(escritorio_id):
+    hoje = timezone.localdate()
+    chave = _chave(escritorio_id, hoje)
+
+    metricas = cache.get(chave)
+    if metricas is None:
+        metricas = calcular_metricas(escritorio_id, hoje)
+        cache.set(chave, metricas, settings.DASHBOARD_CACHE_TTL)
+    return metricas
+
+
+def invalidar_dashboard(escritorio_id):
+    if escritorio_id:
+        cache.delete(_chave(escritorio_id, timezone.localdate()))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Aritmética de calendário para vencimentos
+
+Meses são somados no calendário (10/01 -> 10/02 -> 10/03), não em blocos
+de 30 dias; dias que não existem no mês caem no último dia (31/01 -> 28/02).
+"""
+import calendar
+from datetime import date
+
+
+def somar_meses(data, meses, dia=None):
+    """
+    data + meses, no dia 'dia' (padrão: o dia de 'data')
+
+    O dia é limitado ao último dia do mês de destino, sem acumular o ajuste:
+    somar_meses(31/01, 2) é 31/03, não 28/03.
+    """
+    indice = data.year * 12 + (data.month - 1) + meses
+    ano, mes = divmod(indice, 12)
+    mes += 1
+    ultimo_dia = calendar.monthrange(ano, mes)[1]
+    return date(ano, mes, min(dia or data.day, ultimo_dia))
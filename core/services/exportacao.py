@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação de listagens em CSV e XLSX com memória constante
+
+As linhas vêm de values_list(...).iterator(): o cursor é lido em blocos
+(EXPORTACAO_LOTE) e nenhuma instância de model é criada.
+- CSV: StreamingHttpResponse; cada linha é escrita na resposta assim que lida
+- XLSX: xlsxwriter em modo constant_memory (uma linha por vez no disco) em
+  um arquivo temporário, devolvido com FileResponse
+
+O mesmo gerador serve a task core.tasks.gerar_exportacao, que grava o
+arquivo no storage em vez de responder à requisição.
+"""
+import csv
+import logging
+import tempfile
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import xlsxwriter
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from ..models import Exportacao
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ['csv', 'xlsx']
+
+TIPOS_CONTEUDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Início de texto que a planilha interpretaria como fórmula (nome de cliente
+# '=HYPERLINK(...)' executaria ao abrir o arquivo)
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+# ========== LINHAS ==========
+def _choices(model, campo):
+    """{valor: rótulo} do campo (atravessa relações com __); None se não tiver choices"""
+    partes = campo.split('__')
+    try:
+        for parte in partes[:-1]:
+            model = model._meta.get_field(parte).related_model
+        field = model._meta.get_field(partes[-1])
+    except FieldDoesNotExist:
+        # Anotação da consulta (ex: nome completo do advogado)
+        return None
+    return dict(field.flatchoices) if field.choices else None
+
+
+def linhas(queryset, colunas):
+    """
+    Tuplas com os valores das colunas [(cabeçalho, campo), ...]
+
+    Campos com choices saem com o rótulo ('Pago/Recebido', não 'pago').
+    """
+    campos = [campo for _, campo in colunas]
+    rotulos = [_choices(queryset.model, campo) for campo in campos]
+
+    for linha in queryset.values_list(*campos).iterator(chunk_size=settings.EXPORTACAO_LOTE):
+        yield tuple(
+            rotulo.get(valor, valor) if rotulo else valor
+            for valor, rotulo in zip(linha, rotulos)
+        )
+
+
+def _local(valor):
+    # datetime do banco vem em UTC
+    return timezone.localtime(valor) if timezone.is_aware(valor) else valor
+
+
+# ========== CSV ==========
+class _Eco:
+    """Arquivo falso: csv.writer devolve a linha em vez de guardá-la"""
+
+    def write(self, valor):
+        return valor
+
+
+def _texto_csv(valor):
+    # Padrão do Excel em pt-BR: ';' como separador e vírgula decimal
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if isinstance(valor, Decimal):
+        return str(valor).replace('.', ',')
+    if isinstance(valor, datetime):
+        return _local(valor).strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        # Apóstrofo: o Excel mostra como texto
+        return f"'{valor}"
+    return valor
+
+
+def gerar_csv(queryset, colunas):
+    """Gerador de pedaços de texto do CSV (BOM, cabeçalho e linhas)"""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff'
+    yield escritor.writerow([cabecalho for cabecalho, _ in colunas])
+    for linha in linhas(queryset, colunas):
+        yield escritor.writerow([_texto_csv(valor) for valor in linha])
+
+
+# ========== XLSX ==========
+def escrever_xlsx(arquivo, queryset, colunas):
+    """Grava a planilha em 'arquivo' (caminho ou arquivo binário); retorna o nº de linhas"""
+    planilha = xlsxwriter.Workbook(arquivo, {
+        'constant_memory': True,
+        'default_date_format': 'dd/mm/yyyy',
+        'remove_timezone': True,
+        # Texto é sempre texto, nunca fórmula (write() trataria '=...' como fórmula)
+        'strings_to_formulas': False,
+    })
+    aba = planilha.add_worksheet()
+    negrito = planilha.add_format({'bold': True})
+    data_hora = planilha.add_format({'num_format': 'dd/mm/yyyy hh:mm'})
+    moeda = planilha.add_format({'num_format': '#,##0.00'})
+
+    aba.write_row(0, 0, [cabecalho for cabecalho, _ in colunas], negrito)
+    aba.freeze_panes(1, 0)
+
+    total = 0
+    for total, linha in enumerate(linhas(queryset, colunas), start=1):
+        for coluna, valor in enumerate(linha):
+            if valor is None:
+                continue
+            if isinstance(valor, Decimal):
+                aba.write_number(total, coluna, float(valor), moeda)
+            elif isinstance(valor, datetime):
+                aba.write_datetime(total, coluna, _local(valor), data_hora)
+            elif isinstance(valor, date):
+                aba.write_datetime(total, coluna, valor)
+            elif isinstance(valor, bool):
+                aba.write_string(total, coluna, 'Sim' if valor else 'Não')
+            elif isinstance(valor, str):
+                aba.write_string(total, coluna, valor)
+            else:
+                aba.write(total, coluna, valor)
+
+    planilha.close()
+    return total
+
+
+# ========== RESPOSTAS ==========
+def nome_arquivo(recurso, formato, momento=None):
+    """Nome do arquivo para o download (Content-Disposition)"""
+    return f'{recurso}_{timezone.localtime(momento):%Y%m%d_%H%M}.{formato}'
+
+
+def resposta_exportacao(queryset, colunas, formato, recurso):
+    """Resposta HTTP com o arquivo, sem montar o conteúdo inteiro em memória"""
+    nome = nome_arquivo(recurso, formato)
+
+    if formato == 'csv':
+        resposta = StreamingHttpResponse(gerar_csv(queryset, colunas), content_type=TIPOS_CONTEUDO['csv'])
+        resposta['Content-Disposition'] = f'attachment; filename="{nome}"'
+        return resposta
+
+    # Arquivo temporário anônimo: apagado quando a resposta fecha o arquivo
+    arquivo = tempfile.TemporaryFile()
+    escrever_xlsx(arquivo, queryset, colunas)
+    arquivo.seek(0)
+    return FileResponse(arquivo, as_attachment=True, filename=nome, content_type=TIPOS_CONTEUDO['xlsx'])
+
+
+# ========== SEGUNDO PLANO ==========
+def gerar_exportacao(exportacao, queryset, colunas):
+    """Gera o arquivo da Exportacao e grava no storage (core.tasks.gerar_exportacao)"""
+    Exportacao.objects.filter(pk=exportacao.pk).update(status='processando')
+
+    try:
+        with tempfile.TemporaryFile() as arquivo:
+            if exportacao.formato == 'csv':
+                pedacos = 0
+                for pedaco in gerar_csv(queryset, colunas):
+                    arquivo.write(pedaco.encode('utf-8'))
+                    pedacos += 1
+                total = pedacos - 2  # BOM e cabeçalho
+            else:
+                total = escrever_xlsx(arquivo, queryset, colunas)
+
+            arquivo.seek(0)
+            # Nome aleatório no storage: o download passa pela action autenticada
+            nome = f'{uuid.uuid4().hex}.{exportacao.formato}'
+            exportacao.arquivo.save(nome, File(arquivo), save=False)
+    except Exception as e:
+        logger.error(f'Erro na exportação {exportacao.pk}: {str(e)}')
+        exportacao.status = 'erro'
+        exportacao.erro = str(e)
+        exportacao.concluido_em = timezone.now()
+        exportacao.save(update_fields=['status', 'erro', 'concluido_em'])
+        return exportacao
+
+    exportacao.status = 'concluida'
+    exportacao.total_linhas = total
+    exportacao.concluido_em = timezone.now()
+    exportacao.save(update_fields=['arquivo', 'status', 'total_linhas', 'concluido_em'])
+    logger.info(f'Exportação {exportacao.pk}: {total} linhas ({exportacao.formato})')
+    return exportacao
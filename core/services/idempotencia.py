@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Filtro de IDs de webhook vistos recentemente
+
+Fica na frente do INSERT ... ON CONFLICT de WebhookEvent para que as
+retentativas em rajada do provider sejam respondidas sem ir ao banco.
+
+POR QUE NÃO UM BLOOM FILTER DE VERDADE:
+- Um falso positivo descartaria uma mensagem nova sem registro
+- Aqui só entram IDs que já estão gravados em WebhookEvent, então
+  "visto" é sempre verdade e o filtro nunca perde mensagens
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class FiltroIdsRecentes:
+    """
+    Conjunto de IDs em duas camadas:
+    - LRU limitado em memória do processo (sem ida à rede)
+    - Chaves com TTL no cache compartilhado (Redis), visíveis para todos os workers
+    """
+
+    def __init__(self, prefixo, capacidade, ttl):
+        self.prefixo = prefixo
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._locais = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _chave(self, webhook_id):
+        # Hash evita chaves longas ou com caracteres inválidos para o cache
+        return f"{self.prefixo}:{hashlib.sha1(str(webhook_id).encode()).hexdigest()}"
+
+    def _lembrar_local(self, webhook_id):
+        with self._lock:
+            self._locais[webhook_id] = True
+            self._locais.move_to_end(webhook_id)
+            while len(self._locais) > self.capacidade:
+                self._locais.popitem(last=False)
+
+    def contem(self, webhook_id):
+        """True se o webhook com certeza já foi registrado"""
+        with self._lock:
+            if webhook_id in self._locais:
+                self._locais.move_to_end(webhook_id)
+                return True
+
+        try:
+            visto = cache.get(self._chave(webhook_id))
+        except Exception as e:
+            # Cache fora do ar: o banco continua garantindo a idempotência
+            logger.warning(f'Filtro de webhooks indisponível: {str(e)}')
+            return False
+
+        if visto:
+            self._lembrar_local(webhook_id)
+            return True
+        return False
+
+    def adicionar(self, *webhook_ids):
+        """Marca IDs como registrados (chamar só depois do INSERT/conflito no banco)"""
+        for webhook_id in webhook_ids:
+            self._lembrar_local(webhook_id)
+
+        try:
+            cache.set_many({self._chave(w): 1 for w in webhook_ids}, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f'Filtro de webhooks indisponível: {str(e)}')
+
+
+webhooks_recentes = FiltroIdsRecentes(
+    prefixo='webhook_visto',
+    capacidade=settings.WHATSAPP_WEBHOOK_FILTRO_CAPACIDADE,
+    ttl=settings.WHATSAPP_WEBHOOK_FILTRO_TTL,
+)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Cálculo do retrato MetricasEscritorio
+
+Três consultas por escritório, todas agregadas no banco:
+- contagens (subqueries independentes, sem JOIN entre as tabelas)
+- processos agrupados por (tipo, situação)
+- receitas/despesas agrupadas por mês de vencimento
+"""
+import logging
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Count, OuterRef, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from ..models import Cliente, Escritorio, Financeiro, MetricasEscritorio, Processo, Usuario
+from ..models.utils import SubqueryCount
+
+logger = logging.getLogger(__name__)
+
+
+def chave_mes(data):
+    return data.strftime('%Y-%m')
+
+
+def atualizar_metricas(escritorio_id):
+    """Recalcula e grava o retrato do escritório; retorna a instância atualizada"""
+    metricas, _ = MetricasEscritorio.objects.get_or_create(escritorio_id=escritorio_id)
+
+    # Limpa a marca ANTES de calcular: escritas durante o cálculo marcam de novo
+    MetricasEscritorio.objects.filter(pk=metricas.pk).update(desatualizado=False)
+
+    contagens = Escritorio.objects.filter(pk=escritorio_id).annotate(
+        qtd_usuarios=SubqueryCount(Usuario.objects.filter(escritorio=OuterRef('pk'))),
+        qtd_clientes=SubqueryCount(Cliente.objects.filter(escritorio=OuterRef('pk'))),
+    ).values('qtd_usuarios', 'qtd_clientes').first() or {'qtd_usuarios': 0, 'qtd_clientes': 0}
+
+    por_tipo = {}
+    por_situacao = {}
+    for linha in Processo.objects.filter(escritorio_id=escritorio_id).order_by().values(
+        'tipo', 'situacao'
+    ).annotate(total=Count('id')):
+        por_tipo[linha['tipo']] = por_tipo.get(linha['tipo'], 0) + linha['total']
+        por_situacao[linha['situacao']] = por_situacao.get(linha['situacao'], 0) + linha['total']
+
+    mensal = {}
+    for linha in Financeiro.objects.filter(
+        escritorio_id=escritorio_id,
+        tipo__in=['receita', 'despesa']
+    ).order_by().annotate(
+        mes=TruncMonth('data_vencimento')
+    ).values('mes', 'tipo').annotate(total=Sum('valor')):
+        mes = mensal.setdefault(chave_mes(linha['mes']), {'receitas': '0.00', 'despesas': '0.00'})
+        # Decimal como string: JSON sem perda de centavos
+        mes['receitas' if linha['tipo'] == 'receita' else 'despesas'] = str(linha['total'] or Decimal('0.00'))
+
+    metricas.total_usuarios = contagens['qtd_usuarios']
+    metricas.total_clientes = contagens['qtd_clientes']
+    metricas.total_processos = sum(por_situacao.values())
+    metricas.processos_ativos = por_situacao.get('ativo', 0)
+    metricas.processos_por_tipo = por_tipo
+    metricas.processos_por_situacao = por_situacao
+    metricas.financeiro_mensal = dict(sorted(mensal.items()))
+    metricas.calculado_em = timezone.now()
+    metricas.desatualizado = False
+
+    campos = [
+        'total_usuarios', 'total_clientes', 'total_processos', 'processos_ativos',
+        'processos_por_tipo', 'processos_por_situacao', 'financeiro_mensal', 'calculado_em',
+    ]
+    metricas.save(update_fields=campos)
+
+    return metricas
+
+
+def obter_metricas(escritorio_id):
+    """Retrato atual (calcula na hora se o escritório ainda não tiver um)"""
+    metricas = MetricasEscritorio.objects.filter(escritorio_id=escritorio_id).first()
+    if metricas is None or metricas.calculado_em is None:
+        metricas = atualizar_metricas(escritorio_id)
+    return metricas
+
+
+def interpretar_periodo(periodo):
+    """
+    '?periodo=AAAA-MM,AAAA-MM' -> (inicio, fim) como 'AAAA-MM'
+
+    Um só mês ('AAAA-MM') vale como início e fim. ValueError se inválido.
+    """
+    partes = [parte.strip() for parte in periodo.split(',')]
+    if len(partes) == 1:
+        partes = partes * 2
+    if len(partes) != 2:
+        raise ValueError('Use periodo=AAAA-MM,AAAA-MM')
+
+    meses = []
+    for parte in partes:
+        ano, mes = parte.split('-')
+        meses.append(date(int(ano), int(mes), 1))
+
+    inicio, fim = meses
+    if inicio > fim:
+        raise ValueError('Início do período depois do fim')
+    # Chaves comparadas como texto (4 dígitos no ano) e totais até o 1º dia
+    # do mês seguinte ao fim, que não existe em 9999-12
+    if inicio.year < 1000 or fim >= date(9999, 12, 1):
+        raise ValueError('Ano fora do intervalo suportado')
+    return chave_mes(inicio), chave_mes(fim)
+
+
+def financeiro_no_periodo(metricas, inicio, fim):
+    """Meses do rollup dentro do período, com totais"""
+    meses = {
+        mes: valores
+        for mes, valores in metricas.financeiro_mensal.items()
+        if inicio <= mes <= fim
+    }
+    receitas = sum((Decimal(v['receitas']) for v in meses.values()), Decimal('0.00'))
+    despesas = sum((Decimal(v['despesas']) for v in meses.values()), Decimal('0.00'))
+    return {
+        'inicio': inicio,
+        'fim': fim,
+        'meses': meses,
+        'receitas': receitas,
+        'despesas': despesas,
+        'saldo': receitas - despesas,
+    }
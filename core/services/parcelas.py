@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Geração das parcelas de um contrato de honorários
+
+O cronograma inteiro é calculado em memória e comparado com as parcelas
+existentes (por número):
+- parcelas pagas (ou com pagamento parcial) ficam como estão; o saldo do
+  contrato é dividido entre as demais
+- parcelas em aberto são atualizadas só se valor/vencimento mudaram
+- números que faltam são criados; números além do total são removidos
+
+Cada ParcelaHonorarios tem o seu lançamento em Financeiro (OneToOne), então
+regenerar não duplica receitas. Tudo sai em poucos comandos (bulk_create /
+bulk_update / delete), qualquer que seja o número de parcelas.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ContratoHonorarios, Financeiro, MetricasEscritorio, ParcelaHonorarios
+from .datas import somar_meses
+from .resumo_financeiro import invalidar_resumo_financeiro
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_DESCRICAO = 'Honorários - Parcela '
+
+
+def dividir_valor(total, partes):
+    """Divide em 'partes' valores com centavos exatos (os primeiros recebem o resto)"""
+    if partes <= 0:
+        return []
+    centavos = int((Decimal(total) * 100).to_integral_value())
+    base, resto = divmod(centavos, partes)
+    return [Decimal(base + (1 if i < resto else 0)) / 100 for i in range(partes)]
+
+
+def parcela_paga(parcela):
+    """Parcela com pagamento registrado (não é mais recalculada)"""
+    if parcela.status == 'paga':
+        return True
+    lancamento = parcela.lancamento
+    return lancamento is not None and (lancamento.valor_pago > 0 or lancamento.status in ('pago', 'parcial'))
+
+
+def _lancamentos_antigos(contrato):
+    """
+    Lançamentos de parcelas gerados antes do vínculo com ParcelaHonorarios
+
+    Retorna ({numero: lançamento}, [sobras]); com repetidos do mesmo número,
+    fica o que tem pagamento ou o mais recente.
+    """
+    antigos = Financeiro.objects.filter(
+        processo_id=contrato.processo_id,
+        tipo='receita',
+        categoria='honorarios',
+        descricao__startswith=PREFIXO_DESCRICAO,
+        parcela_honorarios__isnull=True,
+    ).order_by('parcela_atual', '-valor_pago', '-criado_em')
+
+    por_numero = {}
+    sobras = []
+    for lancamento in antigos:
+        if lancamento.parcela_atual in por_numero:
+            sobras.append(lancamento)
+        else:
+            por_numero[lancamento.parcela_atual] = lancamento
+    return por_numero, sobras
+
+
+def gerar_parcelas(contrato):
+    """
+    Cria/atualiza as parcelas do contrato e os lançamentos vinculados
+
+    Retorna {'criadas': n, 'atualizadas': n, 'removidas': n}.
+    """
+    hoje = timezone.localdate()
+
+    with transaction.atomic():
+        # Trava o contrato: duas regenerações simultâneas não se misturam
+        contrato = ContratoHonorarios.objects.select_for_update(of=('self',)).select_related(
+            'processo'
+        ).get(pk=contrato.pk)
+        total = max(contrato.numero_parcelas, 1)
+
+        parcelas = {
+            parcela.numero: parcela
+            for parcela in ParcelaHonorarios.objects.filter(contrato=contrato).select_related('lancamento')
+        }
+
+        novas_parcelas = []
+        parcelas_alteradas = {}
+        novos_lancamentos = []
+        lancamentos_alterados = {}
+        lancamentos_removidos = []
+
+        # Versões antigas só criavam Financeiro: adota em vez de duplicar
+        antigos, sobras = _lancamentos_antigos(contrato)
+        for numero, lancamento in antigos.items():
+            parcela = parcelas.get(numero)
+            if parcela is None:
+                parcela = ParcelaHonorarios(
+                    contrato=contrato,
+                    numero=numero,
+                    valor=lancamento.valor,
+                    data_vencimento=lancamento.data_vencimento,
+                    lancamento=lancamento,
+                )
+                parcelas[numero] = parcela
+                novas_parcelas.append(parcela)
+            elif parcela.lancamento_id is None:
+                parcela.lancamento = lancamento
+                parcelas_alteradas[parcela.pk] = parcela
+            else:
+                sobras.append(lancamento)
+        lancamentos_removidos.extend(l.pk for l in sobras if l.valor_pago == 0 and l.status != 'pago')
+
+        pagas = {numero: parcela for numero, parcela in parcelas.items() if parcela_paga(parcela)}
+        abertos = [numero for numero in range(1, total + 1) if numero not in pagas]
+        saldo = max(contrato.valor_total - sum(p.valor for p in pagas.values()), Decimal('0.00'))
+        valores = dict(zip(abertos, dividir_valor(saldo, len(abertos))))
+
+        # Vencimentos ancorados na 1ª parcela: regenerar outro dia não desloca o cronograma
+        primeira = parcelas[1].data_vencimento if 1 in parcelas else hoje
+        periodicidade = 'mensal' if total > 1 else 'unica'
+
+        for numero in abertos:
+            valor = valores[numero]
+            vencimento = primeira if numero == 1 else somar_meses(primeira, numero - 1, dia=contrato.dia_vencimento)
+            descricao = f'{PREFIXO_DESCRICAO}{numero}/{total}'
+
+            parcela = parcelas.get(numero)
+            if parcela is None:
+                parcela = ParcelaHonorarios(contrato=contrato, numero=numero, valor=valor, data_vencimento=vencimento)
+                parcelas[numero] = parcela
+                novas_parcelas.append(parcela)
+            elif parcela.valor != valor or parcela.data_vencimento != vencimento:
+                parcela.valor = valor
+                parcela.data_vencimento = vencimento
+                if parcela.pk:
+                    parcelas_alteradas[parcela.pk] = parcela
+
+            lancamento = parcela.lancamento
+            if lancamento is None:
+                parcela.lancamento = Financeiro(
+                    escritorio_id=contrato.processo.escritorio_id,
+                    cliente_id=contrato.cliente_id,
+                    processo_id=contrato.processo_id,
+                    tipo='receita',
+                    categoria='honorarios',
+                    descricao=descricao,
+                    valor=valor,
+                    data_vencimento=vencimento,
+                    status='pendente',
+                    periodicidade=periodicidade,
+                    parcela_atual=numero,
+                    total_parcelas=total,
+                    criado_por_id=contrato.criado_por_id,
+                )
+                novos_lancamentos.append(parcela.lancamento)
+                if parcela.pk:
+                    parcelas_alteradas[parcela.pk] = parcela
+                continue
+
+            campos = {
+                'descricao': descricao,
+                'valor': valor,
+                'data_vencimento': vencimento,
+                'periodicidade': periodicidade,
+                'parcela_atual': numero,
+                'total_parcelas': total,
+            }
+            if lancamento.status == 'vencido' and vencimento >= hoje:
+                campos['status'] = 'pendente'
+            if any(getattr(lancamento, campo) != valor_novo for campo, valor_novo in campos.items()):
+                for campo, valor_novo in campos.items():
+                    setattr(lancamento, campo, valor_novo)
+                lancamentos_alterados[lancamento.pk] = lancamento
+
+        # Números além do total (contrato reduzido), exceto os já pagos
+        excedentes = [
+            parcela for numero, parcela in parcelas.items()
+            if numero > total and numero not in pagas
+        ]
+        parcelas_removidas = [p for p in excedentes if p.pk]
+        lancamentos_removidos.extend(p.lancamento_id for p in excedentes if p.lancamento_id)
+        novas_parcelas = [p for p in novas_parcelas if not any(p is e for e in excedentes)]
+
+        if parcelas_removidas:
+            ParcelaHonorarios.objects.filter(pk__in=[p.pk for p in parcelas_removidas]).delete()
+        if lancamentos_removidos:
+            Financeiro.objects.filter(pk__in=lancamentos_removidos).delete()
+
+        # Lançamentos primeiro: as parcelas novas precisam do pk para o vínculo
+        Financeiro.objects.bulk_create(novos_lancamentos)
+        if lancamentos_alterados:
+            Financeiro.objects.bulk_update(
+                lancamentos_alterados.values(),
+                ['descricao', 'valor', 'data_vencimento', 'periodicidade', 'parcela_atual', 'total_parcelas', 'status'],
+            )
+
+        ParcelaHonorarios.objects.bulk_create(novas_parcelas)
+        if parcelas_alteradas:
+            ParcelaHonorarios.objects.bulk_update(
+                parcelas_alteradas.values(), ['valor', 'data_vencimento', 'lancamento']
+            )
+
+        # bulk_* não disparam sinais
+        MetricasEscritorio.marcar_desatualizado(contrato.processo.escritorio_id)
+        invalidar_resumo_financeiro(contrato.processo.escritorio_id)
+
+    resultado = {
+        'criadas': len(novas_parcelas),
+        'atualizadas': len(parcelas_alteradas),
+        'removidas': len(parcelas_removidas),
+    }
+    logger.info(f'Parcelas do contrato {contrato.pk}: {resultado}')
+    return resultado
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Alertas de prazos vencendo (um resumo por responsável)
+
+Uma única consulta seleciona os prazos cuja janela de alerta está aberta
+(data_limite - dias_antecedencia_alerta <= hoje <= data_limite) e que ainda
+não foram alertados hoje, ordenada por responsável: o cursor é lido em
+blocos (iterator) e só os prazos de um responsável ficam em memória por vez.
+
+Cada lote de e-mails sai por uma conexão SMTP só e, depois do envio, os
+prazos do lote recebem um único UPDATE (alertas_enviados + 1, ultimo_alerta).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import DateField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from ..models import Prazo
+
+logger = logging.getLogger(__name__)
+
+STATUS_ALERTA = ['pendente', 'em_andamento']
+
+# Prazos listados no corpo do e-mail (o restante vira "e mais N")
+MAXIMO_PRAZOS_POR_EMAIL = 50
+
+
+def prazos_para_alertar(hoje):
+    """Prazos com a janela de alerta aberta e sem alerta hoje, por responsável"""
+    return Prazo.objects.filter(
+        # Faixa em (status, data_limite): usa o índice mesmo com milhões de prazos
+        status__in=STATUS_ALERTA,
+        data_limite__gte=hoje,
+        data_limite__lte=hoje + timedelta(days=settings.PRAZOS_ALERTA_JANELA_MAXIMA),
+        responsavel__isnull=False,
+    ).exclude(
+        responsavel__email=''
+    ).filter(
+        Q(ultimo_alerta__isnull=True) | Q(ultimo_alerta__lt=hoje)
+    ).alias(
+        # date - integer no PostgreSQL: início da janela de alerta de cada prazo
+        inicio_alerta=ExpressionWrapper(
+            F('data_limite') - F('dias_antecedencia_alerta'),
+            output_field=DateField()
+        )
+    ).filter(
+        inicio_alerta__lte=hoje
+    ).order_by(
+        'responsavel_id', 'data_limite', 'id'
+    ).values(
+        'id', 'titulo', 'data_limite', 'prioridade', 'processo__numero_cnj',
+        'responsavel_id', 'responsavel__email', 'responsavel__first_name',
+    )
+
+
+def montar_resumo(prazos, hoje):
+    """E-mail com os prazos de um responsável"""
+    primeiro = prazos[0]
+    nome = primeiro['responsavel__first_name'] or 'Olá'
+
+    linhas = []
+    for prazo in prazos[:MAXIMO_PRAZOS_POR_EMAIL]:
+        dias = (prazo['data_limite'] - hoje).days
+        quando = 'HOJE' if dias == 0 else f'em {dias} dia(s)'
+        linhas.append(
+            f"- {prazo['data_limite']:%d/%m/%Y} ({quando}) [{prazo['prioridade']}] "
+            f"{prazo['processo__numero_cnj']}: {prazo['titulo']}"
+        )
+    if len(prazos) > MAXIMO_PRAZOS_POR_EMAIL:
+        linhas.append(f'... e mais {len(prazos) - MAXIMO_PRAZOS_POR_EMAIL} prazo(s)')
+
+    corpo = (
+        f"{nome},\n\n"
+        f"Você tem {len(prazos)} prazo(s) vencendo:\n\n"
+        + '\n'.join(linhas) +
+        "\n\nLegalFlow"
+    )
+    return EmailMessage(
+        subject=f'[LegalFlow] {len(prazos)} prazo(s) vencendo',
+        body=corpo,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[primeiro['responsavel__email']],
+    )
+
+
+def enviar_alertas_prazos(hoje=None):
+    """
+    Envia um resumo por responsável e registra os alertas
+
+    Retorna (resumos enviados, prazos alertados).
+    """
+    hoje = hoje or timezone.localdate()
+    conexao = get_connection()
+
+    resumos = 0
+    alertados = 0
+    mensagens = []
+    ids_lote = []
+    prazos_usuario = []
+
+    def fechar_resumo():
+        mensagens.append(montar_resumo(prazos_usuario, hoje))
+        ids_lote.extend(p['id'] for p in prazos_usuario)
+        prazos_usuario.clear()
+
+    def enviar_lote():
+        nonlocal resumos, alertados
+        try:
+            conexao.send_messages(mensagens)
+        except Exception as e:
+            # Prazos do lote não são marcados: entram na próxima execução
+            logger.error(f'Erro ao enviar {len(mensagens)} resumos de prazos: {str(e)}')
+        else:
+            Prazo.objects.filter(pk__in=ids_lote).update(
+                alertas_enviados=F('alertas_enviados') + 1,
+                ultimo_alerta=hoje,
+            )
+            resumos += len(mensagens)
+            alertados += len(ids_lote)
+        mensagens.clear()
+        ids_lote.clear()
+
+    for prazo in prazos_para_alertar(hoje).iterator(chunk_size=settings.PRAZOS_ALERTA_LOTE):
+        if prazos_usuario and prazo['responsavel_id'] != prazos_usuario[0]['responsavel_id']:
+            fechar_resumo()
+            if len(mensagens) >= settings.PRAZOS_ALERTA_EMAILS_POR_CONEXAO:
+                enviar_lote()
+        prazos_usuario.append(prazo)
+
+    if prazos_usuario:
+        fechar_resumo()
+    if mensagens:
+        enviar_lote()
+
+    return resumos, alertados
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Publicação de eventos do WhatsApp para o painel via Channels (WebSocket)
+
+Grupos:
+- whatsapp_config_<id>: lista de conversas (todas as abas do painel da conta)
+- whatsapp_conversa_<id>_<numero>: mensagens da conversa aberta
+
+Eventos só são enviados depois do commit: o painel nunca recebe algo que
+ainda pode sofrer rollback. Falha no channel layer não afeta quem escreveu.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TIPO_EVENTO = 'whatsapp.evento'
+
+
+def grupo_config(config_id):
+    return f'whatsapp_config_{config_id}'
+
+
+def grupo_conversa(config_id, numero_contato):
+    # Nomes de grupo aceitam só letras, números, '-', '_' e '.'
+    numero = ''.join(filter(str.isalnum, str(numero_contato)))
+    return f'whatsapp_conversa_{config_id}_{numero}'
+
+
+def _enviar(grupo, evento, dados):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    try:
+        async_to_sync(channel_layer.group_send)(grupo, {
+            'type': TIPO_EVENTO,
+            'evento': evento,
+            'dados': dados,
+        })
+    except Exception as e:
+        logger.warning(f'Falha ao publicar {evento} em {grupo}: {str(e)}')
+
+
+def publicar(grupo, evento, dados):
+    """Agenda o envio do evento para depois do commit da transação atual"""
+    transaction.on_commit(lambda: _enviar(grupo, evento, dados))
+
+
+def publicar_mensagens(mensagens):
+    """
+    Novas mensagens (webhook, lote ou envio pelo painel)
+
+    Um evento por mensagem no grupo da conversa e um único evento por
+    conversa no grupo da conta, mesmo em lotes grandes.
+    """
+    from ..serializers import MensagemWhatsAppResumoSerializer
+
+    conversas = {}
+    for mensagem in mensagens:
+        dados = MensagemWhatsAppResumoSerializer(mensagem).data
+        publicar(
+            grupo_conversa(mensagem.whatsapp_config_id, mensagem.numero_contato),
+            'mensagem.nova',
+            dados
+        )
+        conversas[(mensagem.whatsapp_config_id, mensagem.numero_contato)] = dados
+
+    for (config_id, numero_contato), ultima in conversas.items():
+        publicar(grupo_config(config_id), 'conversa.atualizada', {
+            'numero_contato': numero_contato,
+            'ultima_mensagem': ultima,
+        })
+
+
+def publicar_leitura(config_id, numero_contato, mensagem_ids):
+    """Mensagens marcadas como lidas (some o contador de não lidas nas outras abas)"""
+    dados = {'numero_contato': numero_contato, 'mensagem_ids': list(mensagem_ids)}
+    publicar(grupo_conversa(config_id, numero_contato), 'mensagem.lida', dados)
+    publicar(grupo_config(config_id), 'conversa.lida', dados)
+
+
+def publicar_status(config_id, numero_contato, mensagem_id, status):
+    """Mudança de status de mensagem enviada (enviado, entregue, lido, erro)"""
+    publicar(grupo_conversa(config_id, numero_contato), 'mensagem.status', {
+        'mensagem_id': mensagem_id,
+        'status': status,
+    })
+
+
+def publicar_atribuicao(conversa):
+    """Conversa atribuída a um operador"""
+    publicar(grupo_config(conversa.whatsapp_config_id), 'conversa.atribuida', {
+        'numero_contato': conversa.numero_contato,
+        'usuario_atribuido': conversa.usuario_atribuido_id,
+        'usuario_atribuido_nome': (
+            conversa.usuario_atribuido.get_full_name() if conversa.usuario_atribuido else None
+        ),
+    })
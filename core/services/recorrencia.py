@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Lançamentos recorrentes (Financeiro.periodicidade != 'unica')
+
+Uma série é o lançamento de origem (parcela_atual=1) mais as ocorrências
+que apontam para ele em serie_origem. A regra é fixa na origem:
+- ocorrência n vence em somar_meses(origem.data_vencimento, (n-1) * passo):
+  sempre a partir da origem, então o dia do mês não "escorrega"
+- cada ocorrência tem o valor da origem (valor já é o da parcela)
+- total_parcelas > 1: série finita; total_parcelas = 1: repete até
+  recorrencia_ate (ou indefinidamente)
+
+A task diária core.tasks.materializar_recorrencias cria, em lote, as
+ocorrências que vencem de hoje até FINANCEIRO_RECORRENCIA_HORIZONTE dias à
+frente; vencimentos passados não são criados retroativamente (lançamentos
+mensais antigos viram séries sem preencher os meses anteriores).
+A UniqueConstraint (serie_origem, parcela_atual) torna a execução idempotente.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import Financeiro, MetricasEscritorio
+from .datas import somar_meses
+from .parcelas import PREFIXO_DESCRICAO
+from .resumo_financeiro import invalidar_resumo_financeiro
+
+logger = logging.getLogger(__name__)
+
+# Periodicidade -> meses entre ocorrências
+PASSO_MESES = {
+    'mensal': 1,
+    'bimestral': 2,
+    'trimestral': 3,
+    'semestral': 6,
+    'anual': 12,
+}
+
+SEPARADOR_PARCELA = ' - Parcela '
+
+# Campos copiados da origem para cada ocorrência
+CAMPOS_COPIADOS = [
+    'escritorio_id', 'cliente_id', 'processo_id', 'tipo', 'categoria', 'valor',
+    'forma_pagamento', 'periodicidade', 'banco', 'agencia', 'conta', 'pix',
+    'total_parcelas', 'enviar_lembrete', 'dias_lembrete', 'criado_por_id',
+]
+
+
+def vencimento_ocorrencia(origem, numero):
+    """Vencimento da ocorrência 'numero' (1 = a própria origem)"""
+    return somar_meses(origem.data_vencimento, (numero - 1) * PASSO_MESES[origem.periodicidade])
+
+
+def ocorrencias_ate(origem, limite):
+    """Números das ocorrências que vencem até 'limite' (inclui a origem, 1)"""
+    finita = origem.total_parcelas > 1
+    fim = origem.recorrencia_ate
+
+    numero = 1
+    while True:
+        if finita and numero > origem.total_parcelas:
+            return
+        vencimento = vencimento_ocorrencia(origem, numero)
+        if vencimento > limite or (fim and vencimento > fim):
+            return
+        yield numero, vencimento
+        numero += 1
+
+
+def nova_ocorrencia(origem, numero, vencimento):
+    """Financeiro (não salvo) da ocorrência 'numero' da série"""
+    if origem.total_parcelas > 1:
+        sufixo = f'{SEPARADOR_PARCELA}{numero}/{origem.total_parcelas}'
+    else:
+        sufixo = f' - {vencimento:%m/%Y}'
+
+    ocorrencia = Financeiro(
+        serie_origem_id=origem.pk,
+        descricao=f'{origem.descricao}{sufixo}'[:300],
+        data_vencimento=vencimento,
+        data_competencia=vencimento,
+        parcela_atual=numero,
+        status='pendente',
+    )
+    for campo in CAMPOS_COPIADOS:
+        setattr(ocorrencia, campo, getattr(origem, campo))
+    return ocorrencia
+
+
+def origens_recorrentes():
+    """
+    Lançamentos que iniciam uma série
+
+    Parcelas de contratos têm gerador próprio (services.parcelas), inclusive
+    as criadas pelo antigo gerar_parcelas, ainda sem ParcelaHonorarios.
+    """
+    return Financeiro.objects.filter(
+        serie_origem__isnull=True,
+        parcela_atual=1,
+        periodicidade__in=PASSO_MESES.keys(),
+        parcela_honorarios__isnull=True,
+    ).exclude(status='cancelado').exclude(
+        categoria='honorarios',
+        descricao__startswith=PREFIXO_DESCRICAO,
+    )
+
+
+def vincular_parcelas_antigas():
+    """
+    Liga a séries as parcelas criadas pelo antigo gerar_proxima_parcela
+
+    Elas copiavam a origem e acrescentavam ' - Parcela n/total' à descrição,
+    sem vínculo; sem isso a materialização criaria duplicatas.
+    Retorna quantas foram vinculadas.
+    """
+    antigas = list(Financeiro.objects.filter(
+        serie_origem__isnull=True,
+        parcela_atual__gt=1,
+        periodicidade__in=PASSO_MESES.keys(),
+        parcela_honorarios__isnull=True,
+        descricao__contains=SEPARADOR_PARCELA,
+    ).only('pk', 'escritorio_id', 'cliente_id', 'processo_id', 'tipo', 'categoria', 'descricao'))
+    if not antigas:
+        return 0
+
+    def chave(lancamento, descricao):
+        return (
+            lancamento.escritorio_id, lancamento.cliente_id, lancamento.processo_id,
+            lancamento.tipo, lancamento.categoria, descricao,
+        )
+
+    # A descrição da origem é o prefixo antes de ' - Parcela '
+    bases = {a.descricao.split(SEPARADOR_PARCELA)[0] for a in antigas}
+    origens = {
+        chave(o, o.descricao): o.pk
+        for o in origens_recorrentes().filter(
+            descricao__in=bases,
+            escritorio_id__in={a.escritorio_id for a in antigas},
+        ).only('pk', 'escritorio_id', 'cliente_id', 'processo_id', 'tipo', 'categoria', 'descricao')
+    }
+
+    vinculadas = []
+    for antiga in antigas:
+        origem_id = origens.get(chave(antiga, antiga.descricao.split(SEPARADOR_PARCELA)[0]))
+        if origem_id:
+            antiga.serie_origem_id = origem_id
+            vinculadas.append(antiga)
+
+    Financeiro.objects.bulk_update(vinculadas, ['serie_origem'], batch_size=1000)
+    return len(vinculadas)
+
+
+def materializar_recorrencias(hoje=None, lote=500):
+    """
+    Cria as ocorrências que vencem de hoje até o horizonte, para todas as séries
+
+    Lê as origens em blocos; por bloco, um SELECT das ocorrências existentes
+    e um bulk_create. Retorna quantas ocorrências foram criadas.
+    """
+    hoje = hoje or timezone.localdate()
+    limite = hoje + timedelta(days=settings.FINANCEIRO_RECORRENCIA_HORIZONTE)
+
+    vincular_parcelas_antigas()
+
+    origens = origens_recorrentes().filter(data_vencimento__lte=limite).order_by('pk')
+
+    criadas = 0
+    escritorios = set()
+    bloco = []
+
+    def processar(bloco):
+        existentes = set(Financeiro.objects.filter(
+            serie_origem_id__in=[o.pk for o in bloco]
+        ).values_list('serie_origem_id', 'parcela_atual'))
+
+        novas = [
+            nova_ocorrencia(origem, numero, vencimento)
+            for origem in bloco
+            for numero, vencimento in ocorrencias_ate(origem, limite)
+            if numero > 1 and vencimento >= hoje and (origem.pk, numero) not in existentes
+        ]
+        Financeiro.objects.bulk_create(novas, ignore_conflicts=True)
+        escritorios.update(o.escritorio_id for o in novas)
+        return len(novas)
+
+    for origem in origens.iterator(chunk_size=lote):
+        bloco.append(origem)
+        if len(bloco) >= lote:
+            criadas += processar(bloco)
+            bloco = []
+    if bloco:
+        criadas += processar(bloco)
+
+    # bulk_create não dispara sinais
+    for escritorio_id in escritorios:
+        MetricasEscritorio.marcar_desatualizado(escritorio_id)
+        invalidar_resumo_financeiro(escritorio_id)
+
+    logger.info(f'Recorrências: {criadas} lançamentos criados até {limite}')
+    return criadas
+
+
+def proxima_ocorrencia(lancamento):
+    """Cria (se ainda não existir) a ocorrência seguinte a 'lancamento' na série"""
+    origem = lancamento.serie_origem or lancamento
+    if origem.periodicidade not in PASSO_MESES:
+        return None
+
+    numero = lancamento.parcela_atual + 1
+    if origem.total_parcelas > 1 and numero > origem.total_parcelas:
+        return None
+
+    vencimento = vencimento_ocorrencia(origem, numero)
+    if origem.recorrencia_ate and vencimento > origem.recorrencia_ate:
+        return None
+
+    existente = Financeiro.objects.filter(serie_origem=origem, parcela_atual=numero).first()
+    if existente:
+        return existente
+
+    ocorrencia = nova_ocorrencia(origem, numero, vencimento)
+    ocorrencia.save()
+    return ocorrencia
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Resumo financeiro do escritório (FinanceiroViewSet.resumo)
+
+- Totais do período: uma consulta com agregação condicional
+  (SUM/COUNT ... FILTER) sobre um intervalo de datas, não sobre __month:
+  o filtro (escritorio, data_vencimento) usa o índice, e outubro/2026 não
+  soma os outubros de todos os anos
+- Projeção de caixa: saldo em aberto dos próximos 12 meses em um
+  GROUP BY TruncMonth, mais as ocorrências de recorrências que ainda não
+  foram materializadas (core.services.recorrencia)
+
+O resultado fica no cache por escritório e período. Cada escrita em
+Financeiro troca a versão do escritório (invalidar_resumo_financeiro) e as
+entradas antigas deixam de ser lidas.
+"""
+import logging
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from ..models import Financeiro
+from ..models.financeiro import FinanceiroQuerySet
+from .datas import somar_meses
+from .metricas import chave_mes
+
+logger = logging.getLogger(__name__)
+
+MESES_PROJECAO = 12
+
+EM_ABERTO = FinanceiroQuerySet.STATUS_EM_ABERTO
+ZERO = Decimal('0.00')
+
+
+# ========== CACHE ==========
+def _chave_versao(escritorio_id):
+    return f'financeiro_resumo_versao_{escritorio_id}'
+
+
+def _versao(escritorio_id):
+    chave = _chave_versao(escritorio_id)
+    versao = cache.get(chave)
+    if versao is None:
+        # Versão perdida (expirada/despejada): começa outra, sem reaproveitar entradas antigas
+        versao = time.time_ns()
+        cache.set(chave, versao, None)
+    return versao
+
+
+def invalidar_resumo_financeiro(escritorio_id):
+    if escritorio_id:
+        cache.set(_chave_versao(escritorio_id), time.time_ns(), None)
+
+
+# ========== PERÍODO ==========
+def intervalo_periodo(inicio, fim):
+    """('AAAA-MM', 'AAAA-MM') -> (primeiro dia, primeiro dia após o fim)"""
+    ano, mes = map(int, inicio.split('-'))
+    primeiro = date(ano, mes, 1)
+    ano, mes = map(int, fim.split('-'))
+    return primeiro, somar_meses(date(ano, mes, 1), 1)
+
+
+# ========== CÁLCULO ==========
+def _valor(campo, condicao):
+    return Sum(campo, filter=condicao, default=ZERO, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def totais_periodo(escritorio_id, inicio, fim, hoje):
+    """
+    Totais do período [inicio, fim) e situação das contas em aberto
+
+    Uma consulta: linhas do período OU em aberto/vencidas (índices
+    (escritorio, data_vencimento) e parciais), cada total com o seu FILTER.
+    """
+    no_periodo = Q(data_vencimento__gte=inicio, data_vencimento__lt=fim)
+    aberto = Q(status__in=EM_ABERTO)
+    vencido = Q(status='vencido') | (aberto & Q(data_vencimento__lt=hoje))
+    a_vencer = aberto & Q(data_vencimento__gte=hoje)
+    receita = Q(tipo='receita')
+    despesa = Q(tipo='despesa')
+    saldo_aberto = F('valor') - F('valor_pago')
+
+    totais = Financeiro.objects.filter(
+        escritorio_id=escritorio_id
+    ).filter(
+        no_periodo | Q(status__in=EM_ABERTO + ['vencido'])
+    ).exclude(
+        status='cancelado'
+    ).aggregate(
+        receitas=_valor('valor', no_periodo & receita),
+        despesas=_valor('valor', no_periodo & despesa),
+        recebido=_valor('valor_pago', no_periodo & receita),
+        pago=_valor('valor_pago', no_periodo & despesa),
+        pendentes=Count('id', filter=a_vencer),
+        vencidos=Count('id', filter=vencido),
+        a_receber_vencido=_valor(saldo_aberto, vencido & receita),
+        a_pagar_vencido=_valor(saldo_aberto, vencido & despesa),
+    )
+    totais['saldo'] = totais['receitas'] - totais['despesas']
+    return totais
+
+
+def projecao_caixa(escritorio_id, hoje, meses=MESES_PROJECAO):
+    """
+    Entradas/saídas previstas por mês, do mês atual até 'meses' à frente
+
+    Lançamentos em aberto: um GROUP BY TruncMonth. Recorrências ainda não
+    materializadas entram pelo valor da origem, de hoje em diante (como a
+    task diária as criaria).
+    """
+    # recorrencia importa este módulo (invalidação do cache)
+    from .recorrencia import ocorrencias_ate, origens_recorrentes
+
+    inicio = hoje.replace(day=1)
+    fim = somar_meses(inicio, meses)
+
+    projecao = {
+        chave_mes(somar_meses(inicio, n)): {'entradas': ZERO, 'saidas': ZERO}
+        for n in range(meses)
+    }
+    saldo_aberto = F('valor') - F('valor_pago')
+
+    for linha in Financeiro.objects.filter(
+        escritorio_id=escritorio_id,
+        status__in=EM_ABERTO,
+        data_vencimento__gte=inicio,
+        data_vencimento__lt=fim,
+    ).order_by().annotate(
+        mes=TruncMonth('data_vencimento')
+    ).values('mes').annotate(
+        entradas=_valor(saldo_aberto, Q(tipo='receita')),
+        saidas=_valor(saldo_aberto, Q(tipo='despesa')),
+    ):
+        mes = projecao[chave_mes(linha['mes'])]
+        mes['entradas'] += linha['entradas']
+        mes['saidas'] += linha['saidas']
+
+    # Ocorrências futuras que a task diária ainda não criou
+    origens = list(origens_recorrentes().filter(
+        escritorio_id=escritorio_id, data_vencimento__lt=fim
+    ).only(
+        'pk', 'tipo', 'valor', 'data_vencimento', 'periodicidade', 'total_parcelas', 'recorrencia_ate'
+    ))
+    if origens:
+        existentes = set(Financeiro.objects.filter(
+            serie_origem__in=origens
+        ).values_list('serie_origem_id', 'parcela_atual'))
+        limite = fim - timedelta(days=1)
+
+        for origem in origens:
+            for numero, vencimento in ocorrencias_ate(origem, limite):
+                if numero == 1 or vencimento < hoje or (origem.pk, numero) in existentes:
+                    continue
+                mes = projecao[chave_mes(vencimento)]
+                if origem.tipo == 'receita':
+                    mes['entradas'] += origem.valor
+                elif origem.tipo == 'despesa':
+                    mes['saidas'] += origem.valor
+
+    acumulado = ZERO
+    resultado = []
+    for chave, valores in projecao.items():
+        saldo = valores['entradas'] - valores['saidas']
+        acumulado += saldo
+        resultado.append({'mes': chave, **valores, 'saldo': saldo, 'saldo_acumulado': acumulado})
+    return resultado
+
+
+def resumo_financeiro(escritorio_id, inicio, fim):
+    """
+    Resumo do período ('AAAA-MM', 'AAAA-MM') com a projeção de caixa
+
+    Lido do cache quando a versão do escritório não mudou.
+    """
+    hoje = timezone.localdate()
+    # Data na chave: vencidos/pendentes e a projeção mudam com o dia
+    chave = f'financeiro_resumo_{escritorio_id}_{_versao(escritorio_id)}_{inicio}_{fim}_{hoje.isoformat()}'
+
+    resumo = cache.get(chave)
+    if resumo is None:
+        primeiro, apos_fim = intervalo_periodo(inicio, fim)
+        resumo = {
+            'inicio': inicio,
+            'fim': fim,
+            **totais_periodo(escritorio_id, primeiro, apos_fim, hoje),
+            'projecao': projecao_caixa(escritorio_id, hoje),
+        }
+        # Nomes da resposta antiga (só o mês atual), mantidos para os clientes da API
+        resumo['receitas_mes'] = resumo['receitas']
+        resumo['despesas_mes'] = resumo['despesas']
+        resumo['saldo_mes'] = resumo['saldo']
+        cache.set(chave, resumo, settings.FINANCEIRO_RESUMO_CACHE_TTL)
+    return resumo
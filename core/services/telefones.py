@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Resolução de número de WhatsApp -> Cliente
+
+Os telefones dos clientes ficam normalizados em TelefoneCliente (só dígitos,
+com os últimos 8 dígitos em coluna indexada), então a busca é uma igualdade
+em (escritorio, sufixo) em vez de um LIKE '%...%' na tabela de clientes.
+
+POR QUE SUFIXO DE 8 DÍGITOS:
+- O WhatsApp entrega o número com DDI (55) e às vezes sem o nono dígito
+- Os clientes são cadastrados com máscara, com ou sem DDD
+- Os 8 últimos dígitos são iguais em todas essas variações
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+TAMANHO_SUFIXO = 8
+
+
+def normalizar_telefone(numero):
+    """Mantém só os dígitos (remove máscara e o sufixo @s.whatsapp.net)"""
+    if not numero:
+        return ''
+    numero = str(numero).split('@')[0]
+    return ''.join(filter(str.isdigit, numero))
+
+
+def sufixo_telefone(numero):
+    """Últimos 8 dígitos do número normalizado ('' se for curto demais)"""
+    digitos = normalizar_telefone(numero)
+    if len(digitos) < TAMANHO_SUFIXO:
+        return ''
+    return digitos[-TAMANHO_SUFIXO:]
+
+
+def _escolher_cliente(candidatos, digitos):
+    """Entre telefones com o mesmo sufixo, prefere o número mais parecido"""
+    melhor = None
+    melhor_pontuacao = -1
+
+    for cliente_id, numero in candidatos:
+        if numero == digitos:
+            return cliente_id
+
+        # Um contém o outro no final (com/sem DDI, DDD ou nono dígito)
+        if digitos.endswith(numero) or numero.endswith(digitos):
+            pontuacao = min(len(numero), len(digitos))
+        else:
+            pontuacao = 0
+
+        if pontuacao > melhor_pontuacao:
+            melhor, melhor_pontuacao = cliente_id, pontuacao
+
+    return melhor
+
+
+class CacheTelefones:
+    """
+    LRU por escritório: número normalizado -> cliente_id
+
+    - Só guarda acertos: um cliente recém-cadastrado é encontrado na hora
+    - Cada escritório tem uma versão no cache compartilhado (Redis), trocada
+      quando telefones mudam (core.signals): todos os processos e workers
+      descartam as entradas locais na próxima leitura
+    - TTL é só uma rede de segurança
+    """
+
+    CHAVE_GLOBAL = 'telefones_versao'
+
+    def __init__(self, capacidade, ttl):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._escritorios = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chave_versao(escritorio_id):
+        return f'telefones_versao_{escritorio_id}'
+
+    def versao(self, escritorio_id):
+        """Versão atual (global, escritório): uma ida ao cache compartilhado"""
+        chaves = [self.CHAVE_GLOBAL, self._chave_versao(escritorio_id)]
+        versoes = cache.get_many(chaves)
+        for chave in chaves:
+            if chave not in versoes:
+                # add(): não sobrescreve uma versão gravada por outro processo
+                cache.add(chave, uuid.uuid4().hex, None)
+                versoes[chave] = cache.get(chave)
+        return tuple(versoes[chave] for chave in chaves)
+
+    def obter(self, escritorio_id, versao, chave):
+        with self._lock:
+            versao_local, entradas = self._escritorios.get(escritorio_id, (None, None))
+            if versao_local != versao:
+                self._escritorios.pop(escritorio_id, None)
+                return None
+            if chave not in entradas:
+                return None
+
+            cliente_id, expira_em = entradas[chave]
+            if expira_em < time.monotonic():
+                del entradas[chave]
+                return None
+
+            entradas.move_to_end(chave)
+            return cliente_id
+
+    def guardar(self, escritorio_id, versao, chave, cliente_id):
+        """'versao' lida antes da consulta: invalidações no meio a descartam"""
+        with self._lock:
+            versao_local, entradas = self._escritorios.get(escritorio_id, (None, None))
+            if versao_local != versao:
+                entradas = OrderedDict()
+                self._escritorios[escritorio_id] = (versao, entradas)
+            entradas[chave] = (cliente_id, time.monotonic() + self.ttl)
+            entradas.move_to_end(chave)
+            while len(entradas) > self.capacidade:
+                entradas.popitem(last=False)
+
+    def invalidar(self, escritorio_id=None):
+        """Troca a versão no cache compartilhado (None: todos os escritórios)"""
+        if escritorio_id is None:
+            cache.set(self.CHAVE_GLOBAL, uuid.uuid4().hex, None)
+        else:
+            cache.set(self._chave_versao(escritorio_id), uuid.uuid4().hex, None)
+        with self._lock:
+            if escritorio_id is None:
+                self._escritorios.clear()
+            else:
+                self._escritorios.pop(escritorio_id, None)
+
+
+cache_telefones = CacheTelefones(
+    capacidade=settings.WHATSAPP_CACHE_TELEFONES_CAPACIDADE,
+    ttl=settings.WHATSAPP_CACHE_TELEFONES_TTL,
+)
+
+
+def resolver_cliente(escritorio_id, numero):
+    """Retorna o id do Cliente do escritório dono do número, ou None"""
+    from ..models import TelefoneCliente
+
+    digitos = normalizar_telefone(numero)
+    sufixo = sufixo_telefone(digitos)
+    if not escritorio_id or not sufixo:
+        return None
+
+    versao = cache_telefones.versao(escritorio_id)
+    cliente_id = cache_telefones.obter(escritorio_id, versao, digitos)
+    if cliente_id:
+        return cliente_id
+
+    # Igualdade indexada em (escritorio, sufixo)
+    candidatos = TelefoneCliente.objects.filter(
+        escritorio_id=escritorio_id,
+        sufixo=sufixo,
+    ).order_by('cliente_id').values_list('cliente_id', 'numero')
+
+    cliente_id = _escolher_cliente(candidatos, digitos)
+    if cliente_id:
+        cache_telefones.guardar(escritorio_id, versao, digitos, cliente_id)
+    return cliente_id
+
+
+def invalidar_cache_telefones(escritorio_id=None):
+    cache_telefones.invalidar(escritorio_id)
+    if transaction.get_connection().in_atomic_block:
+        # Outro processo pode reler os telefones antigos antes do commit
+        transaction.on_commit(lambda: cache_telefones.invalidar(escritorio_id))
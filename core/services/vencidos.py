@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Varredura de lançamentos vencidos
+
+Lançamentos pendentes/parciais com data_vencimento no passado passam a
+'vencido' com um UPDATE por escritório. As duas consultas percorrem só o
+índice parcial financeiro_em_aberto (escritorio, data_vencimento), que
+contém apenas as linhas em aberto, não a tabela inteira.
+
+Entre duas varreduras, Financeiro.objects.vencidos() também considera os
+em aberto que venceram depois da última execução.
+"""
+import logging
+
+from django.utils import timezone
+
+from ..models import Financeiro
+from .resumo_financeiro import invalidar_resumo_financeiro
+
+logger = logging.getLogger(__name__)
+
+
+def marcar_vencidos(hoje=None):
+    """Marca como vencidos os lançamentos em aberto já vencidos; retorna quantos"""
+    hoje = hoje or timezone.localdate()
+    vencidos = Financeiro.objects.em_aberto().filter(data_vencimento__lt=hoje)
+
+    escritorios = list(
+        vencidos.order_by().values_list('escritorio_id', flat=True).distinct()
+    )
+
+    total = 0
+    for escritorio_id in escritorios:
+        # update() não passa por save(): atualizado_em vai explícito
+        total += vencidos.filter(escritorio_id=escritorio_id).update(
+            status='vencido',
+            atualizado_em=timezone.now(),
+        )
+        invalidar_resumo_financeiro(escritorio_id)
+
+    logger.info(f'Financeiro: {total} lançamentos marcados como vencidos em {len(escritorios)} escritórios')
+    return total
@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestão de webhooks do WhatsApp
+
+Centraliza a extração do ID do webhook, o processamento de um evento
+e a drenagem da fila de eventos pendentes usada pelos workers Celery.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import WebhookEvent, MensagemWhatsApp, ConversaWhatsApp
+from .idempotencia import webhooks_recentes
+from .realtime import publicar_mensagens
+from .whatsapp_envio import atualizar_status_envio
+from .chatbot import responder_mensagem
+from .dashboard import invalidar_dashboard
+
+logger = logging.getLogger(__name__)
+
+# Namespace do advisory lock que serializa a drenagem de cada configuração
+LOCK_NAMESPACE_WEBHOOK = 7001
+
+
+def extrair_status(payload):
+    """
+    Retorna (message_id_externo, status) se o evento for um callback de status
+    de mensagem enviada, ou None se for uma mensagem recebida
+    """
+    # Normalizado por extrair_eventos (API oficial: value.statuses)
+    if payload.get('tipo_evento') == 'status':
+        return payload.get('message_id'), payload.get('status')
+
+    # Evolution API: event 'messages.update'
+    if str(payload.get('event', '')).lower().replace('_', '.') == 'messages.update':
+        dados = payload.get('data') or {}
+        message_id = dados.get('keyId') or (dados.get('key') or {}).get('id')
+        status = dados.get('status') or (dados.get('update') or {}).get('status')
+        return message_id, status
+
+    # Genérico / stub local
+    if payload.get('type') == 'status':
+        return payload.get('message_id'), payload.get('status')
+
+    return None
+
+
+def extrair_webhook_id(payload):
+    """Extrai o ID único do webhook (varia por provider)"""
+    # Callbacks de status repetem o ID da mensagem: um ID por transição
+    status = extrair_status(payload)
+    if status:
+        return f'status:{status[0]}:{status[1]}'
+
+    # Evolution API: payload['data']['key']['id']
+    # Twilio: payload['MessageSid']
+    # Ajuste conforme seu provider
+    webhook_id = (
+        payload.get('id') or
+        payload.get('MessageSid') or
+        payload.get('data', {}).get('key', {}).get('id')
+    )
+
+    if not webhook_id:
+        # Se não tem ID, gera um baseado em timestamp + hash
+        webhook_id = hashlib.md5(
+            f"{time.time()}{json.dumps(payload)}".encode()
+        ).hexdigest()
+
+    return webhook_id
+
+
+def extrair_eventos(payload):
+    """
+    Separa um callback em eventos individuais (um por mensagem)
+
+    - Lista no topo: cada item é um evento
+    - Evolution API em lote: payload['data'] é uma lista
+    - WhatsApp Business API oficial: entry[].changes[].value.messages[] e .statuses[]
+    """
+    if isinstance(payload, list):
+        return [evento for evento in payload if isinstance(evento, dict)]
+
+    if isinstance(payload.get('data'), list):
+        base = {chave: valor for chave, valor in payload.items() if chave != 'data'}
+        return [{**base, 'data': item} for item in payload['data']]
+
+    if isinstance(payload.get('entry'), list):
+        eventos = []
+        for entry in payload['entry']:
+            for change in entry.get('changes', []):
+                valor = change.get('value', {})
+                nomes = {
+                    contato.get('wa_id'): contato.get('profile', {}).get('name', '')
+                    for contato in valor.get('contacts', [])
+                }
+                for status in valor.get('statuses', []):
+                    eventos.append({
+                        'tipo_evento': 'status',
+                        'message_id': status.get('id'),
+                        'status': status.get('status'),
+                    })
+                for mensagem in valor.get('messages', []):
+                    eventos.append({
+                        'id': mensagem.get('id'),
+                        'from': mensagem.get('from'),
+                        'pushName': nomes.get(mensagem.get('from'), ''),
+                        'text': (mensagem.get('text') or {}).get('body', ''),
+                        'type': mensagem.get('type'),
+                    })
+        return eventos
+
+    for chave in ('messages', 'events'):
+        if isinstance(payload.get(chave), list):
+            return payload[chave]
+
+    return [payload]
+
+
+def extrair_dados_mensagem(payload):
+    """Retorna (numero_contato, nome_contato, conteudo) de um evento"""
+    # Evolution API: payload['data'] com key.remoteJid e message.conversation
+    dados = payload.get('data')
+    if isinstance(dados, dict) and isinstance(dados.get('key'), dict):
+        numero_contato = (dados['key'].get('remoteJid') or '').split('@')[0]
+        mensagem = dados.get('message') or {}
+        conteudo = (
+            mensagem.get('conversation') or
+            (mensagem.get('extendedTextMessage') or {}).get('text') or
+            ''
+        )
+        return numero_contato, dados.get('pushName') or '', conteudo
+
+    # Exemplo genérico - AJUSTE conforme Evolution/Twilio/Meta
+    numero_contato = payload.get('from') or payload.get('sender')
+    nome_contato = payload.get('pushName') or payload.get('senderName') or ''
+    conteudo = payload.get('text') or payload.get('body') or ''
+    return numero_contato, nome_contato, conteudo
+
+
+def processar_mensagem_recebida(config, payload, webhook_event):
+    """
+    Processa o payload e cria MensagemWhatsApp + ConversaWhatsApp
+
+    IMPORTANTE: Ajuste conforme a estrutura do SEU provider
+    """
+    status = extrair_status(payload)
+    if status:
+        # Callback de entrega/leitura de mensagem enviada: não cria mensagem
+        atualizar_status_envio(config, *status)
+        return None
+
+    numero_contato, nome_contato, conteudo = extrair_dados_mensagem(payload)
+    tipo = 'texto'  # TODO: detectar tipo (imagem, audio, etc)
+
+    if not numero_contato:
+        raise ValueError('Número do contato não encontrado no payload')
+
+    # Cria mensagem (o payload bruto fica no WebhookEvent)
+    # A conversa é criada/atualizada incrementalmente no save da mensagem
+    mensagem = MensagemWhatsApp.objects.create(
+        whatsapp_config=config,
+        numero_contato=numero_contato,
+        nome_contato=nome_contato,
+        tipo=tipo,
+        direcao='entrada',
+        conteudo=conteudo,
+        status='entregue',
+        lida=False,
+    )
+
+    publicar_mensagens([mensagem])
+
+    if config.auto_responder:
+        executar_chatbot(config, mensagem)
+
+    return mensagem
+
+
+def executar_chatbot(config, mensagem):
+    """Responde com o chatbot; falha no fluxo não impede o registro da mensagem"""
+    try:
+        # Savepoint: um erro de banco no chatbot não invalida a transação da ingestão
+        with transaction.atomic():
+            responder_mensagem(config, mensagem)
+    except Exception as e:
+        logger.error(f'Erro no chatbot da configuração {config.id}: {str(e)}')
+
+
+def processar_evento(evento):
+    """Processa um WebhookEvent e o marca como processado"""
+    with transaction.atomic():
+        processar_mensagem_recebida(evento.whatsapp_config, evento.payload, evento)
+
+        evento.status = 'processado'
+        evento.processed = True
+        evento.processado_em = timezone.now()
+        evento.proxima_tentativa_em = None
+        evento.save(update_fields=['status', 'processed', 'processado_em', 'proxima_tentativa_em'])
+
+
+def processar_sincrono(config, eventos):
+    """
+    Modo síncrono: processa eventos recém-registrados sob o lock da drenagem
+
+    O INSERT já foi confirmado como 'pendente', então uma drenagem pode
+    pegá-los ao mesmo tempo; com o advisory lock e a releitura do status,
+    cada evento é processado uma única vez. Retorna False se a configuração
+    está sendo drenada por outro worker ou ainda tem eventos anteriores na
+    fila (pendentes ou aguardando nova tentativa): os novos ficam para a
+    drenagem, que respeita a ordem de chegada.
+    Erros de processamento sobem para quem chama.
+    """
+    pks = [evento.pk for evento in eventos]
+
+    with transaction.atomic():
+        if not _adquirir_lock_config(config.id):
+            enfileirar = True
+        else:
+            enfileirar = WebhookEvent.objects.filter(
+                whatsapp_config_id=config.id,
+                status__in=['pendente', 'erro'],
+                processed=False,
+            ).exclude(pk__in=pks).exists()
+
+        if not enfileirar:
+            # A drenagem pode ter processado algum entre o INSERT e o lock
+            pendentes = set(WebhookEvent.objects.filter(
+                pk__in=pks, status='pendente'
+            ).values_list('pk', flat=True))
+            eventos = [evento for evento in eventos if evento.pk in pendentes]
+
+            if len(eventos) == 1:
+                processar_evento(eventos[0])
+            elif eventos:
+                processar_eventos_em_lote(config, eventos)
+
+    if enfileirar:
+        agendar_drenagem(config.id)
+    return not enfileirar
+
+
+def processar_eventos_em_lote(config, eventos):
+    """
+    Processa vários WebhookEvent da mesma configuração de uma só vez
+
+    - Um bulk_create para todas as mensagens
+    - Um UPDATE por conversa afetada (não por mensagem)
+    - Um UPDATE marcando os eventos como processados
+
+    Qualquer erro desfaz o lote inteiro; quem chama decide o fallback.
+    """
+    with transaction.atomic():
+        mensagens = []
+        clientes = {}
+
+        for evento in eventos:
+            status = extrair_status(evento.payload)
+            if status:
+                atualizar_status_envio(config, *status)
+                continue
+
+            numero_contato, nome_contato, conteudo = extrair_dados_mensagem(evento.payload)
+            if not numero_contato:
+                raise ValueError(f'Número do contato não encontrado no webhook {evento.webhook_id}')
+
+            mensagem = MensagemWhatsApp(
+                whatsapp_config=config,
+                numero_contato=numero_contato,
+                nome_contato=nome_contato,
+                tipo='texto',
+                direcao='entrada',
+                conteudo=conteudo,
+                status='entregue',
+                lida=False,
+            )
+
+            # bulk_create não chama save(): vincula o cliente uma vez por número
+            if numero_contato not in clientes:
+                mensagem._vincular_cliente()
+                clientes[numero_contato] = mensagem.cliente_id
+            mensagem.cliente_id = clientes[numero_contato]
+
+            mensagens.append(mensagem)
+
+        MensagemWhatsApp.objects.bulk_create(mensagens)
+        ConversaWhatsApp.registrar_mensagens(mensagens)
+        publicar_mensagens(mensagens)
+        # bulk_create não dispara post_save (core.signals)
+        invalidar_dashboard(config.escritorio_id)
+
+        # Em ordem de chegada: a sessão de cada contato avança mensagem a mensagem
+        if config.auto_responder:
+            for mensagem in mensagens:
+                executar_chatbot(config, mensagem)
+
+        WebhookEvent.objects.filter(pk__in=[evento.pk for evento in eventos]).update(
+            status='processado',
+            processed=True,
+            processado_em=timezone.now(),
+            proxima_tentativa_em=None,
+        )
+
+    return mensagens
+
+
+def ingerir_lote(config, eventos):
+    """
+    Registra e processa um lote de eventos vindos de um único callback
+
+    Duplicados (no lote, no filtro de IDs recentes ou no banco) são
+    descartados em massa antes de qualquer escrita de mensagem.
+    """
+    pares = [(extrair_webhook_id(evento), evento) for evento in eventos]
+    novos = [(webhook_id, evento) for webhook_id, evento in pares if not webhooks_recentes.contem(webhook_id)]
+
+    registrados = WebhookEvent.registrar_lote(config, novos)
+    webhooks_recentes.adicionar(*[webhook_id for webhook_id, _ in novos])
+
+    resultado = {
+        'recebidos': len(eventos),
+        'registrados': len(registrados),
+        'duplicados': len(eventos) - len(registrados),
+        'status': 'ok',
+    }
+
+    if not registrados:
+        return resultado
+
+    if settings.WHATSAPP_WEBHOOK_ASSINCRONO:
+        transaction.on_commit(lambda: agendar_drenagem(config.id))
+        resultado['status'] = 'queued'
+        return resultado
+
+    try:
+        if not processar_sincrono(config, registrados):
+            resultado['status'] = 'queued'
+    except Exception as e:
+        # Eventos ficam registrados; a fila os reprocessa um a um, em ordem
+        logger.error(f'Erro ao processar lote de webhooks da configuração {config.id}: {str(e)}')
+        WebhookEvent.objects.filter(pk__in=[evento.pk for evento in registrados]).update(
+            ultimo_erro=str(e)
+        )
+        agendar_drenagem(config.id)
+        resultado['status'] = 'error_logged'
+
+    return resultado
+
+
+def registrar_falha(evento, erro):
+    """
+    Registra uma falha de processamento
+
+    Após WHATSAPP_WEBHOOK_MAX_TENTATIVAS o evento vai para 'descartado'
+    (dead-letter) e deixa de bloquear a fila da configuração.
+    """
+    evento.tentativas += 1
+    evento.ultimo_erro = str(erro)
+
+    if evento.tentativas >= settings.WHATSAPP_WEBHOOK_MAX_TENTATIVAS:
+        evento.status = 'descartado'
+        evento.proxima_tentativa_em = None
+    else:
+        evento.status = 'erro'
+        # Backoff exponencial: 10s, 20s, 40s... limitado a 10 minutos
+        espera = min(5 * 2 ** evento.tentativas, 600)
+        evento.proxima_tentativa_em = timezone.now() + timedelta(seconds=espera)
+
+    evento.save(update_fields=['tentativas', 'ultimo_erro', 'status', 'proxima_tentativa_em'])
+
+
+def _adquirir_lock_config(config_id):
+    """Garante um único worker drenando cada configuração (lock liberado no commit)"""
+    if connection.vendor != 'postgresql':
+        return True
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_try_advisory_xact_lock(%s, %s)',
+            [LOCK_NAMESPACE_WEBHOOK, config_id]
+        )
+        return cursor.fetchone()[0]
+
+
+def drenar_eventos(config_id, lote=None):
+    """
+    Processa, em ordem de chegada, um lote de eventos pendentes da configuração
+
+    ORDEM: um evento com erro interrompe o lote até a próxima tentativa,
+    para que mensagens do mesmo número nunca sejam processadas fora de ordem.
+    """
+    lote = lote or settings.WHATSAPP_WEBHOOK_LOTE
+    resultado = {
+        'processados': 0,
+        'descartados': 0,
+        'restantes': False,
+        'ocupado': False,
+        'aguardar': None,
+    }
+
+    with transaction.atomic():
+        if not _adquirir_lock_config(config_id):
+            resultado['ocupado'] = True
+            return resultado
+
+        # Eventos anteriores à fila também têm status 'pendente': o comando
+        # marcar_webhooks_processados os descarta no deploy, antes desta drenagem
+        eventos = list(
+            WebhookEvent.objects.select_related('whatsapp_config').filter(
+                whatsapp_config_id=config_id,
+                status__in=['pendente', 'erro'],
+                processed=False,
+            ).order_by('created_at', 'id')[:lote + 1]
+        )
+        resultado['restantes'] = len(eventos) > lote
+
+        agora = timezone.now()
+        eventos = eventos[:lote]
+
+        # Caminho rápido: processa em lote os eventos liberados para execução
+        prontos = []
+        for evento in eventos:
+            if evento.proxima_tentativa_em and evento.proxima_tentativa_em > agora:
+                break
+            prontos.append(evento)
+
+        if prontos:
+            try:
+                processar_eventos_em_lote(prontos[0].whatsapp_config, prontos)
+            except Exception as e:
+                logger.warning(f'Lote da configuração {config_id} falhou, processando um a um: {str(e)}')
+            else:
+                resultado['processados'] = len(prontos)
+                eventos = eventos[len(prontos):]
+
+        for evento in eventos:
+            if evento.proxima_tentativa_em and evento.proxima_tentativa_em > agora:
+                resultado['restantes'] = True
+                resultado['aguardar'] = (evento.proxima_tentativa_em - agora).total_seconds()
+                break
+
+            try:
+                processar_evento(evento)
+            except Exception as e:
+                logger.error(f'Erro ao processar webhook {evento.webhook_id}: {str(e)}')
+                registrar_falha(evento, e)
+
+                if evento.status == 'descartado':
+                    resultado['descartados'] += 1
+                    continue
+
+                resultado['restantes'] = True
+                resultado['aguardar'] = (evento.proxima_tentativa_em - agora).total_seconds()
+                break
+
+            resultado['processados'] += 1
+
+    return resultado
+
+
+def _chave_agendamento(config_id):
+    return f"webhook_drenagem_agendada_{config_id}"
+
+
+def agendar_drenagem(config_id):
+    """
+    Agenda a drenagem da fila de uma configuração
+
+    Em rajadas, apenas uma task fica enfileirada por configuração;
+    a task limpa a marca antes de ler a fila, então nenhum evento fica para trás.
+    """
+    from ..tasks import processar_webhooks_pendentes
+
+    if not cache.add(_chave_agendamento(config_id), True, timeout=60):
+        return
+
+    try:
+        processar_webhooks_pendentes.delay(config_id)
+    except Exception as e:
+        # Broker indisponível: o evento continua pendente e a varredura periódica o recupera
+        cache.delete(_chave_agendamento(config_id))
+        logger.error(f'Erro ao enfileirar drenagem da configuração {config_id}: {str(e)}')
+
+
+def limpar_agendamento(config_id):
+    cache.delete(_chave_agendamento(config_id))
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+Envio de mensagens do WhatsApp pelo provider configurado
+
+- Sessões HTTP (requests.Session) reaproveitadas por (api_url, api_key):
+  keep-alive e pool de conexões em vez de um handshake TLS por mensagem
+- Token bucket por número de WhatsApp (WhatsAppConfig) no Redis, comum a
+  todos os workers, para respeitar o limite de envio do provider
+- Erros classificados em temporários (rede, 429, 5xx: a task tenta de novo
+  com backoff) e definitivos (4xx: a mensagem vai para 'erro')
+
+O envio roda na task core.tasks.enviar_mensagem_whatsapp; use
+enfileirar_envio() para disparar depois do commit.
+
+Teste local: python manage.py stub_whatsapp_provider
+"""
+import logging
+import threading
+import time
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from ..models import MensagemWhatsApp, WhatsAppConfig
+from .realtime import publicar_status
+
+logger = logging.getLogger(__name__)
+
+# Ordem do ciclo de vida de uma mensagem de saída (status só avança)
+ORDEM_STATUS = ['enviando', 'enviado', 'entregue', 'lido']
+
+
+class ErroEnvioWhatsApp(Exception):
+    """Falha no envio; temporario=True indica que vale tentar de novo"""
+
+    def __init__(self, mensagem, temporario=False, aguardar=None):
+        super().__init__(mensagem)
+        self.temporario = temporario
+        self.aguardar = aguardar
+
+
+class LimiteEnvioAtingido(ErroEnvioWhatsApp):
+    """Token bucket vazio: aguardar segundos até a próxima ficha"""
+
+    def __init__(self, aguardar):
+        super().__init__('Limite de envio atingido', temporario=True, aguardar=aguardar)
+
+
+# ========== SESSÕES HTTP ==========
+_sessoes = {}
+_sessoes_lock = threading.Lock()
+
+
+def obter_sessao(config):
+    """Sessão HTTP compartilhada entre os envios da mesma credencial"""
+    chave = (config.api_url, config.api_key)
+
+    with _sessoes_lock:
+        sessao = _sessoes.get(chave)
+        if sessao is None:
+            sessao = requests.Session()
+            # Retentativas ficam com a task (backoff sem prender o worker)
+            adaptador = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.WHATSAPP_ENVIO_POOL_CONEXOES,
+                max_retries=0,
+            )
+            sessao.mount('http://', adaptador)
+            sessao.mount('https://', adaptador)
+            _sessoes[chave] = sessao
+        return sessao
+
+
+# ========== LIMITE DE ENVIO ==========
+class TokenBucket:
+    """
+    Balde de fichas: 'taxa' envios por segundo, com rajadas de até 'capacidade'
+
+    Estado do processo: só é usado se o Redis estiver fora do ar
+    (ver TokenBucketRedis).
+    """
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = capacidade
+        self.atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consumir(self):
+        """Consome uma ficha; retorna 0 se liberado ou os segundos até a próxima ficha"""
+        with self._lock:
+            agora = time.monotonic()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado_em) * self.taxa)
+            self.atualizado_em = agora
+
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return 0
+            return (1 - self.fichas) / self.taxa
+
+
+class TokenBucketRedis:
+    """
+    Mesmo balde, com o estado em um hash do Redis: o limite vale para todos
+    os processos e workers juntos
+
+    Um script Lua lê, reabastece e consome em uma operação atômica, com o
+    relógio do próprio Redis (sem diferença de horário entre máquinas).
+    """
+
+    SCRIPT = """
+    local taxa = tonumber(ARGV[1])
+    local capacidade = tonumber(ARGV[2])
+    local tempo = redis.call('TIME')
+    local agora = tonumber(tempo[1]) + tonumber(tempo[2]) / 1000000
+    local estado = redis.call('HMGET', KEYS[1], 'fichas', 'atualizado_em')
+    local fichas = tonumber(estado[1]) or capacidade
+    local atualizado_em = tonumber(estado[2]) or agora
+    fichas = math.min(capacidade, fichas + math.max(0, agora - atualizado_em) * taxa)
+    local espera = 0
+    if fichas >= 1 then
+        fichas = fichas - 1
+    else
+        espera = (1 - fichas) / taxa
+    end
+    redis.call('HSET', KEYS[1], 'fichas', tostring(fichas), 'atualizado_em', tostring(agora))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacidade / taxa) + 1)
+    return tostring(espera)
+    """
+
+    def __init__(self, cliente, chave, taxa, capacidade):
+        self.chave = chave
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._script = cliente.register_script(self.SCRIPT)
+
+    def consumir(self):
+        """Consome uma ficha; retorna 0 se liberado ou os segundos até a próxima ficha"""
+        return float(self._script(keys=[self.chave], args=[self.taxa, self.capacidade]))
+
+
+_redis = None
+_baldes = {}
+_baldes_lock = threading.Lock()
+
+
+def _cliente_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(
+            settings.WHATSAPP_ENVIO_REDIS_URL, socket_timeout=1, socket_connect_timeout=1
+        )
+    return _redis
+
+
+def obter_balde(config_id):
+    """Balde compartilhado do número de WhatsApp"""
+    return TokenBucketRedis(
+        _cliente_redis(),
+        f'whatsapp_envio_balde_{config_id}',
+        taxa=settings.WHATSAPP_ENVIO_TAXA,
+        capacidade=settings.WHATSAPP_ENVIO_RAJADA,
+    )
+
+
+def _balde_local(config_id):
+    with _baldes_lock:
+        balde = _baldes.get(config_id)
+        if balde is None:
+            balde = TokenBucket(
+                taxa=settings.WHATSAPP_ENVIO_TAXA,
+                capacidade=settings.WHATSAPP_ENVIO_RAJADA,
+            )
+            _baldes[config_id] = balde
+        return balde
+
+
+def aguardar_ficha(config_id):
+    """Segundos até poder enviar (0: liberado)"""
+    try:
+        return obter_balde(config_id).consumir()
+    except redis.RedisError as e:
+        # Sem Redis o envio não para; o 429 do provider cobre o excesso
+        logger.warning(f'Limite de envio sem Redis (configuração {config_id}): {str(e)}')
+        return _balde_local(config_id).consumir()
+
+
+# ========== PROVIDERS ==========
+def _requisicao_evolution(config, mensagem):
+    url = f"{config.api_url.rstrip('/')}/message/sendText/{config.instance_name}"
+    corpo = {'number': mensagem.numero_contato, 'text': mensagem.conteudo}
+    return url, corpo, {'apikey': config.api_key}
+
+
+def _requisicao_oficial(config, mensagem):
+    url = f"{config.api_url.rstrip('/')}/{config.instance_id}/messages"
+    corpo = {
+        'messaging_product': 'whatsapp',
+        'to': mensagem.numero_contato,
+        'type': 'text',
+        'text': {'body': mensagem.conteudo},
+    }
+    return url, corpo, {'Authorization': f'Bearer {config.api_key}'}
+
+
+def _requisicao_generica(config, mensagem):
+    url = f"{config.api_url.rstrip('/')}/messages"
+    corpo = {'to': mensagem.numero_contato, 'text': mensagem.conteudo}
+    return url, corpo, {'Authorization': f'Bearer {config.api_key}'}
+
+
+REQUISICOES = {
+    'evolution': _requisicao_evolution,
+    'official': _requisicao_oficial,
+}
+
+
+def extrair_id_externo(resposta):
+    """ID da mensagem no provider (usado para casar os callbacks de status)"""
+    return (
+        (resposta.get('key') or {}).get('id') or
+        ((resposta.get('messages') or [{}])[0]).get('id') or
+        resposta.get('id') or
+        ''
+    )
+
+
+# ========== ENVIO ==========
+def enfileirar_envio(mensagem):
+    """Agenda o envio da mensagem para depois do commit"""
+    from ..tasks import enviar_mensagem_whatsapp
+
+    transaction.on_commit(lambda: enviar_mensagem_whatsapp.delay(mensagem.id))
+
+
+def enviar_mensagem(mensagem):
+    """
+    Envia uma MensagemWhatsApp de saída e registra o ID externo
+
+    Levanta ErroEnvioWhatsApp em caso de falha.
+    """
+    config = mensagem.whatsapp_config
+
+    espera = aguardar_ficha(config.id)
+    if espera:
+        raise LimiteEnvioAtingido(espera)
+
+    url, corpo, cabecalhos = REQUISICOES.get(config.provider, _requisicao_generica)(config, mensagem)
+
+    inicio = time.monotonic()
+    try:
+        resposta = obter_sessao(config).post(
+            url,
+            json=corpo,
+            headers=cabecalhos,
+            timeout=(settings.WHATSAPP_ENVIO_TIMEOUT_CONEXAO, settings.WHATSAPP_ENVIO_TIMEOUT_RESPOSTA),
+        )
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise ErroEnvioWhatsApp(f'Provider indisponível: {str(e)}', temporario=True)
+
+    if resposta.status_code == 429 or resposta.status_code >= 500:
+        aguardar = resposta.headers.get('Retry-After')
+        raise ErroEnvioWhatsApp(
+            f'Provider respondeu {resposta.status_code}',
+            temporario=True,
+            aguardar=float(aguardar) if aguardar and aguardar.isdigit() else None,
+        )
+
+    if resposta.status_code >= 400:
+        raise ErroEnvioWhatsApp(f'Provider recusou a mensagem ({resposta.status_code}): {resposta.text[:500]}')
+
+    try:
+        dados = resposta.json()
+    except ValueError:
+        dados = {}
+
+    agora = timezone.now()
+    message_id_externo = extrair_id_externo(dados)
+    MensagemWhatsApp.objects.filter(pk=mensagem.pk).update(
+        message_id_externo=message_id_externo,
+        # Nunca volta status que já avançou
+        status=Case(When(status='enviando', then=Value('enviado')), default=F('status')),
+        tempo_envio=agora,
+        atualizado_em=agora,
+    )
+
+    duracao_ms = (time.monotonic() - inicio) * 1000
+    WhatsAppConfig.objects.filter(pk=config.pk).update(
+        mensagens_enviadas=F('mensagens_enviadas') + 1,
+        # Média móvel exponencial: não precisa guardar o histórico
+        tempo_medio_resposta=F('tempo_medio_resposta') * 0.9 + duracao_ms * 0.1,
+    )
+
+    publicar_status(config.id, mensagem.numero_contato, mensagem.id, 'enviado')
+
+    # Callbacks que chegaram antes do ID externo ser gravado
+    aplicar_status_pendentes(config, message_id_externo)
+
+
+def marcar_falha_envio(mensagem, erro):
+    """Falha definitiva: mensagem vai para 'erro' (se ainda não foi enviada)"""
+    agora = timezone.now()
+    atualizadas = MensagemWhatsApp.objects.filter(pk=mensagem.pk, status='enviando').update(
+        status='erro',
+        atualizado_em=agora,
+    )
+    WhatsAppConfig.objects.filter(pk=mensagem.whatsapp_config_id).update(
+        ultimo_erro=str(erro),
+        data_ultimo_erro=agora,
+    )
+
+    if atualizadas:
+        publicar_status(mensagem.whatsapp_config_id, mensagem.numero_contato, mensagem.id, 'erro')
+
+
+# ========== CALLBACKS DE STATUS ==========
+# Status dos providers -> status interno
+STATUS_PROVIDER = {
+    # Evolution API (messages.update)
+    'SERVER_ACK': 'enviado',
+    'DELIVERY_ACK': 'entregue',
+    'READ': 'lido',
+    'PLAYED': 'lido',
+    'ERROR': 'erro',
+    # WhatsApp Business API oficial (statuses)
+    'sent': 'enviado',
+    'delivered': 'entregue',
+    'read': 'lido',
+    'failed': 'erro',
+}
+
+
+def _chave_status_pendente(config_id, message_id_externo):
+    return f'whatsapp_status_pendente_{config_id}_{message_id_externo}'
+
+
+def aplicar_status_pendentes(config, message_id_externo):
+    """Aplica os callbacks guardados por atualizar_status_envio para este ID externo"""
+    if not message_id_externo:
+        return 0
+
+    chave = _chave_status_pendente(config.id, message_id_externo)
+    pendentes = cache.get(chave)
+    if not pendentes:
+        return 0
+    cache.delete(chave)
+
+    return sum(
+        atualizar_status_envio(config, message_id_externo, status, guardar=False)
+        for status in pendentes
+    )
+
+
+def atualizar_status_envio(config, message_id_externo, status_provider, guardar=True):
+    """
+    Aplica um callback de status; o status só avança (enviado -> entregue -> lido)
+
+    Callbacks fora de ordem ou repetidos não fazem nada. Retorna a
+    quantidade de mensagens atualizadas (0 ou 1).
+
+    O provider pode mandar o callback antes de enviar_mensagem gravar o ID
+    externo: sem mensagem com esse ID, o status fica guardado no cache
+    (WHATSAPP_STATUS_PENDENTE_TTL) e é aplicado quando o ID for gravado.
+    """
+    novo = STATUS_PROVIDER.get(status_provider, status_provider)
+    if not message_id_externo or (novo != 'erro' and novo not in ORDEM_STATUS):
+        return 0
+
+    mensagens = MensagemWhatsApp.objects.filter(
+        whatsapp_config=config,
+        message_id_externo=message_id_externo,
+        direcao='saida',
+    )
+
+    if guardar and not mensagens.exists():
+        chave = _chave_status_pendente(config.id, message_id_externo)
+        cache.set(chave, (cache.get(chave) or []) + [novo], timeout=settings.WHATSAPP_STATUS_PENDENTE_TTL)
+        # O ID pode ter sido gravado entre a consulta e o cache
+        if not mensagens.exists():
+            return 0
+        return aplicar_status_pendentes(config, message_id_externo)
+
+    agora = timezone.now()
+
+    if novo == 'erro':
+        # Falha só vale se a mensagem ainda não chegou ao contato
+        atualizadas = mensagens.filter(status__in=['enviando', 'enviado']).update(
+            status='erro', atualizado_em=agora
+        )
+        if atualizadas:
+            for mensagem_id, numero_contato in mensagens.values_list('id', 'numero_contato'):
+                publicar_status(config.id, numero_contato, mensagem_id, 'erro')
+        return atualizadas
+
+    anteriores = ORDEM_STATUS[:ORDEM_STATUS.index(novo)] + ['erro']
+    campos = {'status': novo, 'atualizado_em': agora}
+    if novo == 'entregue':
+        campos['tempo_entrega'] = agora
+    elif novo == 'lido':
+        campos['tempo_leitura'] = agora
+
+    atualizadas = mensagens.filter(status__in=anteriores).update(**campos)
+
+    if atualizadas:
+        for mensagem_id, numero_contato in mensagens.values_list('id', 'numero_contato'):
+            publicar_status(config.id, numero_contato, mensagem_id, novo)
+
+    return atualizadas
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Receivers de sinais do app core (conectados em CoreConfig.ready)
+"""
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
+from django.dispatch import receiver
+
+from .models import (
+    Audiencia, Cliente, Financeiro, FluxoChatbot, MensagemWhatsApp, MetricasEscritorio,
+    Prazo, Processo, TelefoneCliente, Usuario,
+)
+from .services.busca import instalar_busca, instalar_extensoes
+from .services.chatbot import invalidar_matcher
+from .services.dashboard import invalidar_dashboard
+from .services.resumo_financeiro import invalidar_resumo_financeiro
+from .services.telefones import invalidar_cache_telefones
+
+
+# ========== TELEFONES DE CLIENTES ==========
+@receiver(post_delete, sender=TelefoneCliente)
+def invalidar_telefones_removidos(sender, instance, **kwargs):
+    """Exclusão de cliente (cascade) não passa por Cliente.save()"""
+    invalidar_cache_telefones(instance.escritorio_id)
+
+
+# ========== CHATBOT ==========
+@receiver(post_save, sender=FluxoChatbot)
+@receiver(post_delete, sender=FluxoChatbot)
+def invalidar_matcher_chatbot(sender, instance, **kwargs):
+    """Palavras-chave, regex, ordem ou 'ativo' mudaram: recompila o matcher do escritório"""
+    invalidar_matcher(instance.escritorio_id)
+
+
+# ========== DASHBOARD ==========
+@receiver(post_save, sender=Processo)
+@receiver(post_delete, sender=Processo)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_dashboard_escritorio(sender, instance, **kwargs):
+    invalidar_dashboard(instance.escritorio_id)
+
+
+@receiver(post_save, sender=Prazo)
+@receiver(post_delete, sender=Prazo)
+@receiver(post_save, sender=Audiencia)
+@receiver(post_delete, sender=Audiencia)
+def invalidar_dashboard_processo(sender, instance, **kwargs):
+    # Usa o processo já carregado quando houver; senão, só a coluna necessária
+    processo = instance._state.fields_cache.get('processo')
+    if processo is not None:
+        escritorio_id = processo.escritorio_id
+    else:
+        escritorio_id = Processo.objects.filter(pk=instance.processo_id).values_list(
+            'escritorio_id', flat=True
+        ).first()
+    invalidar_dashboard(escritorio_id)
+
+
+@receiver(post_save, sender=MensagemWhatsApp)
+@receiver(post_delete, sender=MensagemWhatsApp)
+def invalidar_dashboard_mensagem(sender, instance, created=False, **kwargs):
+    # Só mensagens recebidas mexem em 'mensagens_nao_lidas'
+    if instance.direcao != 'entrada' or (kwargs.get('signal') is post_save and not created):
+        return
+    invalidar_dashboard(instance.whatsapp_config.escritorio_id)
+
+
+# ========== MÉTRICAS DO ESCRITÓRIO ==========
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_save, sender=Processo)
+@receiver(post_delete, sender=Processo)
+@receiver(post_save, sender=Financeiro)
+@receiver(post_delete, sender=Financeiro)
+def marcar_metricas_desatualizadas(sender, instance, **kwargs):
+    MetricasEscritorio.marcar_desatualizado(instance.escritorio_id)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def marcar_metricas_usuarios(sender, instance, created=False, **kwargs):
+    # Login também salva o usuário (last_login): só criação/exclusão mudam a contagem
+    if kwargs.get('signal') is post_save and not created:
+        return
+    MetricasEscritorio.marcar_desatualizado(instance.escritorio_id)
+
+
+# ========== RESUMO FINANCEIRO ==========
+@receiver(post_save, sender=Financeiro)
+@receiver(post_delete, sender=Financeiro)
+def invalidar_resumo_lancamento(sender, instance, **kwargs):
+    invalidar_resumo_financeiro(instance.escritorio_id)
+
+
+# ========== BUSCA TEXTUAL ==========
+@receiver(pre_migrate)
+def criar_extensoes_busca(sender, using='default', **kwargs):
+    # Antes das migrações: os índices trigram de Cliente usam pg_trgm
+    if sender.name == 'core':
+        instalar_extensoes(connections[using])
+
+
+@receiver(post_migrate)
+def instalar_busca_processos(sender, using='default', **kwargs):
+    # Depois das migrações do core: a coluna busca_vetor já existe
+    if sender.name == 'core':
+        instalar_busca(connections[using])
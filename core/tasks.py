@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Tasks assíncronas (Celery) do LegalFlow
+
+As tasks periódicas são agendadas em settings.CELERY_BEAT_SCHEDULE.
+"""
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+# ========== WHATSAPP ==========
+@shared_task(bind=True, ignore_result=True, max_retries=None)
+def processar_webhooks_pendentes(self, config_id):
+    """Drena, em ordem de chegada, os webhooks pendentes de uma configuração"""
+    from .services.webhook import drenar_eventos, limpar_agendamento
+
+    limpar_agendamento(config_id)
+    resultado = drenar_eventos(config_id)
+
+    if resultado['ocupado']:
+        # Outro worker está drenando esta configuração; tenta de novo em instantes
+        raise self.retry(countdown=2)
+
+    if resultado['aguardar'] is not None:
+        # Evento com erro bloqueia a fila até a próxima tentativa (mantém a ordem)
+        raise self.retry(countdown=max(1, int(resultado['aguardar'])))
+
+    if resultado['restantes']:
+        processar_webhooks_pendentes.delay(config_id)
+
+    return resultado
+
+
+@shared_task(ignore_result=True)
+def varrer_webhooks_pendentes():
+    """Reenfileira configurações com eventos pendentes (broker fora do ar, workers reiniciados)"""
+    from .models import WebhookEvent
+
+    config_ids = WebhookEvent.objects.filter(
+        processed=False
+    ).exclude(
+        status='descartado'
+    ).order_by().values_list('whatsapp_config_id', flat=True).distinct()
+
+    for config_id in config_ids:
+        processar_webhooks_pendentes.delay(config_id)
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None)
+def enviar_mensagem_whatsapp(self, mensagem_id, falhas=0):
+    """Envia uma mensagem de saída pelo provider, com retentativas e backoff"""
+    from django.conf import settings
+    from .models import MensagemWhatsApp
+    from .services.whatsapp_envio import (
+        ErroEnvioWhatsApp,
+        LimiteEnvioAtingido,
+        enviar_mensagem,
+        marcar_falha_envio,
+    )
+
+    mensagem = MensagemWhatsApp.objects.select_related('whatsapp_config').filter(
+        pk=mensagem_id
+    ).first()
+
+    # Idempotência: só envia o que ainda está 'enviando' (task duplicada ou já enviada)
+    if not mensagem or mensagem.status != 'enviando':
+        return
+
+    try:
+        enviar_mensagem(mensagem)
+    except LimiteEnvioAtingido as e:
+        # Não conta como falha: só espera a próxima ficha do balde
+        raise self.retry(countdown=e.aguardar, kwargs={'mensagem_id': mensagem_id, 'falhas': falhas})
+    except ErroEnvioWhatsApp as e:
+        falhas += 1
+
+        if not e.temporario or falhas >= settings.WHATSAPP_ENVIO_MAX_TENTATIVAS:
+            logger.error(f'Envio da mensagem {mensagem_id} falhou ({falhas} tentativas): {str(e)}')
+            marcar_falha_envio(mensagem, e)
+            return
+
+        # Backoff exponencial: 5s, 10s, 20s... limitado a 5 minutos
+        espera = e.aguardar or min(5 * 2 ** (falhas - 1), 300)
+        logger.warning(f'Envio da mensagem {mensagem_id} falhou ({str(e)}), nova tentativa em {espera}s')
+        raise self.retry(countdown=espera, kwargs={'mensagem_id': mensagem_id, 'falhas': falhas})
+
+
+@shared_task(ignore_result=True)
+def limpar_sessoes_chatbot():
+    """Remove as cópias no banco de sessões do chatbot já expiradas"""
+    from django.utils import timezone
+    from .models import SessaoChatbot
+
+    removidas, _ = SessaoChatbot.objects.filter(expira_em__lt=timezone.now()).delete()
+    if removidas:
+        logger.info(f'{removidas} sessões de chatbot expiradas removidas')
+
+
+# ========== MÉTRICAS ==========
+@shared_task(ignore_result=True)
+def atualizar_metricas_escritorios():
+    """Recalcula o retrato dos escritórios marcados como desatualizados"""
+    from .models import MetricasEscritorio
+    from .services.metricas import atualizar_metricas
+
+    escritorio_ids = list(
+        MetricasEscritorio.objects.filter(desatualizado=True).values_list('escritorio_id', flat=True)
+    )
+    for escritorio_id in escritorio_ids:
+        try:
+            atualizar_metricas(escritorio_id)
+        except Exception as e:
+            logger.error(f'Erro ao atualizar métricas do escritório {escritorio_id}: {str(e)}')
+
+    if escritorio_ids:
+        logger.info(f'Métricas de {len(escritorio_ids)} escritórios atualizadas')
+
+
+@shared_task(ignore_result=True)
+def recalcular_metricas_escritorios():
+    """
+    Recalcula o retrato de todos os escritórios ativos
+
+    Cobre escritas que não disparam sinais (update()/bulk_create) e a virada
+    do mês nos totais de receitas/despesas.
+    """
+    from .models import Escritorio
+    from .services.metricas import atualizar_metricas
+
+    for escritorio_id in Escritorio.objects.filter(ativo=True).values_list('pk', flat=True).iterator():
+        try:
+            atualizar_metricas(escritorio_id)
+        except Exception as e:
+            logger.error(f'Erro ao recalcular métricas do escritório {escritorio_id}: {str(e)}')
+
+
+# ========== PRAZOS ==========
+@shared_task(ignore_result=True)
+def verificar_prazos_vencendo():
+    """Envia a cada responsável um resumo dos prazos com a janela de alerta aberta"""
+    from .services.prazos import enviar_alertas_prazos
+
+    resumos, alertados = enviar_alertas_prazos()
+    logger.info(f'Alertas de prazos: {alertados} prazos em {resumos} resumos')
+
+
+# ========== ANDAMENTOS ==========
+@shared_task(ignore_result=True)
+def atualizar_processos():
+    """Dispara uma captura de andamentos por tribunal com processos ativos"""
+    from .services.andamentos import registrar_tribunais, tribunais_ativos
+
+    tribunais = tribunais_ativos()
+    registrar_tribunais(tribunais)
+    for tribunal in tribunais:
+        capturar_andamentos_tribunal.delay(tribunal)
+
+    logger.info(f'Captura de andamentos disparada para {len(tribunais)} tribunais')
+
+
+@shared_task(ignore_result=True)
+def capturar_andamentos_tribunal(tribunal):
+    """Captura os andamentos dos processos ativos de um tribunal"""
+    from .services.andamentos import capturar_tribunal
+
+    capturar_tribunal(tribunal)
+
+
+# ========== FINANCEIRO ==========
+@shared_task(ignore_result=True)
+def materializar_recorrencias():
+    """Cria os lançamentos recorrentes que vencem dentro do horizonte configurado"""
+    from .services.recorrencia import materializar_recorrencias as materializar
+
+    materializar()
+
+
+@shared_task(ignore_result=True)
+def marcar_financeiro_vencidos():
+    """Marca como vencidos os lançamentos em aberto com vencimento no passado"""
+    from .services.vencidos import marcar_vencidos
+
+    marcar_vencidos()
+
+
+# ========== EXPORTAÇÕES ==========
+@shared_task(ignore_result=True)
+def gerar_exportacao(exportacao_id):
+    """Gera o arquivo de uma exportação pedida com ?assincrono=1"""
+    from .models import Exportacao
+    from .services.exportacao import gerar_exportacao as gerar
+    from .views import consulta_exportacao
+
+    exportacao = Exportacao.objects.select_related('usuario__escritorio').get(pk=exportacao_id)
+    queryset, colunas = consulta_exportacao(exportacao)
+    gerar(exportacao, queryset, colunas)
+
+
+# ========== CONTRATOS ==========
+@shared_task(ignore_result=True)
+def gerar_pdf_contrato(contrato_id, forcar=False):
+    """Gera o PDF de um contrato de honorários (só renderiza se o conteúdo mudou)"""
+    from .services.contrato_pdf import consulta_contratos, gerar_pdf
+
+    contrato = consulta_contratos().filter(pk=contrato_id).first()
+    if contrato is not None:
+        gerar_pdf(contrato, forcar=forcar)
+
+
+@shared_task(ignore_result=True)
+def gerar_pdfs_cliente(cliente_id, forcar=False):
+    """Gera, em um só job, os PDFs de todos os contratos de um cliente"""
+    from .services.contrato_pdf import consulta_contratos, gerar_pdfs
+
+    renderizados, inalterados = gerar_pdfs(
+        consulta_contratos().filter(cliente_id=cliente_id).order_by('pk'), forcar=forcar
+    )
+    logger.info(f'PDFs do cliente {cliente_id}: {renderizados} gerados, {inalterados} inalterados')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Captura de andamentos com a FonteFalsa: deduplicação por hash_conteudo e
+reexecução sem duplicar
+"""
+from datetime import date
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from core.models import Andamento, Cliente, Escritorio, Processo, Usuario
+from core.services.andamentos import FonteFalsa, Movimento, capturar_tribunal, gravar_movimentos
+
+
+@override_settings(
+    ANDAMENTOS_FALSA_LATENCIA=0.0,
+    ANDAMENTOS_FALSA_ERROS=0.0,
+    ANDAMENTOS_CONCORRENCIA=2,
+    ANDAMENTOS_LOTE=2,
+)
+class CapturaAndamentosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        advogado = Usuario.objects.create_user(username='advogado', password='senha', escritorio=escritorio)
+        cliente = Cliente.objects.create(
+            escritorio=escritorio,
+            nome='Cliente',
+            telefone='5511988880000',
+            cep='01001000',
+            endereco='Praça da Sé',
+            numero='1',
+            bairro='Sé',
+            cidade='São Paulo',
+            estado='SP',
+        )
+        cls.processos = [
+            Processo.objects.create(
+                escritorio=escritorio,
+                numero_cnj=f'000000{i}-00.2024.8.26.0100',
+                cliente=cliente,
+                advogado_responsavel=advogado,
+                vara='1ª Vara Cível',
+                comarca='São Paulo',
+                tribunal='TJSP',
+                data_distribuicao=date(2024, 1, 1),
+                objeto='Cobrança',
+            )
+            for i in range(3)
+        ]
+
+    def test_reexecucao_nao_duplica(self):
+        primeira = capturar_tribunal('TJSP', FonteFalsa())
+        total = Andamento.objects.count()
+        self.assertGreater(total, 0)
+        self.assertEqual(primeira['processos'], 3)
+        self.assertEqual(primeira['andamentos_novos'], total)
+
+        segunda = capturar_tribunal('TJSP', FonteFalsa())
+        self.assertEqual(segunda['andamentos_novos'], 0)
+        self.assertEqual(Andamento.objects.count(), total)
+
+    def test_andamento_manual_com_mesmo_conteudo_nao_e_duplicado(self):
+        processo = self.processos[0]
+        movimento = FonteFalsa().buscar(processo.numero_cnj, 'TJSP')[0]
+        # Espaços e maiúsculas não mudam o hash
+        Andamento.objects.create(
+            processo=processo,
+            data=movimento.data,
+            tipo=movimento.tipo,
+            descricao=f'  {movimento.descricao.upper()} ',
+        )
+
+        capturar_tribunal('TJSP', FonteFalsa())
+
+        self.assertEqual(
+            Andamento.objects.filter(processo=processo, data=movimento.data, tipo=movimento.tipo).count(), 1
+        )
+
+    def test_movimentos_repetidos_no_lote_gravam_um(self):
+        processo = self.processos[0]
+        movimento = Movimento(data=date(2024, 1, 10), tipo='decisao', descricao='Decisão  proferida', juiz='')
+        repetido = movimento._replace(descricao='decisão proferida')
+
+        self.assertEqual(gravar_movimentos({processo.pk: [movimento, repetido]}), 1)
+        self.assertEqual(gravar_movimentos({processo.pk: [movimento]}), 0)
+        self.assertEqual(Andamento.objects.filter(processo=processo).count(), 1)
+
+    def test_gravado_por_outra_execucao_nao_conta_como_novo(self):
+        processo = self.processos[0]
+        movimento = Movimento(data=date(2024, 1, 10), tipo='decisao', descricao='Decisão proferida', juiz='')
+        outro = movimento._replace(data=date(2024, 1, 11))
+        Andamento.objects.create(
+            processo=processo,
+            data=movimento.data,
+            tipo=movimento.tipo,
+            descricao=movimento.descricao,
+            capturado_automatico=True,
+        )
+        filtrar = Andamento.objects.filter
+        consultas = []
+
+        def select_anterior(*args, **kwargs):
+            # O primeiro SELECT aconteceu antes da outra captura gravar
+            consultas.append(kwargs)
+            return Andamento.objects.none() if len(consultas) == 1 else filtrar(*args, **kwargs)
+
+        with mock.patch.object(Andamento.objects, 'filter', side_effect=select_anterior):
+            self.assertEqual(gravar_movimentos({processo.pk: [movimento, outro]}), 1)
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(Andamento.objects.filter(processo=processo).count(), 2)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Chatbot: falha no passo fica registrada no fluxo mesmo com o savepoint da
+ingestão
+"""
+from unittest import mock
+
+from django.test import TestCase
+
+from core.models import Escritorio, FluxoChatbot, MensagemWhatsApp, WhatsAppConfig
+from core.services.webhook import executar_chatbot
+
+
+class FalhaFluxoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        cls.config = WhatsAppConfig.objects.create(
+            escritorio=escritorio,
+            nome='Principal',
+            numero_telefone='5511999990000',
+            provider='outro',
+            api_url='http://127.0.0.1',
+            api_key='chave',
+        )
+        cls.fluxo = FluxoChatbot.objects.create(
+            escritorio=escritorio,
+            nome='Atendimento',
+            palavras_chave='processo',
+            fluxo_json={'steps': [
+                {'mensagem': 'Qual o número do processo?', 'salvar_como': 'numero'},
+                {'mensagem': 'Obrigado!'},
+            ]},
+        )
+
+    def test_falha_no_passo_e_registrada(self):
+        mensagem = MensagemWhatsApp.objects.create(
+            whatsapp_config=self.config,
+            numero_contato='5511988887777',
+            direcao='entrada',
+            conteudo='Quero saber do processo',
+        )
+
+        with mock.patch('core.services.whatsapp_envio.enfileirar_envio', side_effect=RuntimeError('broker')):
+            executar_chatbot(self.config, mensagem)
+
+        self.fluxo.refresh_from_db()
+        self.assertEqual((self.fluxo.vezes_executado, self.fluxo.sucessos, self.fluxo.falhas), (1, 0, 1))
+        self.assertFalse(MensagemWhatsApp.objects.filter(direcao='saida').exists())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Número de consultas SQL por endpoint da API (listagem e detalhe)
+
+O número não pode crescer com a quantidade de registros: um campo
+source='fk.campo' novo sem o select_related no Meta do serializer
+(serializers.planejar_consulta) faz estes testes falharem.
+"""
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import (
+    Andamento, Anotacao, Audiencia, Cliente, ContratoHonorarios, ConversaWhatsApp, CustaProcessual,
+    Entrevista, Escritorio, Exportacao, Financeiro, FluxoChatbot, MensagemWhatsApp, Prazo, Processo,
+    Usuario, WhatsAppConfig,
+)
+
+# Registros criados de cada tipo: a listagem tem que custar o mesmo com 1 ou com vários
+QUANTIDADE = 3
+
+# basename da rota -> (consultas na listagem, consultas no detalhe)
+# Listagem: contagem da paginação + página (+ prefetch). Detalhe: o objeto
+# (+ a FK lida por IsEscritorioMember quando não está no select_related)
+CONSULTAS = {
+    'escritorio': (2, 1),
+    'usuario': (2, 1),
+    'cliente': (2, 1),
+    'anotacao': (2, 2),
+    'entrevista': (2, 2),
+    'processo': (2, 2),
+    'andamento': (2, 2),
+    'prazo': (2, 2),
+    'audiencia': (2, 2),
+    'custa': (2, 2),
+    'financeiro': (2, 2),
+    'contrato-honorarios': (3, 3),
+    'whatsapp-config': (3, 2),
+    'mensagem-whatsapp': (2, 2),
+    'fluxo-chatbot': (2, 1),
+    'conversa-whatsapp': (2, 2),
+    'exportacao': (2, 2),
+}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ConsultasPorEndpointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        cls.usuario = Usuario.objects.create_user(
+            username='socio',
+            password='senha',
+            first_name='Ana',
+            last_name='Souza',
+            tipo='socio',
+            escritorio=cls.escritorio,
+        )
+        config = WhatsAppConfig.objects.create(
+            escritorio=cls.escritorio,
+            nome='Principal',
+            numero_telefone='5511999990000',
+            api_url='http://127.0.0.1',
+            api_key='chave',
+        )
+        hoje = date.today()
+
+        for i in range(QUANTIDADE):
+            Usuario.objects.create_user(
+                username=f'advogado{i}', password='senha', escritorio=cls.escritorio
+            )
+            cliente = Cliente.objects.create(
+                escritorio=cls.escritorio,
+                nome=f'Cliente {i}',
+                telefone=f'551198888000{i}',
+                cep='01001000',
+                endereco='Praça da Sé',
+                numero=str(i),
+                bairro='Sé',
+                cidade='São Paulo',
+                estado='SP',
+            )
+            processo = Processo.objects.create(
+                escritorio=cls.escritorio,
+                numero_cnj=f'000000{i}-00.2024.8.26.0100',
+                cliente=cliente,
+                advogado_responsavel=cls.usuario,
+                vara='1ª Vara Cível',
+                comarca='São Paulo',
+                tribunal='TJSP',
+                data_distribuicao=hoje,
+                objeto='Cobrança',
+            )
+            Anotacao.objects.create(cliente=cliente, usuario=cls.usuario, titulo=f'Anotação {i}')
+            Entrevista.objects.create(
+                cliente=cliente,
+                usuario=cls.usuario,
+                data=hoje,
+                hora_inicio=time(10),
+                assunto='Primeira conversa',
+                relato='Relato',
+                status='realizada',
+            )
+            Andamento.objects.create(processo=processo, usuario=cls.usuario, data=hoje, descricao='Juntada')
+            Prazo.objects.create(
+                processo=processo,
+                responsavel=cls.usuario,
+                titulo='Contestação',
+                descricao='Prazo para contestar',
+                data_limite=hoje + timedelta(days=15),
+            )
+            Audiencia.objects.create(processo=processo, data=hoje + timedelta(days=30), local='Fórum')
+            CustaProcessual.objects.create(processo=processo, valor=Decimal('100.00'), data=hoje)
+            Financeiro.objects.create(
+                escritorio=cls.escritorio,
+                tipo='receita',
+                categoria='honorarios',
+                descricao=f'Receita {i}',
+                valor=Decimal('1000.00'),
+                data_vencimento=hoje,
+                cliente=cliente,
+                processo=processo,
+            )
+            contrato = ContratoHonorarios.objects.create(
+                processo=processo,
+                cliente=cliente,
+                valor_total=Decimal('3000.00'),
+                clausulas='Cláusulas',
+            )
+            contrato.gerar_parcelas()
+            MensagemWhatsApp.objects.create(
+                whatsapp_config=config,
+                numero_contato=cliente.telefone,
+                cliente=cliente,
+                direcao='entrada',
+                conteudo='Olá',
+            )
+            ConversaWhatsApp.objects.get_or_create(whatsapp_config=config, numero_contato=cliente.telefone)
+            FluxoChatbot.objects.create(escritorio=cls.escritorio, nome=f'Fluxo {i}', palavras_chave='oi')
+            Exportacao.objects.create(escritorio=cls.escritorio, usuario=cls.usuario, recurso='clientes')
+
+    def setUp(self):
+        # Como a autenticação deixa: usuário com o escritório já carregado
+        usuario = Usuario.objects.select_related('escritorio').get(pk=self.usuario.pk)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(usuario)
+
+    def listar(self, basename):
+        resposta = self.cliente.get(reverse(f'core:{basename}-list'))
+        self.assertEqual(resposta.status_code, 200, basename)
+        dados = resposta.json()
+        itens = dados['results'] if isinstance(dados, dict) else dados
+        self.assertTrue(itens, basename)
+        return itens
+
+    def test_listagem_e_detalhe(self):
+        for basename, (na_listagem, no_detalhe) in CONSULTAS.items():
+            with self.subTest(basename):
+                with self.assertNumQueries(na_listagem):
+                    itens = self.listar(basename)
+                with self.assertNumQueries(no_detalhe):
+                    resposta = self.cliente.get(reverse(f'core:{basename}-detail', args=[itens[0]['id']]))
+                self.assertEqual(resposta.status_code, 200, basename)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Variáveis das cláusulas do contrato: só as da lista, nunca atributos dos models
+"""
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from core.models import Cliente, ContratoHonorarios, Escritorio, Processo, Usuario
+from core.services.contrato_pdf import VARIAVEIS_CLAUSULAS, preencher_clausulas, variaveis_clausulas
+
+
+class ClausulasContratoTests(SimpleTestCase):
+
+    def setUp(self):
+        escritorio = Escritorio(nome='Silva Advogados', razao_social='Silva Sociedade de Advogados', cnpj='')
+        cliente = Cliente(
+            escritorio=escritorio,
+            nome='Maria Souza',
+            cpf_cnpj='123.456.789-09',
+            endereco='Rua A',
+            numero='10',
+            bairro='Centro',
+            cidade='Campinas',
+            estado='SP',
+            cep='13010000',
+        )
+        processo = Processo(
+            escritorio=escritorio,
+            cliente=cliente,
+            numero_cnj='0000001-00.2024.8.26.0114',
+            vara='2ª Vara Cível',
+            comarca='Campinas',
+        )
+        self.contrato = ContratoHonorarios(
+            processo=processo,
+            cliente=cliente,
+            valor_total=Decimal('12500.00'),
+            criado_por=Usuario(username='socio', password='pbkdf2_sha256$600000$sal$hash'),
+        )
+
+    def preencher(self, texto):
+        return preencher_clausulas(texto, variaveis_clausulas(self.contrato))
+
+    def test_variaveis_da_lista(self):
+        self.assertEqual(
+            self.preencher('{{ cliente.nome }} ({{cliente.cpf_cnpj}}) paga {{ contrato.valor_total }}.'),
+            'Maria Souza (123.456.789-09) paga R$ 12.500,00.'
+        )
+        self.assertEqual(set(variaveis_clausulas(self.contrato)), set(VARIAVEIS_CLAUSULAS))
+
+    def test_atributos_fora_da_lista_nao_aparecem(self):
+        self.assertEqual(self.preencher('Senha: {{ contrato.criado_por.password }}.'), 'Senha: .')
+        self.assertEqual(
+            self.preencher('{{ processo.escritorio.whatsapp_configs.first.api_key }}{{ contrato.gerar_parcelas }}'),
+            ''
+        )
+
+    def test_tags_de_template_ficam_como_texto(self):
+        texto = '{% load static %}{% debug %} cláusula {{ cliente.nome|upper }}'
+        self.assertEqual(self.preencher(texto), texto)
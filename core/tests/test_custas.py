@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Custas processuais: só em processos do escritório do usuário
+"""
+from datetime import date
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Cliente, CustaProcessual, Escritorio, Processo, Usuario
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CustasEscritorioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        advogados, processos = [], []
+        for indice in range(2):
+            escritorio = Escritorio.objects.create(
+                nome=f'Escritório {indice}', razao_social=f'Escritório {indice} Ltda'
+            )
+            advogado = Usuario.objects.create_user(
+                username=f'advogado{indice}', password='senha', tipo='socio', escritorio=escritorio
+            )
+            cliente = Cliente.objects.create(
+                escritorio=escritorio,
+                nome='Cliente',
+                telefone='5511988880000',
+                cep='01001000',
+                endereco='Praça da Sé',
+                numero='1',
+                bairro='Sé',
+                cidade='São Paulo',
+                estado='SP',
+            )
+            processos.append(Processo.objects.create(
+                escritorio=escritorio,
+                numero_cnj=f'000000{indice}-00.2024.8.26.0100',
+                cliente=cliente,
+                advogado_responsavel=advogado,
+                vara='1ª Vara Cível',
+                comarca='São Paulo',
+                data_distribuicao=date(2024, 1, 1),
+                objeto='Cobrança',
+            ))
+            advogados.append(advogado)
+        cls.usuario = advogados[0]
+        cls.processo, cls.processo_outro = processos
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def dados(self, processo):
+        return {'processo': processo.pk, 'tipo': 'iniciais', 'valor': '150.00', 'data': '2024-02-01'}
+
+    def test_cria_custa_no_proprio_escritorio(self):
+        resposta = self.cliente.post(reverse('core:custa-list'), self.dados(self.processo))
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(CustaProcessual.objects.get().criado_por, self.usuario)
+
+    def test_rejeita_processo_de_outro_escritorio(self):
+        resposta = self.cliente.post(reverse('core:custa-list'), self.dados(self.processo_outro))
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('processo', resposta.json())
+
+        custa = CustaProcessual.objects.create(processo=self.processo, valor='10.00', data=date(2024, 2, 1))
+        resposta = self.cliente.patch(
+            reverse('core:custa-detail', args=[custa.pk]), {'processo': self.processo_outro.pk}
+        )
+        self.assertEqual(resposta.status_code, 400)
+        custa.refresh_from_db()
+        self.assertEqual(custa.processo, self.processo)
+        self.assertFalse(CustaProcessual.objects.filter(processo=self.processo_outro).exists())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação CSV/XLSX: texto vindo do usuário nunca vira fórmula na planilha e
+o arquivo em segundo plano só é baixado por quem pediu
+"""
+import csv
+import io
+import shutil
+import tempfile
+import zipfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Cliente, Escritorio, Exportacao, Usuario
+from core.services.exportacao import escrever_xlsx, gerar_csv, gerar_exportacao
+
+FORMULA = '=HYPERLINK("http://exemplo.invalid","abrir")'
+COLUNAS = [('Nome', 'nome'), ('Telefone', 'telefone'), ('Número', 'numero')]
+
+
+class ExportacaoFormulaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        Cliente.objects.create(
+            escritorio=escritorio,
+            nome=FORMULA,
+            telefone='+5511988880000',
+            cep='01001000',
+            endereco='Praça da Sé',
+            numero='@SUM(1+1)',
+            bairro='Sé',
+            cidade='São Paulo',
+            estado='SP',
+        )
+
+    def test_csv_prefixa_formulas_com_apostrofo(self):
+        texto = ''.join(gerar_csv(Cliente.objects.all(), COLUNAS)).lstrip('﻿')
+        _, linha = csv.reader(io.StringIO(texto), delimiter=';')
+
+        self.assertEqual(linha, [f"'{FORMULA}", "'+5511988880000", "'@SUM(1+1)"])
+
+    def test_xlsx_grava_texto_e_nao_formula(self):
+        arquivo = io.BytesIO()
+        self.assertEqual(escrever_xlsx(arquivo, Cliente.objects.all(), COLUNAS), 1)
+
+        with zipfile.ZipFile(arquivo) as pacote:
+            aba = pacote.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            textos = aba + ''.join(
+                pacote.read(nome).decode('utf-8') for nome in pacote.namelist() if nome.endswith('sharedStrings.xml')
+            )
+        self.assertNotIn('<f>', aba)
+        self.assertIn('HYPERLINK', textos)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DownloadExportacaoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        cls.dono = Usuario.objects.create_user(username='dono', password='senha', escritorio=escritorio)
+        cls.colega = Usuario.objects.create_user(username='colega', password='senha', escritorio=escritorio)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.exportacao = Exportacao.objects.create(
+            escritorio=self.dono.escritorio, usuario=self.dono, recurso='clientes', formato='csv'
+        )
+        gerar_exportacao(self.exportacao, Cliente.objects.all(), COLUNAS)
+
+    def cliente_api(self, usuario):
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente
+
+    def test_nome_no_storage_e_aleatorio_e_url_nao_e_exposta(self):
+        self.assertNotIn('clientes', self.exportacao.arquivo.name)
+
+        dados = self.cliente_api(self.dono).get(reverse('core:exportacao-detail', args=[self.exportacao.pk])).json()
+
+        self.assertNotIn('arquivo', dados)
+        self.assertTrue(dados['download'].endswith(
+            reverse('core:exportacao-download', args=[self.exportacao.pk])
+        ))
+
+    def test_download_so_para_quem_pediu(self):
+        url = reverse('core:exportacao-download', args=[self.exportacao.pk])
+
+        resposta = self.cliente_api(self.dono).get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('filename="clientes_', resposta['Content-Disposition'])
+        self.assertEqual(self.cliente_api(self.colega).get(url).status_code, 404)
+        self.assertEqual(APIClient().get(url).status_code, 401)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Materialização de lançamentos recorrentes na primeira execução sobre dados
+antigos
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from core.models import Escritorio, Financeiro
+from core.services.recorrencia import materializar_recorrencias, origens_recorrentes
+
+
+@override_settings(FINANCEIRO_RECORRENCIA_HORIZONTE=60)
+class MaterializarRecorrenciasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+
+    def lancamento(self, **campos):
+        dados = {
+            'escritorio': self.escritorio,
+            'tipo': 'despesa',
+            'categoria': 'aluguel',
+            'descricao': 'Aluguel',
+            'valor': Decimal('1000.00'),
+            'data_vencimento': date(2024, 1, 10),
+            'periodicidade': 'mensal',
+        }
+        dados.update(campos)
+        return Financeiro.objects.create(**dados)
+
+    def test_parcelas_do_antigo_gerar_parcelas_nao_sao_series(self):
+        # Como o gerar_parcelas original gravava: sem ParcelaHonorarios
+        for numero in (1, 2, 3):
+            self.lancamento(
+                tipo='receita',
+                categoria='honorarios',
+                descricao=f'Honorários - Parcela {numero}/3',
+                data_vencimento=date(2024, numero, 10),
+                parcela_atual=numero,
+                total_parcelas=3,
+            )
+
+        self.assertFalse(origens_recorrentes().exists())
+        self.assertEqual(materializar_recorrencias(hoje=date(2024, 1, 1)), 0)
+        self.assertEqual(Financeiro.objects.count(), 3)
+
+    def test_serie_antiga_comeca_hoje(self):
+        origem = self.lancamento()
+
+        criadas = materializar_recorrencias(hoje=date(2024, 6, 15))
+
+        vencimentos = list(
+            Financeiro.objects.filter(serie_origem=origem).order_by('data_vencimento').values_list(
+                'data_vencimento', 'parcela_atual'
+            )
+        )
+        # Nada de fevereiro a junho; julho e agosto estão no horizonte de 60 dias
+        self.assertEqual(vencimentos, [(date(2024, 7, 10), 7), (date(2024, 8, 10), 8)])
+        self.assertEqual(criadas, 2)
+
+        self.assertEqual(materializar_recorrencias(hoje=date(2024, 6, 15)), 0)
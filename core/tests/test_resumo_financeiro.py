@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Endpoint /api/financeiro/resumo/: período inválido e nomes da resposta antiga
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Escritorio, Financeiro, Usuario
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ResumoFinanceiroTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        cls.usuario = Usuario.objects.create_user(
+            username='socio', password='senha', tipo='socio', escritorio=cls.escritorio
+        )
+        Financeiro.objects.create(
+            escritorio=cls.escritorio,
+            tipo='receita',
+            categoria='honorarios',
+            descricao='Consulta',
+            valor=Decimal('500.00'),
+            data_vencimento=date(2024, 3, 10),
+        )
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def resumo(self, periodo):
+        return self.cliente.get(reverse('core:financeiro-resumo'), {'periodo': periodo})
+
+    def test_periodo_sem_mes_seguinte_e_invalido(self):
+        for periodo in ('9999-12', '2024-01,9999-12', '2024-13', '2024-05,2024-01'):
+            with self.subTest(periodo):
+                resposta = self.resumo(periodo)
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('erro', resposta.json())
+
+    def test_mantem_nomes_da_resposta_antiga(self):
+        dados = self.resumo('2024-03').json()
+
+        self.assertEqual(Decimal(str(dados['receitas'])), Decimal('500.00'))
+        self.assertEqual(dados['receitas_mes'], dados['receitas'])
+        self.assertEqual(dados['despesas_mes'], dados['despesas'])
+        self.assertEqual(dados['saldo_mes'], dados['saldo'])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Fila de ingestão de webhooks: eventos anteriores à fila não são reprocessados
+e o modo síncrono não passa na frente de eventos já enfileirados
+"""
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Escritorio, WebhookEvent, WhatsAppConfig
+from core.services.webhook import processar_sincrono
+
+
+class EventosLegadosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        cls.config = WhatsAppConfig.objects.create(
+            escritorio=escritorio,
+            nome='Principal',
+            numero_telefone='5511999990000',
+            provider='outro',
+            api_url='http://127.0.0.1',
+            api_key='chave',
+        )
+
+    def evento(self, webhook_id, **campos):
+        return WebhookEvent.objects.create(
+            webhook_id=webhook_id, whatsapp_config=self.config, payload={}, **campos
+        )
+
+    def test_comando_descarta_nao_processados_e_alinha_processados(self):
+        falhou = self.evento('antigo-falhou')
+        processado = self.evento('antigo-ok', processed=True)
+        em_retentativa = self.evento('fila-erro', status='erro', tentativas=1)
+
+        call_command('marcar_webhooks_processados', stdout=io.StringIO())
+
+        falhou.refresh_from_db()
+        processado.refresh_from_db()
+        em_retentativa.refresh_from_db()
+        self.assertEqual(falhou.status, 'descartado')
+        self.assertFalse(falhou.processed)
+        self.assertEqual(processado.status, 'processado')
+        self.assertEqual(em_retentativa.status, 'erro')
+
+    def test_ate_preserva_eventos_posteriores(self):
+        recente = self.evento('recente')
+
+        call_command('marcar_webhooks_processados', ate='2000-01-01T00:00', stdout=io.StringIO())
+
+        recente.refresh_from_db()
+        self.assertEqual(recente.status, 'pendente')
+
+    def test_sincrono_nao_passa_na_frente_de_evento_em_espera(self):
+        self.evento('anterior', status='erro', tentativas=1, proxima_tentativa_em=timezone.now() + timedelta(minutes=5))
+        novo = self.evento('novo')
+
+        with mock.patch('core.services.webhook.agendar_drenagem') as agendar, \
+                mock.patch('core.services.webhook.processar_evento') as processar:
+            self.assertFalse(processar_sincrono(self.config, [novo]))
+
+        processar.assert_not_called()
+        agendar.assert_called_once_with(self.config.id)
+        novo.refresh_from_db()
+        self.assertEqual(novo.status, 'pendente')
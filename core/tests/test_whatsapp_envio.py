@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Envio de mensagens contra o provider falso (stub_whatsapp_provider), o
+limite de envio compartilhado no Redis e os callbacks de status
+"""
+import threading
+import uuid
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.management.commands.stub_whatsapp_provider import criar_servidor
+from core.models import Escritorio, MensagemWhatsApp, WhatsAppConfig
+from core.services.whatsapp_envio import (
+    ErroEnvioWhatsApp,
+    TokenBucketRedis,
+    _cliente_redis,
+    atualizar_status_envio,
+    enviar_mensagem,
+)
+
+
+@override_settings(WHATSAPP_ENVIO_TAXA=1000.0, WHATSAPP_ENVIO_RAJADA=1000)
+class EnvioProviderFalsoTests(TestCase):
+
+    def iniciar_provider(self, **opcoes):
+        recebidas = []
+        servidor = criar_servidor(
+            host='127.0.0.1',
+            registrar=lambda caminho, corpo, message_id: recebidas.append((caminho, corpo, message_id)),
+            **opcoes
+        )
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+
+        self.config.api_url = f'http://127.0.0.1:{servidor.server_address[1]}'
+        self.config.save(update_fields=['api_url'])
+        return recebidas
+
+    def setUp(self):
+        escritorio = Escritorio.objects.create(nome='Escritório Teste', razao_social='Escritório Teste Ltda')
+        self.config = WhatsAppConfig.objects.create(
+            escritorio=escritorio,
+            nome='Principal',
+            numero_telefone='5511999990000',
+            provider='outro',
+            api_url='http://127.0.0.1',
+            api_key='chave',
+        )
+        self.mensagem = MensagemWhatsApp.objects.create(
+            whatsapp_config=self.config,
+            numero_contato='5511988887777',
+            direcao='saida',
+            status='enviando',
+            conteudo='Olá',
+        )
+
+    def test_envio_registra_id_do_provider(self):
+        recebidas = self.iniciar_provider()
+
+        enviar_mensagem(self.mensagem)
+
+        caminho, corpo, message_id = recebidas[0]
+        self.assertEqual(caminho, '/messages')
+        self.assertEqual(corpo, {'to': '5511988887777', 'text': 'Olá'})
+
+        self.mensagem.refresh_from_db()
+        self.assertEqual(self.mensagem.status, 'enviado')
+        self.assertEqual(self.mensagem.message_id_externo, message_id)
+
+    def test_callback_antes_do_id_externo_e_aplicado_no_envio(self):
+        self.iniciar_provider()
+        # O provider confirmou a entrega antes de enviar_mensagem gravar o ID
+        self.assertEqual(atualizar_status_envio(self.config, 'externo-1', 'delivered'), 0)
+
+        with mock.patch('core.services.whatsapp_envio.extrair_id_externo', return_value='externo-1'):
+            enviar_mensagem(self.mensagem)
+
+        self.mensagem.refresh_from_db()
+        self.assertEqual(self.mensagem.status, 'entregue')
+        self.assertIsNotNone(self.mensagem.tempo_entrega)
+
+    def test_callback_de_erro_publica_status(self):
+        MensagemWhatsApp.objects.filter(pk=self.mensagem.pk).update(status='enviado', message_id_externo='externo-2')
+
+        with mock.patch('core.services.whatsapp_envio.publicar_status') as publicar:
+            self.assertEqual(atualizar_status_envio(self.config, 'externo-2', 'failed'), 1)
+
+        publicar.assert_called_once_with(self.config.id, '5511988887777', self.mensagem.pk, 'erro')
+
+    def test_provider_indisponivel_e_temporario(self):
+        self.iniciar_provider(falhas=1.0)
+
+        with self.assertRaises(ErroEnvioWhatsApp) as contexto:
+            enviar_mensagem(self.mensagem)
+        self.assertTrue(contexto.exception.temporario)
+
+    def test_429_usa_retry_after(self):
+        self.iniciar_provider(limite=1)
+        enviar_mensagem(self.mensagem)
+
+        with self.assertRaises(ErroEnvioWhatsApp) as contexto:
+            enviar_mensagem(self.mensagem)
+        self.assertTrue(contexto.exception.temporario)
+        self.assertEqual(contexto.exception.aguardar, 1.0)
+
+    def test_recusa_e_definitiva(self):
+        self.iniciar_provider()
+        self.mensagem.numero_contato = ''
+
+        with self.assertRaises(ErroEnvioWhatsApp) as contexto:
+            enviar_mensagem(self.mensagem)
+        self.assertFalse(contexto.exception.temporario)
+
+
+class TokenBucketRedisTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cliente = _cliente_redis()
+        try:
+            self.cliente.ping()
+        except redis.RedisError:
+            self.skipTest('Redis indisponível')
+        self.chave = f'teste_balde_{uuid.uuid4().hex}'
+        self.addCleanup(self.cliente.delete, self.chave)
+
+    def test_limite_vale_para_todos_os_processos(self):
+        # Dois baldes com a mesma chave: dois workers do mesmo número
+        worker_a = TokenBucketRedis(self.cliente, self.chave, taxa=0.01, capacidade=2)
+        worker_b = TokenBucketRedis(self.cliente, self.chave, taxa=0.01, capacidade=2)
+
+        self.assertEqual(worker_a.consumir(), 0)
+        self.assertEqual(worker_b.consumir(), 0)
+        self.assertGreater(worker_a.consumir(), 0)
+        self.assertGreater(worker_b.consumir(), 0)
+
+    def test_espera_ate_a_proxima_ficha(self):
+        balde = TokenBucketRedis(self.cliente, self.chave, taxa=1.0, capacidade=1)
+
+        self.assertEqual(balde.consumir(), 0)
+        self.assertAlmostEqual(balde.consumir(), 1.0, delta=0.1)
@@ -11,14 +11,18 @@ from .views import (
     AndamentoViewSet,
     PrazoViewSet,
     AudienciaViewSet,
+    CustaProcessualViewSet,
     FinanceiroViewSet,
     ContratoHonorariosViewSet,
     WhatsAppConfigViewSet,
     MensagemWhatsAppViewSet,
     FluxoChatbotViewSet,
     ConversaWhatsAppViewSet,
+    ExportacaoViewSet,
 )
 from .views_whatsapp import (
+    webhook_receber_mensagem,
+    webhook_receber_lote,
     painel_whatsapp,
     api_whatsapp_configs,
     api_conversas,
@@ -44,12 +48,14 @@ router.register(r'processos', ProcessoViewSet, basename='processo')
 router.register(r'andamentos', AndamentoViewSet, basename='andamento')
 router.register(r'prazos', PrazoViewSet, basename='prazo')
 router.register(r'audiencias', AudienciaViewSet, basename='audiencia')
+router.register(r'custas', CustaProcessualViewSet, basename='custa')
 router.register(r'financeiro', FinanceiroViewSet, basename='financeiro')
 router.register(r'contratos-honorarios', ContratoHonorariosViewSet, basename='contrato-honorarios')
 router.register(r'whatsapp-configs', WhatsAppConfigViewSet, basename='whatsapp-config')
 router.register(r'mensagens-whatsapp', MensagemWhatsAppViewSet, basename='mensagem-whatsapp')
 router.register(r'fluxos-chatbot', FluxoChatbotViewSet, basename='fluxo-chatbot')
 router.register(r'conversas-whatsapp', ConversaWhatsAppViewSet, basename='conversa-whatsapp')
+router.register(r'exportacoes', ExportacaoViewSet, basename='exportacao')
 
 app_name = 'core'
 
@@ -57,6 +63,10 @@ urlpatterns = [
     # Include router URLs
     path('', include(router.urls)),
     
+    # Webhook de entrada do WhatsApp (chamado pelo provider)
+    path('whatsapp/webhook/<int:config_id>/', webhook_receber_mensagem, name='webhook-whatsapp'),
+    path('whatsapp/webhook/<int:config_id>/lote/', webhook_receber_lote, name='webhook-whatsapp-lote'),
+    
     # URLs do Painel WhatsApp
     path('whatsapp/painel/', painel_whatsapp, name='painel-whatsapp'),
     path('whatsapp/configs/', api_whatsapp_configs, name='api-whatsapp-configs'),
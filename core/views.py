@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+from decimal import Decimal
+
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count, Sum
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Concat
+from django.http import FileResponse, HttpRequest, QueryDict
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
@@ -12,25 +18,97 @@ from django.contrib.auth.decorators import login_required
 
 from .models import (
     Escritorio, Usuario, Cliente, Anotacao, Entrevista,
-    Processo, Andamento, Prazo, Audiencia,
+    Processo, Andamento, Prazo, Audiencia, CustaProcessual,
     Financeiro, ContratoHonorarios, ParcelaHonorarios,
-    WhatsAppConfig, MensagemWhatsApp, FluxoChatbot, ConversaWhatsApp
+    WhatsAppConfig, MensagemWhatsApp, FluxoChatbot, ConversaWhatsApp, Exportacao
 )
 from .serializers import (
     EscritorioSerializer, UsuarioSerializer, UsuarioListSerializer,
-    ClienteSerializer, ClienteListSerializer, AnotacaoSerializer,
-    EntrevistaSerializer, ProcessoSerializer, ProcessoListSerializer,
-    AndamentoSerializer, PrazoSerializer, AudienciaSerializer,
+    ClienteSerializer, ClienteListSerializer, ClienteAutocompleteSerializer, AnotacaoSerializer,
+    EntrevistaSerializer, ProcessoSerializer, ProcessoListSerializer, ProcessoBuscaSerializer,
+    AndamentoSerializer, PrazoSerializer, AudienciaSerializer, CustaProcessualSerializer,
     FinanceiroSerializer, FinanceiroListSerializer,
     ContratoHonorariosSerializer, ParcelaHonorariosSerializer,
     WhatsAppConfigSerializer, MensagemWhatsAppSerializer,
-    FluxoChatbotSerializer, ConversaWhatsAppSerializer
+    FluxoChatbotSerializer, ConversaWhatsAppSerializer, ExportacaoSerializer, planejar_consulta
 )
+from .filters import BuscaTextualFilter, ClienteFilter, ProcessoFilter, FinanceiroFilter
 from .permissions import IsEscritorioMember, CanManageUsuarios, CanManageFinanceiro
+from .services.busca import autocompletar_clientes
+from .services.exportacao import FORMATOS, TIPOS_CONTEUDO, nome_arquivo, resposta_exportacao
+from .services.metricas import chave_mes, financeiro_no_periodo, interpretar_periodo, obter_metricas
+from .services.resumo_financeiro import resumo_financeiro
+from .tasks import gerar_exportacao, gerar_pdf_contrato, gerar_pdfs_cliente
+
+
+class ConsultaPlanejadaMixin:
+    """
+    Aplica ao queryset as relações declaradas no Meta do serializer da ação
+    (select_related/prefetch_related/only, ver serializers.planejar_consulta)
+    
+    As viewsets definem consulta_base() com o recorte do escritório em vez
+    de sobrescrever get_queryset().
+    """
+    
+    def consulta_base(self):
+        return super().get_queryset()
+    
+    def get_queryset(self):
+        return planejar_consulta(self.consulta_base(), self.get_serializer_class())
+
+
+class ExportacaoMixin:
+    """
+    Action 'exportar': a listagem inteira em CSV ou XLSX
+    
+    Mesmos filtros, busca e ordenação da listagem (filter_queryset), sem
+    paginação; as linhas vão para a resposta à medida que são lidas
+    (core.services.exportacao).
+    
+    Parâmetros:
+    - formato: csv (padrão) ou xlsx
+    - assincrono=1: gera em segundo plano; acompanhe em /api/exportacoes/
+    """
+    recurso_exportacao = None
+    # [(cabeçalho, campo do values_list), ...]
+    colunas_exportacao = []
+    
+    def consulta_exportacao(self):
+        return self.filter_queryset(self.consulta_base())
+    
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return Response(
+                {'erro': f"Formato inválido. Use: {', '.join(FORMATOS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if request.query_params.get('assincrono') in ('1', 'true'):
+            parametros = {
+                chave: request.query_params.getlist(chave)
+                for chave in request.query_params
+                if chave not in ('formato', 'assincrono')
+            }
+            exportacao = Exportacao.objects.create(
+                escritorio=request.user.escritorio,
+                usuario=request.user,
+                recurso=self.recurso_exportacao,
+                formato=formato,
+                parametros=parametros,
+            )
+            transaction.on_commit(lambda: gerar_exportacao.delay(exportacao.pk))
+            serializer = ExportacaoSerializer(exportacao, context=self.get_serializer_context())
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        
+        return resposta_exportacao(
+            self.consulta_exportacao(), self.colunas_exportacao, formato, self.recurso_exportacao
+        )
 
 
 # ========== ESCRITÓRIO ==========
-class EscritorioViewSet(viewsets.ModelViewSet):
+class EscritorioViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Escritorio.objects.all()
     serializer_class = EscritorioSerializer
     permission_classes = [IsAuthenticated]
@@ -38,7 +116,7 @@ class EscritorioViewSet(viewsets.ModelViewSet):
     search_fields = ['nome', 'razao_social', 'cnpj']
     ordering_fields = ['nome', 'criado_em']
     
-    def get_queryset(self):
+    def consulta_base(self):
         user = self.request.user
         if user.is_superuser:
             return Escritorio.objects.all()
@@ -46,30 +124,51 @@ class EscritorioViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def estatisticas(self, request, pk=None):
-        """Retorna estatísticas do escritório"""
+        """
+        Retorna estatísticas do escritório
+        
+        Lê o retrato materializado (MetricasEscritorio): uma linha, qualquer
+        que seja o volume de processos e lançamentos.
+        
+        Parâmetros:
+        - periodo: AAAA-MM ou AAAA-MM,AAAA-MM (receitas/despesas por mês no intervalo)
+        """
         escritorio = self.get_object()
+        metricas = obter_metricas(escritorio.pk)
+        
+        mes_atual = chave_mes(timezone.localdate())
+        financeiro_mes = metricas.financeiro_mensal.get(mes_atual, {})
         
         stats = {
-            'total_usuarios': escritorio.usuarios.count(),
-            'total_clientes': escritorio.clientes.count(),
-            'total_processos': escritorio.processos.count(),
-            'processos_ativos': escritorio.processos.filter(situacao='ativo').count(),
-            'processos_por_tipo': escritorio.processos.values('tipo').annotate(total=Count('id')),
-            'receitas_mes': escritorio.financeiro.filter(
-                tipo='receita',
-                data_vencimento__month=timezone.now().month
-            ).aggregate(total=Sum('valor'))['total'] or 0,
-            'despesas_mes': escritorio.financeiro.filter(
-                tipo='despesa',
-                data_vencimento__month=timezone.now().month
-            ).aggregate(total=Sum('valor'))['total'] or 0,
+            'total_usuarios': metricas.total_usuarios,
+            'total_clientes': metricas.total_clientes,
+            'total_processos': metricas.total_processos,
+            'processos_ativos': metricas.processos_ativos,
+            'processos_por_tipo': [
+                {'tipo': tipo, 'total': total}
+                for tipo, total in metricas.processos_por_tipo.items()
+            ],
+            'processos_por_situacao': metricas.processos_por_situacao,
+            # Mês E ano correntes (antes somava o mesmo mês de todos os anos)
+            'receitas_mes': Decimal(financeiro_mes.get('receitas', '0.00')),
+            'despesas_mes': Decimal(financeiro_mes.get('despesas', '0.00')),
+            'calculado_em': metricas.calculado_em,
+            'desatualizado': metricas.desatualizado,
         }
         
+        periodo = request.query_params.get('periodo')
+        if periodo:
+            try:
+                inicio, fim = interpretar_periodo(periodo)
+            except ValueError as e:
+                return Response({'erro': f'Período inválido: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            stats['periodo'] = financeiro_no_periodo(metricas, inicio, fim)
+        
         return Response(stats)
 
 
 # ========== USUÁRIO ==========
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Usuario.objects.all()
     permission_classes = [IsAuthenticated, CanManageUsuarios]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -82,7 +181,7 @@ class UsuarioViewSet(viewsets.ModelViewSet):
             return UsuarioListSerializer
         return UsuarioSerializer
     
-    def get_queryset(self):
+    def consulta_base(self):
         user = self.request.user
         if user.is_superuser:
             return Usuario.objects.all()
@@ -113,20 +212,28 @@ class UsuarioViewSet(viewsets.ModelViewSet):
 
 
 # ========== CLIENTE ==========
-class ClienteViewSet(viewsets.ModelViewSet):
+class ClienteViewSet(ExportacaoMixin, ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Cliente.objects.all()
     permission_classes = [IsAuthenticated, IsEscritorioMember]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['tipo', 'ativo', 'estado', 'cliente_preferencial']
-    search_fields = ['nome', 'nome_social', 'cpf_cnpj', 'telefone', 'email']
+    filter_backends = [DjangoFilterBackend, BuscaTextualFilter, filters.OrderingFilter]
+    filterset_class = ClienteFilter
     ordering_fields = ['nome', 'criado_em']
+    recurso_exportacao = 'clientes'
+    colunas_exportacao = [
+        ('ID', 'id'), ('Tipo', 'tipo'), ('Nome/Razão Social', 'nome'), ('CPF/CNPJ', 'cpf_cnpj'),
+        ('Telefone', 'telefone'), ('Celular', 'celular'), ('E-mail', 'email'),
+        ('Cidade', 'cidade'), ('Estado', 'estado'), ('Ativo', 'ativo'),
+        ('Preferencial', 'cliente_preferencial'), ('Cadastrado em', 'criado_em'),
+    ]
     
     def get_serializer_class(self):
         if self.action == 'list':
             return ClienteListSerializer
+        if self.action == 'autocompletar':
+            return ClienteAutocompleteSerializer
         return ClienteSerializer
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Cliente.objects.filter(escritorio=self.request.user.escritorio)
     
     def perform_create(self, serializer):
@@ -139,7 +246,7 @@ class ClienteViewSet(viewsets.ModelViewSet):
     def processos(self, request, pk=None):
         """Retorna todos os processos do cliente"""
         cliente = self.get_object()
-        processos = cliente.processos.all()
+        processos = planejar_consulta(cliente.processos.all(), ProcessoListSerializer)
         serializer = ProcessoListSerializer(processos, many=True)
         return Response(serializer.data)
     
@@ -147,12 +254,25 @@ class ClienteViewSet(viewsets.ModelViewSet):
     def financeiro(self, request, pk=None):
         """Retorna histórico financeiro do cliente"""
         cliente = self.get_object()
-        financeiro = cliente.financeiro.all()
+        financeiro = planejar_consulta(cliente.financeiro.all(), FinanceiroListSerializer)
         serializer = FinanceiroListSerializer(financeiro, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def autocompletar(self, request):
+        """Sugestões de clientes do escritório (?q=nome, CPF/CNPJ, telefone ou e-mail)"""
+        termo = request.query_params.get('q', '').strip()
+        if len(termo) < 2:
+            return Response(
+                {'erro': 'Informe ao menos 2 caracteres em q'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        clientes = autocompletar_clientes(request.user.escritorio_id, termo)
+        return Response(self.get_serializer(clientes, many=True).data)
 
 # ========== ENTREVISTA ==========
-class EntrevistaViewSet(viewsets.ModelViewSet):
+class EntrevistaViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Entrevista.objects.all()
     serializer_class = EntrevistaSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -161,7 +281,7 @@ class EntrevistaViewSet(viewsets.ModelViewSet):
     search_fields = ['assunto', 'cliente__nome']
     ordering_fields = ['data', 'hora_inicio']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Entrevista.objects.filter(cliente__escritorio=self.request.user.escritorio)
     
     @action(detail=False, methods=['get'])
@@ -177,22 +297,38 @@ class EntrevistaViewSet(viewsets.ModelViewSet):
 
 
 # ========== PROCESSO ==========
-class ProcessoViewSet(viewsets.ModelViewSet):
+class ProcessoViewSet(ExportacaoMixin, ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Processo.objects.all()
     permission_classes = [IsAuthenticated, IsEscritorioMember]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['tipo', 'situacao', 'cliente', 'advogado_responsavel']
-    search_fields = ['numero_cnj', 'cliente__nome', 'objeto']
+    filter_backends = [DjangoFilterBackend, BuscaTextualFilter, filters.OrderingFilter]
+    filterset_class = ProcessoFilter
     ordering_fields = ['data_distribuicao', 'criado_em']
+    recurso_exportacao = 'processos'
+    colunas_exportacao = [
+        ('Número CNJ', 'numero_cnj'), ('Cliente', 'cliente__nome'), ('Tipo', 'tipo'),
+        ('Situação', 'situacao'), ('Advogado', 'advogado_nome'), ('Vara', 'vara'),
+        ('Comarca', 'comarca'), ('Tribunal', 'tribunal'), ('Valor da Causa', 'valor_causa'),
+        ('Distribuição', 'data_distribuicao'), ('Polo Ativo', 'polo_ativo'),
+        ('Polo Passivo', 'polo_passivo'), ('Objeto', 'objeto'),
+    ]
     
     def get_serializer_class(self):
         if self.action == 'list':
             return ProcessoListSerializer
+        if self.action == 'buscar':
+            return ProcessoBuscaSerializer
         return ProcessoSerializer
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Processo.objects.filter(escritorio=self.request.user.escritorio)
     
+    def consulta_exportacao(self):
+        return super().consulta_exportacao().annotate(
+            advogado_nome=Concat(
+                'advogado_responsavel__first_name', Value(' '), 'advogado_responsavel__last_name'
+            )
+        )
+    
     def perform_create(self, serializer):
         serializer.save(
             escritorio=self.request.user.escritorio,
@@ -203,7 +339,7 @@ class ProcessoViewSet(viewsets.ModelViewSet):
     def andamentos(self, request, pk=None):
         """Retorna andamentos do processo"""
         processo = self.get_object()
-        andamentos = processo.andamentos.all()
+        andamentos = planejar_consulta(processo.andamentos.all(), AndamentoSerializer)
         serializer = AndamentoSerializer(andamentos, many=True)
         return Response(serializer.data)
     
@@ -211,13 +347,29 @@ class ProcessoViewSet(viewsets.ModelViewSet):
     def prazos(self, request, pk=None):
         """Retorna prazos do processo"""
         processo = self.get_object()
-        prazos = processo.prazos.filter(status='pendente')
+        prazos = planejar_consulta(processo.prazos.filter(status='pendente'), PrazoSerializer)
         serializer = PrazoSerializer(prazos, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        """Busca textual ranqueada (?q=), com os demais filtros da listagem"""
+        termo = request.query_params.get('q', '').strip()
+        if len(termo) < 2:
+            return Response(
+                {'erro': 'Informe ao menos 2 caracteres em q'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        processos = self.filter_queryset(self.get_queryset()).buscar(termo)
+        pagina = self.paginate_queryset(processos)
+        if pagina is not None:
+            return self.get_paginated_response(self.get_serializer(pagina, many=True).data)
+        return Response(self.get_serializer(processos, many=True).data)
 
 
 # ========== ANDAMENTO ==========
-class AndamentoViewSet(viewsets.ModelViewSet):
+class AndamentoViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Andamento.objects.all()
     serializer_class = AndamentoSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -226,12 +378,12 @@ class AndamentoViewSet(viewsets.ModelViewSet):
     search_fields = ['descricao', 'processo__numero_cnj']
     ordering_fields = ['data', 'criado_em']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Andamento.objects.filter(processo__escritorio=self.request.user.escritorio)
 
 
 # ========== PRAZO ==========
-class PrazoViewSet(viewsets.ModelViewSet):
+class PrazoViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Prazo.objects.all()
     serializer_class = PrazoSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -240,7 +392,7 @@ class PrazoViewSet(viewsets.ModelViewSet):
     search_fields = ['titulo', 'descricao', 'processo__numero_cnj']
     ordering_fields = ['data_limite', 'prioridade']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Prazo.objects.filter(processo__escritorio=self.request.user.escritorio)
     
     @action(detail=False, methods=['get'])
@@ -267,7 +419,7 @@ class PrazoViewSet(viewsets.ModelViewSet):
 
 
 # ========== AUDIÊNCIA ==========
-class AudienciaViewSet(viewsets.ModelViewSet):
+class AudienciaViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Audiencia.objects.all()
     serializer_class = AudienciaSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -276,7 +428,7 @@ class AudienciaViewSet(viewsets.ModelViewSet):
     search_fields = ['processo__numero_cnj', 'local']
     ordering_fields = ['data', 'hora']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Audiencia.objects.filter(processo__escritorio=self.request.user.escritorio)
     
     @action(detail=False, methods=['get'])
@@ -292,21 +444,47 @@ class AudienciaViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+# ========== CUSTAS ==========
+class CustaProcessualViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
+    queryset = CustaProcessual.objects.all()
+    serializer_class = CustaProcessualSerializer
+    permission_classes = [IsAuthenticated, IsEscritorioMember]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['processo', 'tipo', 'pago', 'reembolsavel']
+    search_fields = ['descricao', 'processo__numero_cnj']
+    ordering_fields = ['data', 'valor']
+    
+    def consulta_base(self):
+        return CustaProcessual.objects.filter(processo__escritorio=self.request.user.escritorio)
+    
+    def perform_create(self, serializer):
+        serializer.save(criado_por=self.request.user)
+
+
 # ========== FINANCEIRO ==========
-class FinanceiroViewSet(viewsets.ModelViewSet):
+class FinanceiroViewSet(ExportacaoMixin, ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Financeiro.objects.all()
     permission_classes = [IsAuthenticated, IsEscritorioMember, CanManageFinanceiro]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['tipo', 'categoria', 'status', 'cliente', 'processo']
+    filterset_class = FinanceiroFilter
     search_fields = ['descricao', 'cliente__nome']
     ordering_fields = ['data_vencimento', 'valor']
+    recurso_exportacao = 'financeiro'
+    colunas_exportacao = [
+        ('ID', 'id'), ('Tipo', 'tipo'), ('Categoria', 'categoria'), ('Descrição', 'descricao'),
+        ('Cliente', 'cliente__nome'), ('Processo', 'processo__numero_cnj'),
+        ('Valor', 'valor'), ('Valor Pago', 'valor_pago'), ('Vencimento', 'data_vencimento'),
+        ('Pagamento', 'data_pagamento'), ('Status', 'status'),
+        ('Forma de Pagamento', 'forma_pagamento'), ('Parcela', 'parcela_atual'),
+        ('Total de Parcelas', 'total_parcelas'),
+    ]
     
     def get_serializer_class(self):
         if self.action == 'list':
             return FinanceiroListSerializer
         return FinanceiroSerializer
     
-    def get_queryset(self):
+    def consulta_base(self):
         return Financeiro.objects.filter(escritorio=self.request.user.escritorio)
     
     def perform_create(self, serializer):
@@ -317,28 +495,26 @@ class FinanceiroViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def resumo(self, request):
-        """Retorna resumo financeiro"""
-        qs = self.get_queryset()
-        mes_atual = timezone.now().month
+        """
+        Retorna resumo financeiro
         
-        resumo = {
-            'receitas_mes': qs.filter(tipo='receita', data_vencimento__month=mes_atual).aggregate(
-                total=Sum('valor')
-            )['total'] or 0,
-            'despesas_mes': qs.filter(tipo='despesa', data_vencimento__month=mes_atual).aggregate(
-                total=Sum('valor')
-            )['total'] or 0,
-            'pendentes': qs.filter(status='pendente').count(),
-            'vencidos': qs.filter(status='vencido').count(),
-        }
+        Totais do período, contas em aberto/vencidas e projeção de caixa dos
+        próximos 12 meses (core.services.resumo_financeiro, com cache).
         
-        resumo['saldo_mes'] = resumo['receitas_mes'] - resumo['despesas_mes']
+        Parâmetros:
+        - periodo: AAAA-MM ou AAAA-MM,AAAA-MM (padrão: mês atual)
+        """
+        periodo = request.query_params.get('periodo') or chave_mes(timezone.localdate())
+        try:
+            inicio, fim = interpretar_periodo(periodo)
+        except ValueError as e:
+            return Response({'erro': f'Período inválido: {e}'}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(resumo)
+        return Response(resumo_financeiro(request.user.escritorio_id, inicio, fim))
 
 
 # ========== CONTRATO HONORÁRIOS ==========
-class ContratoHonorariosViewSet(viewsets.ModelViewSet):
+class ContratoHonorariosViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = ContratoHonorarios.objects.all()
     serializer_class = ContratoHonorariosSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -347,7 +523,7 @@ class ContratoHonorariosViewSet(viewsets.ModelViewSet):
     search_fields = ['processo__numero_cnj', 'cliente__nome']
     ordering_fields = ['criado_em', 'valor_total']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return ContratoHonorarios.objects.filter(processo__escritorio=self.request.user.escritorio)
     
     @action(detail=True, methods=['post'])
@@ -355,12 +531,49 @@ class ContratoHonorariosViewSet(viewsets.ModelViewSet):
         """Gera parcelas do contrato"""
         contrato = self.get_object()
         contrato.gerar_parcelas()
+        # Recarrega: as parcelas pré-carregadas por get_object() ficaram antigas
+        contrato = self.get_object()
         serializer = self.get_serializer(contrato)
         return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def gerar_pdf(self, request, pk=None):
+        """Agenda a geração do PDF (?forcar=1 renderiza mesmo sem mudanças)"""
+        contrato = self.get_object()
+        forcar = request.query_params.get('forcar') in ('1', 'true')
+        transaction.on_commit(lambda: gerar_pdf_contrato.delay(contrato.pk, forcar))
+        return Response({'status': 'agendado'}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'])
+    def gerar_pdfs(self, request):
+        """Agenda, em um só job, os PDFs de todos os contratos de um cliente (?cliente=id)"""
+        cliente_id = str(request.query_params.get('cliente') or request.data.get('cliente') or '')
+        cliente = None
+        if cliente_id.isdigit():
+            cliente = Cliente.objects.filter(pk=cliente_id, escritorio=request.user.escritorio).first()
+        if cliente is None:
+            return Response({'erro': 'Informe um cliente do escritório'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        forcar = request.query_params.get('forcar') in ('1', 'true')
+        transaction.on_commit(lambda: gerar_pdfs_cliente.delay(cliente.pk, forcar))
+        return Response({'status': 'agendado', 'cliente': cliente.pk}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def pdf(self, request, pk=None):
+        """Baixa o último PDF gerado"""
+        contrato = self.get_object()
+        if not contrato.pdf_gerado:
+            return Response({'erro': 'PDF ainda não gerado'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            contrato.pdf_gerado.open('rb'),
+            as_attachment=True,
+            filename=f'contrato_{contrato.pk}.pdf',
+            content_type='application/pdf'
+        )
 
 
 # ========== WHATSAPP ==========
-class WhatsAppConfigViewSet(viewsets.ModelViewSet):
+class WhatsAppConfigViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = WhatsAppConfig.objects.all()
     serializer_class = WhatsAppConfigSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -369,7 +582,7 @@ class WhatsAppConfigViewSet(viewsets.ModelViewSet):
     search_fields = ['nome', 'numero_telefone']
     ordering_fields = ['criado_em', 'nome']
     
-    def get_queryset(self):
+    def consulta_base(self):
         user = self.request.user
         configs = WhatsAppConfig.objects.filter(escritorio=user.escritorio)
         
@@ -380,7 +593,7 @@ class WhatsAppConfigViewSet(viewsets.ModelViewSet):
         return configs
 
 
-class MensagemWhatsAppViewSet(viewsets.ModelViewSet):
+class MensagemWhatsAppViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = MensagemWhatsApp.objects.all()
     serializer_class = MensagemWhatsAppSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -389,7 +602,7 @@ class MensagemWhatsAppViewSet(viewsets.ModelViewSet):
     search_fields = ['conteudo', 'numero_contato', 'nome_contato']
     ordering_fields = ['criado_em']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return MensagemWhatsApp.objects.filter(
             whatsapp_config__escritorio=self.request.user.escritorio
         )
@@ -403,7 +616,7 @@ class MensagemWhatsAppViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class FluxoChatbotViewSet(viewsets.ModelViewSet):
+class FluxoChatbotViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = FluxoChatbot.objects.all()
     serializer_class = FluxoChatbotSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -412,11 +625,11 @@ class FluxoChatbotViewSet(viewsets.ModelViewSet):
     search_fields = ['nome', 'descricao']
     ordering_fields = ['ordem', 'nome']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return FluxoChatbot.objects.filter(escritorio=self.request.user.escritorio)
 
 
-class ConversaWhatsAppViewSet(viewsets.ModelViewSet):
+class ConversaWhatsAppViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = ConversaWhatsApp.objects.all()
     serializer_class = ConversaWhatsAppSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -425,7 +638,7 @@ class ConversaWhatsAppViewSet(viewsets.ModelViewSet):
     search_fields = ['numero_contato', 'nome_contato']
     ordering_fields = ['ultima_mensagem', 'criada_em']
     
-    def get_queryset(self):
+    def consulta_base(self):
         return ConversaWhatsApp.objects.filter(
             whatsapp_config__escritorio=self.request.user.escritorio
         )
@@ -439,4 +652,58 @@ class ConversaWhatsAppViewSet(viewsets.ModelViewSet):
         ).order_by('-ultima_mensagem')
         
         serializer = self.get_serializer(conversas, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+# ========== EXPORTAÇÕES ==========
+class ExportacaoViewSet(ConsultaPlanejadaMixin, viewsets.ReadOnlyModelViewSet):
+    """Exportações em segundo plano do usuário (status e download do arquivo)"""
+    queryset = Exportacao.objects.all()
+    serializer_class = ExportacaoSerializer
+    permission_classes = [IsAuthenticated, IsEscritorioMember]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['recurso', 'formato', 'status']
+    ordering_fields = ['criado_em']
+    
+    def consulta_base(self):
+        return Exportacao.objects.filter(usuario=self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Baixa o arquivo gerado (só o usuário que pediu a exportação)"""
+        exportacao = self.get_object()
+        if exportacao.status != 'concluida' or not exportacao.arquivo:
+            return Response({'erro': 'Exportação ainda não concluída'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            exportacao.arquivo.open('rb'),
+            as_attachment=True,
+            filename=nome_arquivo(exportacao.recurso, exportacao.formato, exportacao.concluido_em),
+            content_type=TIPOS_CONTEUDO[exportacao.formato]
+        )
+
+
+VIEWSETS_EXPORTACAO = {
+    viewset.recurso_exportacao: viewset
+    for viewset in (ClienteViewSet, ProcessoViewSet, FinanceiroViewSet)
+}
+
+
+def consulta_exportacao(exportacao):
+    """
+    (queryset, colunas) de uma Exportacao (core.tasks.gerar_exportacao)
+    
+    Refaz a requisição original com os parâmetros gravados: filtros, busca e
+    ordenação saem iguais aos da listagem.
+    """
+    http_request = HttpRequest()
+    http_request.method = 'GET'
+    http_request.GET = QueryDict(mutable=True)
+    for chave, valores in exportacao.parametros.items():
+        http_request.GET.setlist(chave, valores)
+    
+    request = Request(http_request)
+    request.user = exportacao.usuario
+    
+    viewset = VIEWSETS_EXPORTACAO[exportacao.recurso](
+        request=request, args=(), kwargs={}, format_kwarg=None, action='exportar'
+    )
+    return viewset.consulta_exportacao(), viewset.colunas_exportacao
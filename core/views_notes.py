@@ -15,9 +15,10 @@ from django.db.models import Q
 from .models import CategoriaAnotacao, Anotacao
 from .serializers import AnotacaoSerializer
 from .permissions import IsEscritorioMember
+from .views import ConsultaPlanejadaMixin
 
 # ViewSet para API (mantém o existente)
-class AnotacaoViewSet(viewsets.ModelViewSet):
+class AnotacaoViewSet(ConsultaPlanejadaMixin, viewsets.ModelViewSet):
     queryset = Anotacao.objects.all()
     serializer_class = AnotacaoSerializer
     permission_classes = [IsAuthenticated, IsEscritorioMember]
@@ -26,7 +27,7 @@ class AnotacaoViewSet(viewsets.ModelViewSet):
     search_fields = ['titulo', 'conteudo']
     ordering_fields = ['criado_em', 'importante']
     
-    def get_queryset(self):
+    def consulta_base(self):
         qs = Anotacao.objects.filter(cliente__escritorio=self.request.user.escritorio)
         # Filtrar anotações privadas
         if not self.request.user.is_superuser:
@@ -7,13 +7,32 @@ from django.views.decorators.http import require_http_methods
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 import json
+import logging
 from .models import WebhookEvent, WhatsAppConfig, MensagemWhatsApp, ConversaWhatsApp
 from .serializers import (
     WhatsAppConfigSerializer, 
     MensagemWhatsAppSerializer,
+    MensagemWhatsAppResumoSerializer,
     ConversaWhatsAppSerializer
 )
+from .services.webhook import (
+    extrair_webhook_id,
+    extrair_eventos,
+    ingerir_lote,
+    processar_sincrono,
+    registrar_falha,
+    agendar_drenagem,
+)
+from .services.idempotencia import webhooks_recentes
+from .services.realtime import publicar_mensagens, publicar_leitura, publicar_atribuicao
+from .services.whatsapp_envio import enfileirar_envio
+
+logger = logging.getLogger(__name__)
+
 
 @csrf_exempt
 def webhook_receber_mensagem(request, config_id):
@@ -21,61 +40,61 @@ def webhook_receber_mensagem(request, config_id):
     Webhook para receber mensagens do WhatsApp
     
     IDEMPOTÊNCIA: Mesmo webhook recebido múltiplas vezes só será processado uma vez
+    
+    MODO ASSÍNCRONO (WHATSAPP_WEBHOOK_ASSINCRONO): apenas grava o evento e responde;
+    o processamento fica com os workers Celery (core.tasks.processar_webhooks_pendentes)
     """
     
     if request.method != 'POST':
         return HttpResponseBadRequest('Apenas POST é aceito')
     
-    try:
-        # Busca configuração
-        config = WhatsAppConfig.objects.get(id=config_id, ativo=True)
-    except WhatsAppConfig.DoesNotExist:
-        return HttpResponseBadRequest('Configuração não encontrada ou inativa')
-    
     try:
         payload = json.loads(request.body)
     except json.JSONDecodeError:
         return HttpResponseBadRequest('JSON inválido')
     
     # CRÍTICO: Extrai ID único do webhook (varia por provider)
-    # Evolution API: payload['data']['key']['id']
-    # Twilio: payload['MessageSid']
-    # Ajuste conforme seu provider
-    webhook_id = (
-        payload.get('id') or 
-        payload.get('MessageSid') or 
-        payload.get('data', {}).get('key', {}).get('id')
-    )
+    webhook_id = extrair_webhook_id(payload)
     
-    if not webhook_id:
-        # Se não tem ID, gera um baseado em timestamp + hash
-        import hashlib
-        import time
-        webhook_id = hashlib.md5(
-            f"{time.time()}{json.dumps(payload)}".encode()
-        ).hexdigest()
+    # Retentativas em rajada do provider são respondidas sem tocar no banco
+    if webhooks_recentes.contem(webhook_id):
+        return JsonResponse({
+            'status': 'already_processed',
+            'message': 'Webhook já foi processado anteriormente'
+        })
     
-    # IDEMPOTÊNCIA: Verifica se já processou este webhook
-    if WebhookEvent.objects.filter(webhook_id=webhook_id).exists():
+    try:
+        # Busca configuração
+        config = WhatsAppConfig.objects.get(id=config_id, ativo=True)
+    except WhatsAppConfig.DoesNotExist:
+        return HttpResponseBadRequest('Configuração não encontrada ou inativa')
+    
+    # IDEMPOTÊNCIA: INSERT ... ON CONFLICT em um único comando, sem janela de corrida
+    webhook_event, criado = WebhookEvent.registrar(config, webhook_id, payload)
+    webhooks_recentes.adicionar(webhook_id)
+    
+    if not criado:
         return JsonResponse({
             'status': 'already_processed',
             'message': 'Webhook já foi processado anteriormente'
         })
     
-    # Registra o webhook
-    webhook_event = WebhookEvent.objects.create(
-        webhook_id=webhook_id,
-        whatsapp_config=config,
-        payload=payload,
-        processed=False
-    )
+    if settings.WHATSAPP_WEBHOOK_ASSINCRONO:
+        transaction.on_commit(lambda: agendar_drenagem(config.id))
+        return JsonResponse({
+            'status': 'queued',
+            'webhook_id': webhook_id,
+            'message': 'Webhook registrado para processamento'
+        }, status=202)
     
     try:
-        # Processa a mensagem (ajuste conforme estrutura do seu provider)
-        processar_mensagem_recebida(config, payload, webhook_event)
-        
-        webhook_event.processed = True
-        webhook_event.save()
+        # Processa a mensagem sob o mesmo lock da fila (ajuste conforme estrutura do seu provider)
+        if not processar_sincrono(config, [webhook_event]):
+            return JsonResponse({
+                'status': 'queued',
+                'webhook_id': webhook_id,
+                'message': 'Webhook registrado para processamento'
+            }, status=202)
         
         return JsonResponse({
             'status': 'ok',
@@ -85,10 +104,12 @@ def webhook_receber_mensagem(request, config_id):
     
     except Exception as e:
         # Log do erro mas NÃO retorna erro (para evitar reenvio)
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f'Erro ao processar webhook {webhook_id}: {str(e)}')
         
+        # Evento fica com status 'erro' e é reprocessado pela fila
+        registrar_falha(webhook_event, e)
+        agendar_drenagem(config.id)
+        
         # Retorna sucesso para o provider não reenviar
         return JsonResponse({
             'status': 'error_logged',
@@ -96,52 +117,41 @@ def webhook_receber_mensagem(request, config_id):
         })
 
 
-def processar_mensagem_recebida(config, payload, webhook_event):
+@csrf_exempt
+def webhook_receber_lote(request, config_id):
     """
-    Processa o payload e cria MensagemWhatsApp + ConversaWhatsApp
-    
-    IMPORTANTE: Ajuste conforme a estrutura do SEU provider
+    Webhook em lote: aceita um array de eventos (ou o envelope do provider)
+
+    Um único INSERT ... ON CONFLICT registra o lote; as mensagens são criadas
+    com bulk_create e as conversas atualizadas uma vez por contato.
     """
     
-    # Exemplo genérico - AJUSTE conforme Evolution/Twilio/Meta
-    numero_contato = payload.get('from') or payload.get('sender')
-    nome_contato = payload.get('pushName') or payload.get('senderName') or ''
-    conteudo = payload.get('text') or payload.get('body') or ''
-    tipo = 'texto'  # TODO: detectar tipo (imagem, audio, etc)
+    if request.method != 'POST':
+        return HttpResponseBadRequest('Apenas POST é aceito')
     
-    if not numero_contato:
-        raise ValueError('Número do contato não encontrado no payload')
+    try:
+        payload = json.loads(request.body)
+    except json.JSONDecodeError:
+        return HttpResponseBadRequest('JSON inválido')
     
-    # Cria ou atualiza conversa
-    conversa, _ = ConversaWhatsApp.objects.get_or_create(
-        whatsapp_config=config,
-        numero_contato=numero_contato,
-        defaults={
-            'nome_contato': nome_contato,
-            'aberta': True
-        }
-    )
+    if not isinstance(payload, (list, dict)):
+        return HttpResponseBadRequest('Payload deve ser uma lista ou objeto JSON')
     
-    # Cria mensagem
-    mensagem = MensagemWhatsApp.objects.create(
-        whatsapp_config=config,
-        numero_contato=numero_contato,
-        nome_contato=nome_contato,
-        tipo=tipo,
-        direcao='entrada',
-        conteudo=conteudo,
-        status='entregue',
-        lida=False,
-        metadata={'webhook_payload': payload}
-    )
+    eventos = extrair_eventos(payload)
+    if len(eventos) > settings.WHATSAPP_WEBHOOK_LOTE_MAXIMO:
+        return HttpResponseBadRequest(
+            f'Lote excede o máximo de {settings.WHATSAPP_WEBHOOK_LOTE_MAXIMO} eventos'
+        )
     
-    # Atualiza estatísticas da conversa
-    conversa.atualizar_estatisticas()
+    try:
+        config = WhatsAppConfig.objects.get(id=config_id, ativo=True)
+    except WhatsAppConfig.DoesNotExist:
+        return HttpResponseBadRequest('Configuração não encontrada ou inativa')
     
-    # TODO: Verificar fluxos de chatbot e responder automaticamente
-    # executar_fluxos_chatbot(conversa, mensagem)
+    resultado = ingerir_lote(config, eventos)
     
-    return mensagem
+    # Sempre 2xx: erros ficam registrados nos eventos e a fila reprocessa
+    return JsonResponse(resultado, status=202 if resultado['status'] == 'queued' else 200)
 
 
 @login_required
@@ -232,7 +242,17 @@ def api_conversas(request, config_id):
 @permission_classes([IsAuthenticated])
 def api_mensagens(request, config_id, numero_contato):
     """
-    API: Lista todas as mensagens de uma conversa específica
+    API: Lista mensagens de uma conversa com paginação por cursor
+    
+    Parâmetros (GET):
+    - limite: tamanho da página (máximo WHATSAPP_MENSAGENS_LIMITE_MAXIMO)
+    - before: id de mensagem; retorna as anteriores a ela (rolar para cima)
+    - after: id de mensagem; retorna as posteriores a ela (novas mensagens)
+    Sem cursor: retorna as mensagens mais recentes.
+    
+    PERFORMANCE: sem COUNT nem OFFSET; cada página é um range scan no índice
+    (whatsapp_config, numero_contato, -criado_em, -id), custo igual em
+    conversas novas ou com milhares de mensagens.
     """
     config = get_object_or_404(WhatsAppConfig, id=config_id)
     
@@ -243,18 +263,59 @@ def api_mensagens(request, config_id, numero_contato):
             status=403
         )
     
-    # Busca mensagens
+    try:
+        limite = int(request.GET.get('limite', 50))
+        antes = request.GET.get('before')
+        depois = request.GET.get('after')
+        antes = int(antes) if antes else None
+        depois = int(depois) if depois else None
+    except ValueError:
+        return Response({'erro': 'limite, before e after devem ser números inteiros'}, status=400)
+    
+    limite = max(1, min(limite, settings.WHATSAPP_MENSAGENS_LIMITE_MAXIMO))
+    
     mensagens = MensagemWhatsApp.objects.filter(
         whatsapp_config=config,
         numero_contato=numero_contato
-    ).order_by('criado_em')
-    
-    # Limita a 100 mensagens mais recentes por padrão
-    limite = int(request.GET.get('limite', 100))
-    mensagens = mensagens[max(0, mensagens.count() - limite):]
+    )
     
-    serializer = MensagemWhatsAppSerializer(mensagens, many=True)
-    return Response(serializer.data)
+    cursor_id = depois or antes
+    if cursor_id:
+        cursor_criado_em = mensagens.filter(pk=cursor_id).values_list('criado_em', flat=True).first()
+        if cursor_criado_em is None:
+            return Response({'erro': 'Mensagem do cursor não encontrada nesta conversa'}, status=400)
+    
+    if depois:
+        # Mais novas que o cursor, em ordem cronológica
+        mensagens = mensagens.filter(
+            Q(criado_em__gt=cursor_criado_em) |
+            Q(criado_em=cursor_criado_em, id__gt=depois)
+        ).order_by('criado_em', 'id')
+    else:
+        # Mais antigas (ou as mais recentes), lidas de trás para frente no índice
+        if antes:
+            mensagens = mensagens.filter(
+                Q(criado_em__lt=cursor_criado_em) |
+                Q(criado_em=cursor_criado_em, id__lt=antes)
+            )
+        mensagens = mensagens.order_by('-criado_em', '-id')
+    
+    # Busca uma a mais para saber se há outra página sem precisar de COUNT
+    pagina = list(mensagens[:limite + 1])
+    tem_mais = len(pagina) > limite
+    pagina = pagina[:limite]
+    
+    if not depois:
+        pagina.reverse()
+    
+    return Response({
+        'mensagens': MensagemWhatsAppResumoSerializer(pagina, many=True).data,
+        # O próprio cursor existe: do lado dele sempre há mensagens
+        'tem_mais_antigas': tem_mais if not depois else True,
+        'tem_mais_novas': tem_mais if depois else bool(antes),
+        'cursor_antes': pagina[0].id if pagina else antes,
+        'cursor_depois': pagina[-1].id if pagina else depois,
+    })
 
 
 @api_view(['POST'])
@@ -283,10 +344,11 @@ def api_enviar_mensagem(request, config_id):
             status=400
         )
     
-    # Cria mensagem
+    # Cria mensagem (a conversa é atualizada incrementalmente no save)
     mensagem = MensagemWhatsApp.objects.create(
         whatsapp_config=config,
         numero_contato=numero_contato,
+        nome_contato=request.data.get('nome_contato', ''),
         conteudo=conteudo,
         tipo=tipo,
         direcao='saida',
@@ -294,21 +356,12 @@ def api_enviar_mensagem(request, config_id):
         usuario_responsavel=request.user
     )
     
-    # TODO: Aqui você implementaria a lógica para enviar via API do WhatsApp
-    # Por enquanto, apenas simula o envio
-    mensagem.status = 'enviado'
-    mensagem.save()
+    # Envio pelo provider em background (core.tasks.enviar_mensagem_whatsapp);
+    # o status avança para enviado/entregue/lido e chega ao painel via WebSocket
+    enfileirar_envio(mensagem)
     
-    # Atualiza ou cria conversa
-    conversa, created = ConversaWhatsApp.objects.get_or_create(
-        whatsapp_config=config,
-        numero_contato=numero_contato,
-        defaults={
-            'nome_contato': request.data.get('nome_contato', ''),
-            'aberta': True
-        }
-    )
-    conversa.atualizar_estatisticas()
+    # Outras abas do painel recebem a mensagem sem polling
+    publicar_mensagens([mensagem])
     
     serializer = MensagemWhatsAppSerializer(mensagem)
     return Response(serializer.data, status=201)
@@ -330,16 +383,9 @@ def api_marcar_lida(request, config_id, mensagem_id):
             status=403
         )
     
-    mensagem.marcar_como_lida()
-    
-    # Atualiza estatísticas da conversa
-    conversa = ConversaWhatsApp.objects.filter(
-        whatsapp_config=config,
-        numero_contato=mensagem.numero_contato
-    ).first()
-    
-    if conversa:
-        conversa.atualizar_estatisticas()
+    # Também decrementa as não lidas da conversa
+    if mensagem.marcar_como_lida():
+        publicar_leitura(config.id, mensagem.numero_contato, [mensagem.id])
     
     return Response({'sucesso': True})
 
@@ -416,6 +462,7 @@ def api_atribuir_conversa(request, config_id, numero_contato):
         conversa.usuario_atribuido = request.user
     
     conversa.save()
+    publicar_atribuicao(conversa)
     
     serializer = ConversaWhatsAppSerializer(conversa)
     return Response(serializer.data)
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# Garante que a aplicação Celery seja carregada junto com o Django
+# para que @shared_task use esta configuração
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
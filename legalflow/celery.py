@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Aplicação Celery do LegalFlow
+
+Lê a configuração do Django (prefixo CELERY_) e descobre automaticamente
+as tasks de cada app (core/tasks.py).
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'legalflow.settings')
+
+app = Celery('legalflow')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party apps
     'rest_framework',
@@ -157,8 +158,111 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'core.tasks.atualizar_processos',
         'schedule': timedelta(hours=12),
     },
+    'limpar-sessoes-chatbot': {
+        'task': 'core.tasks.limpar_sessoes_chatbot',
+        'schedule': timedelta(hours=1),
+    },
+    'atualizar-metricas-escritorios': {
+        'task': 'core.tasks.atualizar_metricas_escritorios',
+        'schedule': timedelta(minutes=5),
+    },
+    'recalcular-metricas-escritorios': {
+        'task': 'core.tasks.recalcular_metricas_escritorios',
+        'schedule': timedelta(days=1),
+    },
+    'materializar-recorrencias': {
+        'task': 'core.tasks.materializar_recorrencias',
+        'schedule': timedelta(days=1),
+    },
+    'marcar-financeiro-vencidos': {
+        'task': 'core.tasks.marcar_financeiro_vencidos',
+        'schedule': timedelta(hours=1),
+    },
 }
 
+# Cache (Redis) - compartilhado entre os processos web e os workers Celery
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_CACHE_URL', default='redis://localhost:6379/1'),
+    }
+}
+
+# WhatsApp - ingestão de webhooks
+# Assíncrono: o webhook só grava o WebhookEvent e os workers Celery processam a fila
+WHATSAPP_WEBHOOK_ASSINCRONO = config('WHATSAPP_WEBHOOK_ASSINCRONO', default=False, cast=bool)
+if WHATSAPP_WEBHOOK_ASSINCRONO:
+    # Só a fila precisa da varredura; no modo síncrono o webhook processa na hora
+    CELERY_BEAT_SCHEDULE['varrer-webhooks-pendentes'] = {
+        'task': 'core.tasks.varrer_webhooks_pendentes',
+        'schedule': timedelta(minutes=1),
+    }
+WHATSAPP_WEBHOOK_LOTE = config('WHATSAPP_WEBHOOK_LOTE', default=100, cast=int)
+WHATSAPP_WEBHOOK_MAX_TENTATIVAS = config('WHATSAPP_WEBHOOK_MAX_TENTATIVAS', default=5, cast=int)
+WHATSAPP_WEBHOOK_LOTE_MAXIMO = config('WHATSAPP_WEBHOOK_LOTE_MAXIMO', default=500, cast=int)
+# Filtro de IDs recentes (evita ir ao banco em retentativas do provider)
+WHATSAPP_WEBHOOK_FILTRO_CAPACIDADE = config('WHATSAPP_WEBHOOK_FILTRO_CAPACIDADE', default=10000, cast=int)
+WHATSAPP_WEBHOOK_FILTRO_TTL = config('WHATSAPP_WEBHOOK_FILTRO_TTL', default=86400, cast=int)
+# Cache em memória de número -> cliente (por escritório)
+WHATSAPP_CACHE_TELEFONES_CAPACIDADE = config('WHATSAPP_CACHE_TELEFONES_CAPACIDADE', default=5000, cast=int)
+WHATSAPP_CACHE_TELEFONES_TTL = config('WHATSAPP_CACHE_TELEFONES_TTL', default=300, cast=int)
+# Tamanho máximo de página do histórico de mensagens do painel
+WHATSAPP_MENSAGENS_LIMITE_MAXIMO = config('WHATSAPP_MENSAGENS_LIMITE_MAXIMO', default=200, cast=int)
+
+# Indicadores do dashboard (context processor) - cache por escritório em segundos
+DASHBOARD_CACHE_TTL = config('DASHBOARD_CACHE_TTL', default=60, cast=int)
+
+# Alertas de prazos (core.tasks.verificar_prazos_vencendo)
+# Maior antecedência considerada (dias) - limita a faixa lida no índice (status, data_limite)
+PRAZOS_ALERTA_JANELA_MAXIMA = config('PRAZOS_ALERTA_JANELA_MAXIMA', default=30, cast=int)
+PRAZOS_ALERTA_LOTE = config('PRAZOS_ALERTA_LOTE', default=2000, cast=int)
+PRAZOS_ALERTA_EMAILS_POR_CONEXAO = config('PRAZOS_ALERTA_EMAILS_POR_CONEXAO', default=100, cast=int)
+
+# Captura de andamentos (core.tasks.atualizar_processos)
+# Fonte: core.services.andamentos.FonteDataJud ou FonteFalsa (local, sem rede)
+ANDAMENTOS_FONTE = config('ANDAMENTOS_FONTE', default='core.services.andamentos.FonteDataJud')
+ANDAMENTOS_CONCORRENCIA = config('ANDAMENTOS_CONCORRENCIA', default=8, cast=int)
+ANDAMENTOS_LOTE = config('ANDAMENTOS_LOTE', default=200, cast=int)
+ANDAMENTOS_TIMEOUT = config('ANDAMENTOS_TIMEOUT', default=20.0, cast=float)
+ANDAMENTOS_FALSA_LATENCIA = config('ANDAMENTOS_FALSA_LATENCIA', default=0.0, cast=float)
+ANDAMENTOS_FALSA_ERROS = config('ANDAMENTOS_FALSA_ERROS', default=0.0, cast=float)
+DATAJUD_API_URL = config('DATAJUD_API_URL', default='https://api-publica.datajud.cnj.jus.br')
+DATAJUD_API_KEY = config('DATAJUD_API_KEY', default='')
+
+# Lançamentos recorrentes (core.tasks.materializar_recorrencias)
+# Ocorrências que vencem até N dias à frente são criadas com antecedência
+FINANCEIRO_RECORRENCIA_HORIZONTE = config('FINANCEIRO_RECORRENCIA_HORIZONTE', default=60, cast=int)
+# Resumo financeiro (FinanceiroViewSet.resumo) - cache por escritório/período em segundos
+FINANCEIRO_RESUMO_CACHE_TTL = config('FINANCEIRO_RESUMO_CACHE_TTL', default=300, cast=int)
+
+# Exportações CSV/XLSX (action 'exportar') - linhas lidas do banco por bloco
+EXPORTACAO_LOTE = config('EXPORTACAO_LOTE', default=2000, cast=int)
+
+# PDF dos contratos de honorários - fontes TTF opcionais (padrão: Helvetica)
+CONTRATO_PDF_FONTE = config('CONTRATO_PDF_FONTE', default='')
+CONTRATO_PDF_FONTE_NEGRITO = config('CONTRATO_PDF_FONTE_NEGRITO', default='')
+
+# Autocomplete de clientes (ClienteViewSet.autocompletar)
+# Máximo de resultados e limiar de similaridade de palavra (pg_trgm, 0 a 1)
+CLIENTE_AUTOCOMPLETE_LIMITE = config('CLIENTE_AUTOCOMPLETE_LIMITE', default=10, cast=int)
+CLIENTE_AUTOCOMPLETE_SIMILARIDADE = config('CLIENTE_AUTOCOMPLETE_SIMILARIDADE', default=0.4, cast=float)
+
+# Chatbot - tempo de vida de uma sessão sem resposta do contato (segundos)
+CHATBOT_SESSAO_TTL = config('CHATBOT_SESSAO_TTL', default=3600, cast=int)
+
+# WhatsApp - envio de mensagens (core.services.whatsapp_envio)
+# Taxa por número de WhatsApp, somados todos os workers (mensagens/segundo)
+WHATSAPP_ENVIO_TAXA = config('WHATSAPP_ENVIO_TAXA', default=1.0, cast=float)
+WHATSAPP_ENVIO_RAJADA = config('WHATSAPP_ENVIO_RAJADA', default=5, cast=int)
+# Redis do token bucket (compartilhado por todos os workers)
+WHATSAPP_ENVIO_REDIS_URL = config('WHATSAPP_ENVIO_REDIS_URL', default=CACHES['default']['LOCATION'])
+WHATSAPP_ENVIO_MAX_TENTATIVAS = config('WHATSAPP_ENVIO_MAX_TENTATIVAS', default=6, cast=int)
+WHATSAPP_ENVIO_POOL_CONEXOES = config('WHATSAPP_ENVIO_POOL_CONEXOES', default=10, cast=int)
+WHATSAPP_ENVIO_TIMEOUT_CONEXAO = config('WHATSAPP_ENVIO_TIMEOUT_CONEXAO', default=3.05, cast=float)
+WHATSAPP_ENVIO_TIMEOUT_RESPOSTA = config('WHATSAPP_ENVIO_TIMEOUT_RESPOSTA', default=15.0, cast=float)
+# Callback de status que chega antes do ID externo ser gravado: guardado por até (segundos)
+WHATSAPP_STATUS_PENDENTE_TTL = config('WHATSAPP_STATUS_PENDENTE_TTL', default=600, cast=int)
+
 # Channels (WebSockets)
 CHANNEL_LAYERS = {
     'default': {